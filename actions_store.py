@@ -0,0 +1,517 @@
+"""
+Armazenamento do log de ações de CS - Dashboard Papello
+
+SQLite em modo WAL: inserções O(1), escrita segura entre workers do gunicorn
+(um escritor por vez, leitores não bloqueiam) e índices por cliente, tipo de
+ação, responsável e data. Na primeira abertura migra o cs_actions_log.json legado.
+"""
+import hashlib
+import heapq
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app_logging import get_logger
+from config import Config
+
+logger = get_logger('actions_store')
+
+# Colunas indexadas/consultáveis; o registro completo fica em 'payload' (JSON)
+INDEXED_FIELDS = [
+    'client_id', 'action_type', 'assigned_to', 'status',
+    'priority', 'priority_score', 'timestamp', 'executed_at', 'due_date'
+]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS actions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    client_id TEXT,
+    action_type TEXT,
+    assigned_to TEXT,
+    status TEXT,
+    priority TEXT,
+    priority_score REAL,
+    timestamp TEXT,
+    executed_at TEXT,
+    due_date TEXT,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_actions_client ON actions (client_id);
+CREATE INDEX IF NOT EXISTS idx_actions_type ON actions (action_type);
+CREATE INDEX IF NOT EXISTS idx_actions_assigned ON actions (assigned_to COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_actions_timestamp ON actions (timestamp);
+CREATE INDEX IF NOT EXISTS idx_actions_status ON actions (status);
+CREATE INDEX IF NOT EXISTS idx_actions_status_score ON actions (status, priority_score DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_actions_score ON actions (priority_score DESC, id DESC);
+CREATE TABLE IF NOT EXISTS client_scores (
+    client_id TEXT PRIMARY KEY,
+    priority_score REAL,
+    nivel_cliente TEXT,
+    nome TEXT,
+    email TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_local = threading.local()
+
+def _db_path() -> str:
+    return Config.ACTIONS_DB_PATH
+
+def get_connection() -> sqlite3.Connection:
+    """Conexão por thread (sqlite3 não compartilha conexões entre threads)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and getattr(_local, 'path', None) == _db_path():
+        return conn
+
+    conn = sqlite3.connect(_db_path(), timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.executescript(_SCHEMA)
+    _local.conn = conn
+    _local.path = _db_path()
+
+    migrate_json_log(Config.ACTIONS_LEGACY_JSON)
+    _migrate_effective_scores(conn)
+    return conn
+
+def discard_connection():
+    """Esquece a conexão desta thread sem fechá-la (após fork, a conexão herdada do processo pai não deve ser usada)"""
+    _local.conn = None
+    _local.path = None
+
+def _to_text(value) -> Optional[str]:
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def _to_float(value) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+def _row_values(action: Dict) -> tuple:
+    # status e priority_score nunca nulos: a listagem percorre o índice (status, priority_score, id)
+    values = [_to_text(action.get(field)) for field in INDEXED_FIELDS]
+    values[INDEXED_FIELDS.index('status')] = values[INDEXED_FIELDS.index('status')] or DEFAULT_STATUS
+    values[INDEXED_FIELDS.index('priority_score')] = _to_float(action.get('priority_score')) or 0.0
+    payload = json.dumps(action, ensure_ascii=False, default=str)
+    return tuple(values) + (payload,)
+
+_INSERT_SQL = "INSERT INTO actions ({}, payload) VALUES ({}, ?)".format(
+    ', '.join(INDEXED_FIELDS), ', '.join('?' for _ in INDEXED_FIELDS)
+)
+_UPDATE_SQL = "UPDATE actions SET {}, payload = ? WHERE id = ?".format(
+    ', '.join(f"{field} = ?" for field in INDEXED_FIELDS)
+)
+
+def _bump_version(conn: sqlite3.Connection):
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES ('version', '1') "
+        "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+    )
+
+# Score efetivo gravado na coluna priority_score: o do cliente no snapshot atual (client_scores);
+# sem o cliente no snapshot, o registrado junto com a ação
+_EFFECTIVE_SCORE_SQL = (
+    "UPDATE actions SET priority_score = "
+    "(SELECT c.priority_score FROM client_scores c WHERE c.client_id = actions.client_id) "
+    "WHERE id = ? AND client_id IN (SELECT client_id FROM client_scores WHERE priority_score IS NOT NULL)"
+)
+
+def append_action(action: Dict) -> int:
+    """Insere uma ação (transação curta, O(1)) e retorna o id gerado"""
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = conn.execute(_INSERT_SQL, _row_values(action))
+        conn.execute(_EFFECTIVE_SCORE_SQL, (cursor.lastrowid,))
+        _bump_version(conn)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return cursor.lastrowid
+
+def update_action(action_id: int, **fields) -> bool:
+    """Atualiza campos de uma ação existente (ex: status='executada')"""
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT payload FROM actions WHERE id = ?", (action_id,)).fetchone()
+        if row is None:
+            conn.execute("ROLLBACK")
+            return False
+        action = json.loads(row['payload'])
+        action.update(fields)
+        conn.execute(_UPDATE_SQL, _row_values(action) + (action_id,))
+        conn.execute(_EFFECTIVE_SCORE_SQL, (action_id,))
+        _bump_version(conn)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return True
+
+def _row_to_action(row: sqlite3.Row) -> Dict:
+    action = json.loads(row['payload'])
+    action['id'] = row['id']
+    return action
+
+def query_actions(client_id: Optional[str] = None, action_type: Optional[str] = None,
+                  assigned_to: Optional[str] = None, since: Optional[str] = None,
+                  until: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+    """Consulta ações usando os índices (filtros combinados com AND, mais recentes primeiro)"""
+    clauses, params = [], []
+    for column, value in (('client_id', client_id), ('action_type', action_type), ('assigned_to', assigned_to)):
+        if value is not None:
+            collate = " COLLATE NOCASE" if column == 'assigned_to' else ""
+            clauses.append(f"{column} = ?{collate}")
+            params.append(str(value))
+    if since is not None:
+        clauses.append("timestamp >= ?")
+        params.append(_to_text(since))
+    if until is not None:
+        clauses.append("timestamp <= ?")
+        params.append(_to_text(until))
+
+    sql = "SELECT id, payload FROM actions"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY timestamp DESC, id DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+
+    return [_row_to_action(row) for row in get_connection().execute(sql, params)]
+
+def load_all_actions() -> List[Dict]:
+    """Todas as ações em ordem de inserção (formato do antigo cs_actions_log.json)"""
+    rows = get_connection().execute("SELECT id, payload FROM actions ORDER BY id")
+    return [_row_to_action(row) for row in rows]
+
+def get_store_version() -> int:
+    """Contador incrementado a cada escrita (chave para caches derivados)"""
+    row = get_connection().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+    return int(row['value']) if row else 0
+
+def migrate_json_log(json_path: str) -> int:
+    """Importa uma única vez o log JSON legado para o SQLite. Retorna o número de ações migradas."""
+    conn = _local.conn
+    if not json_path or not os.path.exists(json_path):
+        return 0
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_json'").fetchone():
+            conn.execute("ROLLBACK")
+            return 0
+        with open(json_path, 'r', encoding='utf-8') as f:
+            actions = json.load(f)
+        conn.executemany(_INSERT_SQL, [_row_values(action) for action in actions])
+        conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_json', ?)", (datetime.now().isoformat(),))
+        _bump_version(conn)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        logger.exception("Erro ao migrar ações", extra={'arquivo': json_path})
+        return 0
+
+    logger.info("Ações migradas", extra={'total': len(actions), 'arquivo': json_path, 'db': _db_path()})
+    return len(actions)
+
+def _migrate_effective_scores(conn: sqlite3.Connection):
+    """Uma vez por banco: status nulo vira 'pendente' e priority_score passa a guardar o score efetivo"""
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'effective_scores'").fetchone():
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'effective_scores'").fetchone():
+            conn.execute("ROLLBACK")
+            return
+        conn.execute("UPDATE actions SET status = ? WHERE status IS NULL OR status = ''", (DEFAULT_STATUS,))
+        conn.execute(
+            "UPDATE actions SET priority_score = COALESCE("
+            "(SELECT c.priority_score FROM client_scores c WHERE c.client_id = actions.client_id), priority_score, 0)"
+        )
+        conn.execute("INSERT INTO meta (key, value) VALUES ('effective_scores', ?)", (datetime.now().isoformat(),))
+        _bump_version(conn)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+# === SCORES DOS CLIENTES E LISTAGEM PAGINADA ===
+
+SUGGESTED_STATUS = 'sugerida'
+DEFAULT_STATUS = 'pendente'
+
+# Campos que mudam a cada geração sem mudar a sugestão: ficam fora do fingerprint e,
+# numa sugestão que continua valendo, são mantidos os da primeira geração
+_SUGGESTION_VOLATILE_FIELDS = ('timestamp', 'due_date')
+
+def suggestions_fingerprint(suggestions: List[Dict]) -> str:
+    """Hash do conteúdo da fila de sugestões (sem datas de geração)"""
+    conteudo = [{k: v for k, v in suggestion.items() if k not in _SUGGESTION_VOLATILE_FIELDS}
+                for suggestion in suggestions]
+    texto = json.dumps(conteudo, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+def sync_suggestions(suggestions: List[Dict]) -> Optional[Dict]:
+    """
+    Sincroniza a fila de sugestões (ações com status 'sugerida') com a gerada agora, por
+    (client_id, rule): sugestões que continuam valendo mantêm o id (páginas já carregadas,
+    cursores e /api/actions/<id>/execute seguem funcionando) e são atualizadas no lugar se
+    mudaram, as novas são inseridas e só as que deixaram de valer são removidas. Se o
+    conteúdo não mudou (fingerprint), nada é escrito. Sugestões executadas viram ações
+    normais e não são tocadas. Retorna as contagens, ou None se não houve mudança.
+    """
+    fingerprint = suggestions_fingerprint(suggestions)
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        atual = conn.execute("SELECT value FROM meta WHERE key = 'suggestions_fingerprint'").fetchone()
+        if atual is not None and atual['value'] == fingerprint:
+            conn.execute("ROLLBACK")
+            return None
+
+        existentes, remover = {}, []
+        for row in conn.execute("SELECT id, payload FROM actions WHERE status = ?", (SUGGESTED_STATUS,)):
+            action = json.loads(row['payload'])
+            chave = (action.get('client_id'), action.get('rule'))
+            if chave in existentes:
+                remover.append(row['id'])
+            else:
+                existentes[chave] = (row['id'], action)
+
+        inserir, atualizar = [], []
+        for suggestion in suggestions:
+            action = dict(suggestion, status=SUGGESTED_STATUS)
+            existente = existentes.pop((action.get('client_id'), action.get('rule')), None)
+            if existente is None:
+                inserir.append(_row_values(action))
+                continue
+            action_id, anterior = existente
+            for campo in _SUGGESTION_VOLATILE_FIELDS:
+                if anterior.get(campo) is not None:
+                    action[campo] = anterior[campo]
+            if action != anterior:
+                atualizar.append(_row_values(action) + (action_id,))
+        remover.extend(action_id for action_id, _ in existentes.values())
+
+        conn.executemany(_INSERT_SQL, inserir)
+        conn.executemany(_UPDATE_SQL, atualizar)
+        conn.executemany("DELETE FROM actions WHERE id = ?", [(action_id,) for action_id in remover])
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('suggestions_fingerprint', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (fingerprint,)
+        )
+        if inserir or atualizar or remover:
+            _bump_version(conn)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return {'inseridas': len(inserir), 'atualizadas': len(atualizar), 'removidas': len(remover)}
+
+def recent_action_client_ids(since: str) -> List[str]:
+    """Clientes com ações registradas (não sugeridas) desde 'since' (usa o índice de data)"""
+    rows = get_connection().execute(
+        "SELECT DISTINCT client_id FROM actions WHERE timestamp >= ? AND client_id IS NOT NULL "
+        "AND COALESCE(status, '') != ?", (_to_text(since), SUGGESTED_STATUS)
+    )
+    return [row['client_id'] for row in rows]
+
+# A coluna priority_score já guarda o score efetivo (mantido por sync_client_scores)
+SCORE_EXPR = "a.priority_score"
+
+def sync_client_scores(rows: List[tuple]) -> Optional[Dict]:
+    """
+    Sincroniza client_scores com (client_id, priority_score, nivel_cliente, nome, email) do
+    snapshot atual e mantém o score efetivo nas ações: só clientes alterados são regravados e
+    só as ações deles recebem o novo score (índice por cliente). Clientes que saíram do
+    snapshot voltam ao score registrado na ação. Se nada mudou (fingerprint), nada é escrito.
+    Retorna as contagens, ou None se não houve mudança.
+    """
+    novos = {str(row[0]): tuple(row) for row in rows}
+    fingerprint = hashlib.sha1(
+        json.dumps(sorted(novos.values()), ensure_ascii=False, default=str).encode('utf-8')
+    ).hexdigest()
+
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        atual = conn.execute("SELECT value FROM meta WHERE key = 'client_scores_fingerprint'").fetchone()
+        if atual is not None and atual['value'] == fingerprint:
+            conn.execute("ROLLBACK")
+            return None
+
+        atuais = {row[0]: tuple(row) for row in conn.execute(
+            "SELECT client_id, priority_score, nivel_cliente, nome, email FROM client_scores"
+        )}
+        alterados = [row for client_id, row in novos.items() if atuais.get(client_id) != row]
+        score_alterado = [(row[1], client_id) for client_id, row in novos.items()
+                          if client_id not in atuais or atuais[client_id][1] != row[1]]
+        removidos = [(client_id,) for client_id in atuais if client_id not in novos]
+
+        conn.executemany("INSERT OR REPLACE INTO client_scores VALUES (?, ?, ?, ?, ?)", alterados)
+        conn.executemany("DELETE FROM client_scores WHERE client_id = ?", removidos)
+        conn.executemany("UPDATE actions SET priority_score = COALESCE(?, priority_score) WHERE client_id = ?",
+                         score_alterado)
+        conn.executemany(
+            "UPDATE actions SET priority_score = COALESCE(CAST(json_extract(payload, '$.priority_score') AS REAL), 0) "
+            "WHERE client_id = ?", removidos
+        )
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('client_scores_fingerprint', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (fingerprint,)
+        )
+        if alterados or removidos:
+            _bump_version(conn)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return {'clientes_alterados': len(alterados), 'scores_alterados': len(score_alterado), 'removidos': len(removidos)}
+
+def _page_statuses(filters: Dict) -> Optional[List[str]]:
+    """Status da listagem (None = todos); cada um é percorrido no índice (status, priority_score, id)"""
+    status = filters.get('status', 'aberta')
+    if status == 'aberta':
+        return [DEFAULT_STATUS, SUGGESTED_STATUS]
+    if status and status != 'all':
+        return [status]
+    return None
+
+def _page_filters(filters: Dict) -> tuple:
+    """Monta as cláusulas WHERE da listagem (exceto status) a partir dos filtros da central de ações"""
+    clauses, params = [], []
+    # Mesmas faixas de data_utils.priority_label (badges e filtros não divergem)
+    priority = filters.get('priority')
+    if priority == 'alta':
+        clauses.append(f"{SCORE_EXPR} >= ?")
+        params.append(Config.CRITICAL_SCORE_THRESHOLD)
+    elif priority == 'media':
+        clauses.append(f"{SCORE_EXPR} >= ? AND {SCORE_EXPR} < ?")
+        params.extend([Config.MEDIUM_SCORE_THRESHOLD, Config.CRITICAL_SCORE_THRESHOLD])
+    elif priority == 'baixa':
+        clauses.append(f"{SCORE_EXPR} < ?")
+        params.append(Config.MEDIUM_SCORE_THRESHOLD)
+
+    if filters.get('assigned_to'):
+        clauses.append("a.assigned_to = ? COLLATE NOCASE")
+        params.append(filters['assigned_to'])
+    if filters.get('action_type'):
+        clauses.append("a.action_type = ?")
+        params.append(filters['action_type'])
+    if filters.get('client_level'):
+        clauses.append("c.nivel_cliente = ? COLLATE NOCASE")
+        params.append(filters['client_level'])
+    if filters.get('premium_only'):
+        clauses.append("c.nivel_cliente IN ('Premium', 'Gold')")
+    if filters.get('overdue'):
+        clauses.append("a.due_date IS NOT NULL AND a.due_date < ?")
+        params.append(datetime.now().isoformat())
+
+    return clauses, params
+
+# Estatísticas da listagem por (filtros, versão do armazenamento, dia): a contagem completa
+# só roda de novo quando alguma ação ou score muda
+_STATS_CACHE_MAX = 64
+_stats_cache: 'OrderedDict[tuple, Dict]' = OrderedDict()
+_stats_lock = threading.Lock()
+
+def _page_stats(conn: sqlite3.Connection, filters: Dict) -> Dict:
+    agora = datetime.now()
+    chave = (
+        tuple(sorted((key, str(value)) for key, value in filters.items())),
+        get_store_version(),
+        agora.strftime('%Y-%m-%dT%H:%M') if filters.get('overdue') else agora.date().isoformat()
+    )
+    with _stats_lock:
+        if chave in _stats_cache:
+            _stats_cache.move_to_end(chave)
+            return _stats_cache[chave]
+
+    clauses, params = _page_filters(filters)
+    statuses = _page_statuses(filters)
+    if statuses is not None:
+        clauses.insert(0, f"a.status IN ({', '.join('?' for _ in statuses)})")
+        params = statuses + params
+    where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+    row = conn.execute(
+        f"SELECT COUNT(*) AS total, SUM(CASE WHEN {SCORE_EXPR} >= ? THEN 1 ELSE 0 END) AS alta "
+        f"FROM actions a LEFT JOIN client_scores c ON c.client_id = a.client_id{where}",
+        [Config.CRITICAL_SCORE_THRESHOLD] + params
+    ).fetchone()
+    hoje = agora.replace(hour=0, minute=0, second=0, microsecond=0).isoformat()
+    executadas_hoje = conn.execute(
+        "SELECT COUNT(*) FROM actions WHERE status = 'executada' AND executed_at >= ?", (hoje,)
+    ).fetchone()[0]
+
+    stats = {'total': row['total'], 'high_priority': row['alta'] or 0, 'executed_today': executadas_hoje}
+    with _stats_lock:
+        _stats_cache[chave] = stats
+        while len(_stats_cache) > _STATS_CACHE_MAX:
+            _stats_cache.popitem(last=False)
+    return stats
+
+def query_actions_page(filters: Dict, cursor: Optional[tuple] = None, limit: int = 20) -> Dict:
+    """
+    Página de ações ordenada por score (desc) e id (desc) com paginação por cursor
+    (keyset). Cada status é lido em ordem direto do índice (status, priority_score, id)
+    a partir do cursor, com no máximo limit + 1 linhas, e as listas são intercaladas:
+    o custo por página é O(limit) mais as linhas descartadas pelos demais filtros,
+    independente da profundidade. As estatísticas vêm de _page_stats (em cache).
+    """
+    conn = get_connection()
+    clauses, params = _page_filters(filters)
+    if cursor is not None:
+        clauses.append("(a.priority_score, a.id) < (?, ?)")
+        params.extend([float(cursor[0]), int(cursor[1])])
+
+    base = ("SELECT a.id, a.payload, a.priority_score AS score, c.nivel_cliente, c.nome, c.email "
+            "FROM actions a LEFT JOIN client_scores c ON c.client_id = a.client_id")
+    ordem = " ORDER BY a.priority_score DESC, a.id DESC LIMIT ?"
+    statuses = _page_statuses(filters)
+
+    listas = []
+    for status in (statuses if statuses is not None else [None]):
+        status_clauses = (["a.status = ?"] if status is not None else []) + clauses
+        status_params = ([status] if status is not None else []) + params
+        where = (" WHERE " + " AND ".join(status_clauses)) if status_clauses else ""
+        listas.append(conn.execute(f"{base}{where}{ordem}", status_params + [int(limit) + 1]).fetchall())
+    rows = list(heapq.merge(*listas, key=lambda row: (-row['score'], -row['id'])))[:int(limit) + 1]
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    actions = []
+    for row in rows:
+        action = _row_to_action(row)
+        action['priority_score'] = row['score']
+        action['client_level'] = row['nivel_cliente'] or action.get('client_level')
+        action['client_name'] = row['nome'] or action.get('client_name')
+        action['client_email'] = row['email'] or action.get('client_email')
+        actions.append(action)
+
+    stats = _page_stats(conn, filters)
+    return {
+        'actions': actions,
+        'next_cursor': (rows[-1]['score'], rows[-1]['id']) if has_more else None,
+        'total': stats['total'],
+        'high_priority': stats['high_priority'],
+        'executed_today': stats['executed_today']
+    }
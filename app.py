@@ -1,22 +1,157 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, g, Response
+from flask.json.provider import DefaultJSONProvider
 from datetime import datetime, timedelta
+import io
 import json
+import logging
+import os
+import time
+from typing import Dict, Tuple
+import numpy as np
 import pandas as pd
 from config import Config
+import actions_store
+import live_updates
+import metrics
+import profiling
+from app_logging import get_logger
 from data_utils import (
     get_executive_summary_data, 
-    load_google_sheet_public,
     load_satisfaction_data,
-    calculate_priority_score,
-    analyze_client_recurrence_corrected,
+    get_clients_snapshot,
+    combine_segments,
+    get_client_360,
+    simulate_scoring,
+    build_scoring_frame,
+    compute_priority_scores,
+    compute_analytics,
+    client_churn_risk,
+    get_rfm_summary,
+    compare_metrics,
+    COMPARISON_METRICS,
+    COMPARISON_MODES,
+    CLIENT_LEVELS,
+    compute_recurrence_metrics,
+    default_recurrence_window,
+    compute_critical_analysis,
+    SATISFACTION_CLIENT_SEGMENTS,
+    get_snapshot_status,
+    repurchase_latency_distribution,
+    list_actions_page,
+    parse_actions_cursor,
     clear_cache,
+    get_cache_stats,
+    begin_dataset_scope,
+    end_dataset_scope,
+    current_dataset,
+    batch_memo,
+    start_refresh_job,
+    get_refresh_job,
+    list_refresh_jobs,
+    format_executive_kpis,
     format_number,
     format_phone_number
 )
 
+class TimedJSONProvider(DefaultJSONProvider):
+    """
+    Serialização JSON do jsonify medida como a etapa 'json_serialization'. Respostas em
+    objeto de requisições que usaram dados recebem 'dataset_version'.
+    """
+    
+    def response(self, *args, **kwargs):
+        dataset = current_dataset(load=False)
+        if dataset is not None and len(args) == 1 and isinstance(args[0], dict):
+            args[0].setdefault('dataset_version', dataset['version'])
+        with metrics.stage('json_serialization'):
+            return super().response(*args, **kwargs)
+
+logger = get_logger('app')
+
 # Inicializar Flask
 app = Flask(__name__)
 app.config.from_object(Config)
+app.json = TimedJSONProvider(app)
+
+# === MÉTRICAS POR REQUISIÇÃO ===
+
+@app.before_request
+def start_request_timer():
+    if metrics.enabled():
+        g.request_start = time.perf_counter()
+
+# === DATASET FIXADO POR REQUISIÇÃO (uma versão de clientes/pedidos/pesquisa do início ao fim) ===
+
+@app.before_request
+def pin_request_dataset():
+    begin_dataset_scope()
+
+@app.after_request
+def add_dataset_version_header(response):
+    dataset = current_dataset(load=False)
+    if dataset is not None:
+        response.headers['X-Dataset-Version'] = str(dataset['version'])
+    return response
+
+@app.teardown_request
+def release_request_dataset(exc):
+    end_dataset_scope()
+
+@app.after_request
+def record_request_duration(response):
+    inicio = g.pop('request_start', None)
+    if inicio is not None:
+        metrics.observe_request(request.endpoint or 'desconhecido', time.perf_counter() - inicio)
+    return response
+
+# === PROFILING SOB DEMANDA (?_profile=1 e requisições lentas amostradas) ===
+
+@app.before_request
+def start_request_profile():
+    if not profiling.enabled() or not request.path.startswith('/api/'):
+        return None
+    explicit = request.args.get('_profile') == '1'
+    if explicit and not profiling.authorized(request.headers.get('X-Profile-Token')):
+        return jsonify({'error': 'Profiling não autorizado', 'status': 'error'}), 403
+    if not explicit and not profiling.should_sample():
+        return None
+    
+    profiler = profiling.start()
+    if profiler is None:
+        if explicit:
+            return jsonify({'error': 'Outra requisição está sendo perfilada, tente novamente', 'status': 'error'}), 409
+        return None
+    g.request_profile = profiling.RequestProfile(profiler, explicit)
+    return None
+
+@app.after_request
+def finish_request_profile(response):
+    perfil = g.pop('request_profile', None)
+    if perfil is None:
+        return response
+    
+    segundos = perfil.finish()
+    if not perfil.explicit and segundos < Config.PROFILING_SLOW_SECONDS:
+        return response
+    
+    endpoint = request.endpoint or 'desconhecido'
+    report = profiling.build_report(perfil.profiler, request.method, request.full_path, segundos, response.status_code)
+    report['saved_to'] = profiling.save_profile(perfil.profiler, report, endpoint)
+    if not perfil.explicit:
+        logger.warning("Requisição lenta perfilada", extra={
+            'endpoint': endpoint, 'segundos': round(segundos, 3), 'perfil': report['saved_to']
+        })
+        return response
+    
+    report['status'] = 'success'
+    return jsonify(report)
+
+@app.teardown_request
+def release_request_profile(exc):
+    # Erro antes do after_request: libera o profiler do processo
+    perfil = g.pop('request_profile', None)
+    if perfil is not None:
+        perfil.finish()
 
 # === ROTAS PRINCIPAIS ===
 
@@ -48,77 +183,83 @@ def actions_center():
 
 
 
-@app.route('/api/analytics-data')
-def api_analytics_data():
+def analytics_data_widget(args) -> Tuple[Dict, int]:
     """API para dados de analytics"""
     try:
-        period = request.args.get('period', '90')
-        comparison = request.args.get('comparison', 'previous')
-        segment = request.args.get('segment', 'all')
+        period = args.get('period', '90')
+        comparison = args.get('comparison', 'previous')
+        segment = args.get('segment', 'all')
         
-        # Por enquanto, dados simulados de analytics
-        data = {
-            'period': period,
-            'comparison': comparison,
-            'segment': segment,
-            'team_performance': {
-                'actions_executed': 127,
-                'actions_pending': 43,
-                'execution_rate': 74.7,
-                'avg_response_time': 4.2
-            },
-            'financial_analysis': {
-                'total_revenue': 2850000,
-                'revenue_at_risk': 456000,
-                'churn_prediction': 12.4
-            },
-            'status': 'success'
-        }
+        if comparison not in COMPARISON_MODES:
+            return {
+                'error': f'Comparação inválida: {comparison}',
+                'available_comparisons': COMPARISON_MODES,
+                'status': 'error'
+            }, 400
+        
+        try:
+            period_days = int(period)
+            if period_days <= 0:
+                raise ValueError(period)
+            data = compute_analytics(period_days, comparison, segment)
+        except ValueError as e:
+            return {'error': f'Parâmetro inválido: {str(e)}', 'status': 'error'}, 400
         
-        return jsonify(data)
+        if data is None:
+            return {'error': 'Dados de clientes não disponíveis', 'status': 'error'}, 500
+        
+        data = dict(data, status='success')
+        
+        return data, 200
         
     except Exception as e:
-        return jsonify({'error': f'Erro ao carregar analytics: {str(e)}', 'status': 'error'}), 500
-@app.route('/api/recurrence-analysis')
-def api_recurrence_analysis():
+        return {'error': f'Erro ao carregar analytics: {str(e)}', 'status': 'error'}, 500
+
+@app.route('/api/analytics-data')
+def api_analytics_data():
+    body, status = analytics_data_widget(request.args)
+    return jsonify(body), status
+
+def recurrence_analysis_widget(args) -> Tuple[Dict, int]:
     """API específica para dados de recorrência com filtro de data - VERSÃO CORRIGIDA"""
     try:
         # Obter parâmetros de data
-        data_inicio_str = request.args.get('start')
-        data_fim_str = request.args.get('end')
+        data_inicio_str = args.get('start')
+        data_fim_str = args.get('end')
 
         # Conversão das datas
         if data_inicio_str and data_fim_str:
             data_inicio = datetime.strptime(data_inicio_str, '%Y-%m-%d')
             data_fim = datetime.strptime(data_fim_str, '%Y-%m-%d')
         else:
-            data_fim = datetime.now()
-            data_inicio = data_fim - timedelta(days=180)
+            data_inicio, data_fim = default_recurrence_window()
 
-        print(f"📅 Analisando recorrência: {data_inicio.strftime('%d/%m/%Y')} até {data_fim.strftime('%d/%m/%Y')}")
+        # Segmento opcional por nível do cliente (?segment=Premium|Gold|Silver|Bronze)
+        segment = args.get('segment') or None
+        if segment is not None and segment not in CLIENT_LEVELS:
+            return {
+                'error': f'Segmento inválido: {segment}',
+                'available_segments': CLIENT_LEVELS,
+                'status': 'error'
+            }, 400
 
-        # Carregar dados
-        df_pedidos = load_google_sheet_public(Config.CLASSIFICACAO_SHEET_ID, "pedidos_com_id2")
+        logger.debug("Analisando recorrência", extra={
+            'inicio': data_inicio.strftime('%Y-%m-%d'), 'fim': data_fim.strftime('%Y-%m-%d'), 'segment': segment
+        })
 
-        if df_pedidos.empty:
-            print("❌ Dados de pedidos não disponíveis")
-            return jsonify({'error': 'Dados de pedidos não disponíveis'}), 500
+        # Métricas a partir do snapshot de pedidos (fatia da ordem por data do segmento)
+        recurrence_data = compute_recurrence_metrics(
+            data_inicio, data_fim, args.get('comparison', 'previous'), segment
+        )
 
-        # Analisar recorrência com a função corrigida
-        recurrence_data = analyze_client_recurrence_corrected(df_pedidos, data_inicio, data_fim)
+        if recurrence_data is None:
+            logger.warning("Dados de pedidos não disponíveis para recorrência")
+            return {'error': 'Dados de pedidos não disponíveis'}, 500
 
-        if not recurrence_data:
-            print("❌ Nenhum dado de recorrência encontrado")
-            return jsonify({'error': 'Nenhum dado de recorrência encontrado para o período'}), 404
+        resultado = recurrence_data['metrics']
 
         # Calcular período em dias
         periodo_dias = (data_fim - data_inicio).days
-        
-        # Configurar cores para os gráficos
-        colors_config = {
-            'warning': Config.COLORS.get('warning', '#f59e0b'),
-            'success': Config.COLORS.get('success', '#10b981')
-        }
 
         # Formatar resposta completa
         formatted_data = {
@@ -127,97 +268,93 @@ def api_recurrence_analysis():
                 'fim': data_fim.strftime('%d/%m/%Y'),
                 'dias': periodo_dias
             },
-            'metrics': {
-                'pedidos_primeira': recurrence_data.get('pedidos_primeira', 0),
-                'pedidos_recompra': recurrence_data.get('pedidos_recompra', 0), 
-                'taxa_conversao': recurrence_data.get('taxa_conversao', 0.0),
-                'ticket_primeira': recurrence_data.get('ticket_primeira', 0.0),
-                'ticket_recompra': recurrence_data.get('ticket_recompra', 0.0),
-                'clientes_unicos': recurrence_data.get('clientes_unicos', 0),
-                'total_pedidos': recurrence_data.get('total_pedidos', 0)
-            },
+            'segment': segment,
+            'metrics': resultado,
             'charts': {
                 'pie_recurrence': {
-                    'Primeira Compra': recurrence_data.get('pedidos_primeira', 0),
-                    'Recompra': recurrence_data.get('pedidos_recompra', 0)
+                    'Primeira Compra': resultado['pedidos_primeira'],
+                    'Recompra': resultado['pedidos_recompra']
                 },
                 'bar_tickets': {
-                    'Primeira Compra': recurrence_data.get('ticket_primeira', 0),
-                    'Recompra': recurrence_data.get('ticket_recompra', 0)
+                    'Primeira Compra': resultado['ticket_primeira'],
+                    'Recompra': resultado['ticket_recompra']
                 }
             },
+            'comparison': recurrence_data['comparison'],
             'status': 'success'
         }
 
-        print(f"✅ Recorrência calculada: {formatted_data['metrics']['pedidos_primeira']} novos, {formatted_data['metrics']['pedidos_recompra']} recompras")
-        return jsonify(formatted_data)
+        logger.debug("Recorrência calculada", extra={
+            'pedidos_primeira': resultado['pedidos_primeira'], 'pedidos_recompra': resultado['pedidos_recompra']
+        })
+        return formatted_data, 200
 
     except Exception as e:
-        print(f"❌ Erro em /api/recurrence-analysis: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({
+        logger.exception("Erro em /api/recurrence-analysis")
+        return {
             'error': f'Erro ao analisar recorrência: {str(e)}',
             'status': 'error'
-        }), 500
+        }, 500
+
+@app.route('/api/recurrence-analysis')
+def api_recurrence_analysis():
+    body, status = recurrence_analysis_widget(request.args)
+    return jsonify(body), status
 
 # 2. ADICIONAR ROTA PARA DADOS CRÍTICOS
-@app.route('/api/critical-analysis')
-def api_critical_analysis():
-    """API para análises críticas estratégicas"""
+def critical_analysis_widget(args) -> Tuple[Dict, int]:
+    """API para análises críticas estratégicas (opcionalmente por nível: ?segment=Premium|Gold|Silver|Bronze)"""
     try:
-        df_clientes = load_google_sheet_public(Config.CLASSIFICACAO_SHEET_ID, "classificacao_clientes3")
+        segment = args.get('segment') or None
+        if segment is not None and segment not in CLIENT_LEVELS:
+            return {
+                'error': f'Segmento inválido: {segment}',
+                'available_segments': CLIENT_LEVELS,
+                'status': 'error'
+            }, 400
         
-        if df_clientes.empty:
-            return jsonify({'error': 'Dados de clientes não disponíveis'}), 500
+        # Filtro opcional pela categoria NPS mais recente do cliente (?nps=detratores)
+        nps = args.get('nps') or None
+        if nps is not None and nps not in SATISFACTION_CLIENT_SEGMENTS:
+            return {
+                'error': f'Categoria NPS inválida: {nps}',
+                'available_nps': sorted(SATISFACTION_CLIENT_SEGMENTS),
+                'status': 'error'
+            }, 400
         
-        # Processar dados
-        df_clientes = df_clientes.copy()
-        df_clientes['priority_score'] = df_clientes.apply(calculate_priority_score, axis=1)
-        df_clientes['receita_num'] = pd.to_numeric(df_clientes['receita'].str.replace(',', '.'), errors='coerce').fillna(0)
+        # Segmentos já materializados no snapshot (sem reprocessar colunas de texto)
+        critical = compute_critical_analysis(segment, nps)
         
-        # Análise de Premium em risco
-        premium_em_risco = df_clientes[
-            (df_clientes['nivel_cliente'].isin(['Premium', 'Gold'])) &
-            (df_clientes['risco_recencia'].isin(['Alto', 'Novo_Alto', 'Médio', 'Novo_Médio']))
-        ]
+        if critical is None:
+            return {'error': 'Dados de clientes não disponíveis'}, 500
         
-        total_premium = len(df_clientes[df_clientes['nivel_cliente'].isin(['Premium', 'Gold'])])
-        receita_em_risco = premium_em_risco['receita_num'].sum()
+        taxa_inativos = critical['taxa_inativos']
+        taxa_dormant = critical['taxa_dormant']
+        em_risco = critical['em_risco']
         
         # Métricas em declínio
-        taxa_inativos = len(df_clientes[df_clientes['status_churn'] == 'Inativo']) / len(df_clientes) * 100
-        taxa_dormant = len(df_clientes[df_clientes['status_churn'].str.contains('Dormant', na=False)]) / len(df_clientes) * 100
-        
         issues = []
         if taxa_inativos > 25:
             issues.append(f"Taxa de inativos alta ({taxa_inativos:.1f}%)")
         if taxa_dormant > 20:
             issues.append(f"Muitos clientes Dormant ({taxa_dormant:.1f}%)")
         
-        # Top 3 clientes mais críticos  
-        top_criticos = premium_em_risco.nlargest(3, 'priority_score') if len(premium_em_risco) > 0 else pd.DataFrame()
-        top_criticos_list = []
-        for _, cliente in top_criticos.iterrows():
-            top_criticos_list.append({
-                'nome': cliente.get('nome', 'N/A'),
-                'nivel': cliente.get('nivel_cliente', 'N/A'), 
-                'score': float(cliente.get('priority_score', 0)),
-                'receita': float(cliente.get('receita_num', 0))
-            })
-        
+        publico = f"clientes {segment}" if segment else "clientes premium"
         analysis = {
+            'segment': segment,
+            'nps': nps,
+            'detratores_em_risco': critical['detratores_em_risco'],
             'premium_risk': {
-                'count': len(premium_em_risco),
-                'total_premium': total_premium,
-                'receita_em_risco': float(receita_em_risco),
-                'top_criticos': top_criticos_list
+                'count': em_risco,
+                'total_premium': critical['total_premium'],
+                'receita_em_risco': critical['receita_em_risco'],
+                'top_criticos': critical['top_criticos']
             },
             'metrics_issues': issues,
             'recommendations': [
                 'Campanha de reativação de clientes inativos' if taxa_inativos > 25 else None,
                 'Programa de incentivos para clientes Dormant' if taxa_dormant > 20 else None,
-                f'Contato direto com {len(premium_em_risco)} clientes premium em risco' if len(premium_em_risco) > 0 else None
+                f'Contato direto com {em_risco} {publico} em risco' if em_risco > 0 else None
             ],
             'status': 'success'
         }
@@ -225,64 +362,41 @@ def api_critical_analysis():
         # Remover recomendações None
         analysis['recommendations'] = [r for r in analysis['recommendations'] if r is not None]
         
-        return jsonify(analysis)
+        return analysis, 200
         
     except Exception as e:
-        print(f"❌ Erro em critical analysis: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        logger.exception("Erro em /api/critical-analysis")
+        return {'error': str(e)}, 500
 
-@app.route('/api/executive-data')  
-def api_executive_data_improved():
+@app.route('/api/critical-analysis')
+def api_critical_analysis():
+    body, status = critical_analysis_widget(request.args)
+    return jsonify(body), status
+
+def executive_data_widget(args) -> Tuple[Dict, int]:
     """API executiva melhorada com debug detalhado"""
     try:
-        print("🔄 [API] Processando /api/executive-data melhorada...")
-        
         # Carregar dados usando a função melhorada
         data = get_executive_summary_data()
         
         if 'error' in data:
-            print(f"❌ [API] Erro nos dados: {data['error']}")
-            return jsonify({
+            logger.error("Erro nos dados executivos", extra={'error': data['error']})
+            return {
                 'error': data['error'],
                 'status': 'error',
                 'timestamp': datetime.now().isoformat()
-            }), 500
+            }, 500
         
-        # Debug das distribuições
+        # Debug das distribuições (evento amostrado; o resumo só é montado se DEBUG estiver ativo)
         distributions = data.get('distributions', {})
-        print(f"📊 [DEBUG] Distribuições encontradas:")
-        for key, dist in distributions.items():
-            if dist:
-                print(f"   - {key}: {len(dist)} categorias, total: {sum(dist.values()) if isinstance(dist, dict) else 'N/A'}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Distribuições encontradas", extra={
+                'categorias': {key: len(dist) for key, dist in distributions.items() if dist}
+            })
         
         # Formatar dados para o frontend
         formatted_response = {
-            'kpis': {
-                'total_clientes': {
-                    'value': f"{data['kpis']['total_clientes']:,}".replace(',', '.'),
-                    'raw': data['kpis']['total_clientes'],
-                    'subtitle': 'Base de clientes total',
-                    'color_class': 'info'
-                },
-                'taxa_retencao': {
-                    'value': f"{data['kpis']['taxa_retencao']:.1f}%",
-                    'raw': data['kpis']['taxa_retencao'],
-                    'subtitle': f"{data['kpis']['clientes_ativos']:,} clientes ativos".replace(',', '.'),
-                    'color_class': 'success' if data['kpis']['taxa_retencao'] >= 70 else 'warning' if data['kpis']['taxa_retencao'] >= 50 else 'danger'
-                },
-                'taxa_criticos': {
-                    'value': f"{data['kpis']['taxa_criticos']:.1f}%", 
-                    'raw': data['kpis']['taxa_criticos'],
-                    'subtitle': f"{data['kpis']['clientes_criticos']:,} precisam atenção".replace(',', '.'),
-                    'color_class': 'danger' if data['kpis']['taxa_criticos'] >= 20 else 'warning' if data['kpis']['taxa_criticos'] >= 10 else 'success'
-                },
-                'receita_total': {
-                    'value': f"R$ {data['kpis']['receita_total']:,.0f}".replace(',', '.'),
-                    'raw': data['kpis']['receita_total'],
-                    'subtitle': 'Receita acumulada',
-                    'color_class': 'success'
-                }
-            },
+            'kpis': format_executive_kpis(data['kpis']),
             'recurrence': data.get('recurrence', {}),
             'satisfaction': data.get('satisfaction', {}),
             'distributions': distributions,
@@ -297,13 +411,10 @@ def api_executive_data_improved():
             'timestamp': datetime.now().isoformat()
         }
         
-        print(f"✅ [API] Dados formatados - {len(formatted_response['kpis'])} KPIs, {len(distributions)} distribuições")
-        return jsonify(formatted_response)
+        return formatted_response, 200
         
     except Exception as e:
-        print(f"❌ [API] Erro crítico melhorado: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Erro em /api/executive-data")
         
         # Resposta de erro estruturada
         error_response = {
@@ -323,28 +434,95 @@ def api_executive_data_improved():
             'timestamp': datetime.now().isoformat()
         }
         
-        return jsonify(error_response), 500
+        return error_response, 500
+
+@app.route('/api/executive-data')
+def api_executive_data_improved():
+    body, status = executive_data_widget(request.args)
+    return jsonify(body), status
     
 @app.route('/api/refresh-data')
 def api_refresh_data():
-    """API para limpar cache e forçar atualização dos dados"""
+    """
+    Atualização dos dados em segundo plano: agenda um job (?source=clientes,pedidos,satisfacao;
+    padrão todas) e responde 202 com o job_id para consulta em /api/refresh-data/<job_id>.
+    Até o job terminar, as requisições seguem usando os dados anteriores.
+    ?namespace=... ou ?key=... apenas limpam essa parte do cache, na hora.
+    """
     try:
-        # Limpar cache interno
-        clear_cache()
+        namespace = request.args.get('namespace') or None
+        key = request.args.get('key') or None
+        if namespace or key:
+            removidas = clear_cache(namespace=namespace, key=key)
+            return jsonify({
+                'status': 'success',
+                'message': 'Cache limpo com sucesso',
+                'namespace': namespace,
+                'key': key,
+                'removed_entries': removidas,
+                'timestamp': datetime.now().isoformat()
+            })
+        
+        sources = [source.strip() for source in request.args.get('source', '').split(',') if source.strip()]
+        try:
+            job = start_refresh_job(sources)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e), 'timestamp': datetime.now().isoformat()}), 400
         
         return jsonify({
             'status': 'success',
-            'message': 'Cache limpo com sucesso',
+            'message': 'Atualização agendada',
+            'job': job,
+            'poll_url': f"/api/refresh-data/{job['job_id']}",
             'timestamp': datetime.now().isoformat()
-        })
+        }), 202
         
     except Exception as e:
         return jsonify({
             'status': 'error',
-            'message': f'Erro ao limpar cache: {str(e)}',
+            'message': f'Erro ao agendar atualização: {str(e)}',
             'timestamp': datetime.now().isoformat()
         }), 500
 
+@app.route('/api/refresh-data/<job_id>')
+def api_refresh_job(job_id):
+    """Estado de um job de atualização: queued, running, done ou error"""
+    job = get_refresh_job(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'error': 'Job não encontrado'}), 404
+    return jsonify({'status': 'success', 'job': job})
+
+@app.route('/api/refresh-jobs')
+def api_refresh_jobs():
+    """Jobs de atualização recentes deste processo"""
+    return jsonify({'status': 'success', 'jobs': list_refresh_jobs()})
+
+@app.route('/api/stream')
+def api_stream():
+    """
+    Server-Sent Events: um evento por versão nova do dataset com os KPIs e distribuições
+    que mudaram. A versão que o cliente já tem vem do cabeçalho Last-Event-ID (reconexão
+    automática do EventSource) ou de ?last_version= (versão carregada por /api/executive-data).
+    """
+    last_version = request.headers.get('Last-Event-ID') or request.args.get('last_version')
+    try:
+        last_version = int(last_version) if last_version else None
+    except ValueError:
+        last_version = None
+
+    stream = live_updates.open_stream(last_version)
+    if stream is None:
+        return jsonify({
+            'status': 'error',
+            'error': 'Limite de conexões de atualização ao vivo atingido',
+            'timestamp': datetime.now().isoformat()
+        }), 503
+
+    return Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 # === FILTROS DE TEMPLATE ===
 
 @app.template_filter('currency')
@@ -440,19 +618,39 @@ def client_management():
 def api_clients_data():
     """API para fornecer a lista completa de clientes com score de prioridade."""
     try:
-        df_clientes = load_google_sheet_public(Config.CLASSIFICACAO_SHEET_ID, "classificacao_clientes3")
+        snapshot = get_clients_snapshot()
         
-        if df_clientes.empty:
+        if snapshot is None:
             return jsonify({'error': 'Dados de clientes não disponíveis', 'status': 'error'}), 500
         
-        # Garante que os valores NaN não quebrem a conversão para JSON
-        df_clientes = df_clientes.fillna('')
+        # Ordem de prioridade já mantida pelo snapshot (mais críticos primeiro)
+        order = snapshot['order']
+        
+        # Filtro opcional por segmentos pré-calculados (ex: ?segment=premium_em_risco,criticos)
+        segment_param = request.args.get('segment', '')
+        segment_names = [name.strip() for name in segment_param.split(',') if name.strip()]
+        if segment_names:
+            try:
+                mask = combine_segments(snapshot['segments'], segment_names)
+            except KeyError as e:
+                return jsonify({
+                    'error': f'Segmento desconhecido: {e.args[0]}',
+                    'available_segments': sorted(snapshot['segments'].keys()),
+                    'status': 'error'
+                }), 400
+            order = order[mask[order]]
         
-        # Calcula o score de prioridade para cada cliente
-        df_clientes['priority_score'] = df_clientes.apply(calculate_priority_score, axis=1)
+        # Risco de churn do modelo (probabilidade 0-1; vazio para clientes sem pedidos)
+        churn_risk = client_churn_risk(snapshot)
+        if request.args.get('sort') == 'churn_risk':
+            # Maior risco primeiro, clientes sem score no fim (ordenação estável preserva a prioridade)
+            chave = np.where(np.isnan(churn_risk[order]), np.inf, -churn_risk[order])
+            order = order[np.argsort(chave, kind='stable')]
         
-        # Ordena os clientes pelo score (mais críticos primeiro)
-        df_clientes = df_clientes.sort_values('priority_score', ascending=False)
+        # Garante que os valores NaN não quebrem a conversão para JSON
+        df_clientes = snapshot['df'].iloc[order].drop(columns=['receita_num'])
+        df_clientes['churn_risk'] = np.round(churn_risk[order], 3)
+        df_clientes = df_clientes.fillna('')
         
         # Converte o DataFrame para uma lista de dicionários
         clients_data = df_clientes.to_dict('records')
@@ -460,14 +658,391 @@ def api_clients_data():
         return jsonify({
             'clients': clients_data,
             'total': len(clients_data),
+            'scoring': snapshot['scoring'],
             'status': 'success'
         })
         
     except Exception as e:
-        print(f"❌ Erro em /api/clients-data: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Erro em /api/clients-data")
         return jsonify({'error': f'Erro ao carregar dados dos clientes: {str(e)}', 'status': 'error'}), 500
+
+@app.route('/api/clients/<client_id>')
+def api_client_detail(client_id):
+    """API com a visão 360 de um cliente (classificação, score, pedidos e recompra)"""
+    try:
+        detail = get_client_360(client_id)
+        
+        if detail is None:
+            return jsonify({'error': f'Cliente {client_id} não encontrado', 'status': 'not_found'}), 404
+        
+        detail['status'] = 'success'
+        return jsonify(detail)
+        
+    except Exception as e:
+        logger.exception("Erro em /api/clients/<client_id>", extra={'client_id': client_id})
+        return jsonify({'error': f'Erro ao carregar cliente: {str(e)}', 'status': 'error'}), 500
+
+def compare_widget(args) -> Tuple[Dict, int]:
+    """API genérica de comparação atual vs anterior para as métricas registradas"""
+    try:
+        metrics_param = args.get('metrics', '')
+        names = [name.strip() for name in metrics_param.split(',') if name.strip()] or sorted(COMPARISON_METRICS)
+        comparison = args.get('comparison', 'previous')
+        
+        data_inicio_str = args.get('start')
+        data_fim_str = args.get('end')
+        if data_inicio_str and data_fim_str:
+            data_inicio = datetime.strptime(data_inicio_str, '%Y-%m-%d')
+            data_fim = datetime.strptime(data_fim_str, '%Y-%m-%d')
+        else:
+            data_fim = datetime.now()
+            data_inicio = data_fim - timedelta(days=30)
+        
+        try:
+            results = compare_metrics(names, data_inicio, data_fim, comparison)
+        except KeyError as e:
+            return {
+                'error': f'Métrica desconhecida: {e.args[0]}',
+                'available_metrics': sorted(COMPARISON_METRICS),
+                'status': 'error'
+            }, 400
+        
+        return {
+            'comparison': comparison,
+            'metrics': results,
+            'status': 'success'
+        }, 200
+        
+    except ValueError as e:
+        return {'error': f'Parâmetro inválido: {str(e)}', 'status': 'error'}, 400
+    except Exception as e:
+        logger.exception("Erro em /api/compare")
+        return {'error': f'Erro ao comparar métricas: {str(e)}', 'status': 'error'}, 500
+
+@app.route('/api/compare')
+def api_compare():
+    body, status = compare_widget(request.args)
+    return jsonify(body), status
+
+def repurchase_latency_widget(args) -> Tuple[Dict, int]:
+    """API com a distribuição do tempo até a recompra para a coorte do primeiro pedido"""
+    try:
+        data_inicio_str = args.get('start')
+        data_fim_str = args.get('end')
+        if data_inicio_str and data_fim_str:
+            data_inicio = datetime.strptime(data_inicio_str, '%Y-%m-%d')
+            data_fim = datetime.strptime(data_fim_str, '%Y-%m-%d')
+        else:
+            data_fim = datetime.now()
+            data_inicio = data_fim - timedelta(days=365)
+        
+        # Faixas opcionais do histograma (?bins=0,30,60,90)
+        bins_param = args.get('bins')
+        bins = sorted({float(b) for b in bins_param.split(',') if b.strip()}) if bins_param else None
+        
+        distribution = repurchase_latency_distribution(data_inicio, data_fim, bins)
+        
+        if distribution is None:
+            return {'error': 'Dados de pedidos não disponíveis', 'status': 'error'}, 500
+        
+        distribution['status'] = 'success'
+        return distribution, 200
+        
+    except ValueError as e:
+        return {'error': f'Parâmetro inválido: {str(e)}', 'status': 'error'}, 400
+    except Exception as e:
+        logger.exception("Erro em /api/repurchase-latency")
+        return {'error': f'Erro ao calcular latência de recompra: {str(e)}', 'status': 'error'}, 500
+
+@app.route('/api/repurchase-latency')
+def api_repurchase_latency():
+    body, status = repurchase_latency_widget(request.args)
+    return jsonify(body), status
+
+def rfm_summary_widget(args) -> Tuple[Dict, int]:
+    """API com a classificação RFM derivada dos pedidos (distribuição e concordância com a planilha)"""
+    try:
+        summary = get_rfm_summary()
+        
+        if summary is None:
+            return {'error': 'Dados de pedidos não disponíveis', 'status': 'error'}, 500
+        
+        summary['source'] = Config.CLIENTS_SOURCE
+        summary['status'] = 'success'
+        return summary, 200
+        
+    except Exception as e:
+        logger.exception("Erro em /api/rfm-summary")
+        return {'error': f'Erro ao calcular RFM: {str(e)}', 'status': 'error'}, 500
+
+@app.route('/api/rfm-summary')
+def api_rfm_summary():
+    body, status = rfm_summary_widget(request.args)
+    return jsonify(body), status
+
+# === LOTE DE WIDGETS (várias análises numa requisição, sobre a mesma versão dos dados) ===
+
+# Widgets aceitos em /api/batch: mesmo nome, parâmetros e corpo da rota /api/<nome>
+BATCH_WIDGETS = {
+    'executive-data': executive_data_widget,
+    'critical-analysis': critical_analysis_widget,
+    'recurrence-analysis': recurrence_analysis_widget,
+    'analytics-data': analytics_data_widget,
+    'compare': compare_widget,
+    'repurchase-latency': repurchase_latency_widget,
+    'rfm-summary': rfm_summary_widget
+}
+
+def _batch_args(params: Dict) -> Dict[str, str]:
+    """Parâmetros do widget como viriam na query string (listas viram 'a,b,c')"""
+    args = {}
+    for key, value in params.items():
+        if value is None:
+            continue
+        args[key] = ','.join(str(v) for v in value) if isinstance(value, (list, tuple)) else str(value)
+    return args
+
+@app.route('/api/batch', methods=['POST'])
+def api_batch():
+    """
+    Vários widgets numa requisição: {"widgets": [{"id": "kpis", "widget": "executive-data",
+    "params": {...}}, ...]}. Todos são calculados sobre a mesma versão do dataset; pedidos
+    idênticos são calculados uma vez e agregações de janela em comum são reaproveitadas
+    dentro do lote. Cada resultado traz o status HTTP que a rota individual devolveria.
+    """
+    try:
+        payload = request.get_json(silent=True)
+        widgets = payload.get('widgets') if isinstance(payload, dict) else None
+        if not isinstance(widgets, list) or not widgets:
+            return jsonify({
+                'error': "Informe 'widgets': lista de {id, widget, params}",
+                'available_widgets': sorted(BATCH_WIDGETS),
+                'status': 'error'
+            }), 400
+        if len(widgets) > Config.BATCH_MAX_WIDGETS:
+            return jsonify({
+                'error': f'Máximo de {Config.BATCH_MAX_WIDGETS} widgets por lote',
+                'status': 'error'
+            }), 400
+        
+        # Fixa a versão do dataset antes do primeiro widget
+        current_dataset()
+        
+        results = []
+        computed = {}
+        with batch_memo():
+            for posicao, item in enumerate(widgets):
+                item = item if isinstance(item, dict) else {}
+                widget = item.get('widget')
+                params = item.get('params') or {}
+                
+                if widget not in BATCH_WIDGETS:
+                    body, status = {
+                        'error': f'Widget desconhecido: {widget}',
+                        'available_widgets': sorted(BATCH_WIDGETS),
+                        'status': 'error'
+                    }, 400
+                elif not isinstance(params, dict):
+                    body, status = {'error': "'params' deve ser um objeto", 'status': 'error'}, 400
+                else:
+                    args = _batch_args(params)
+                    chave = (widget, tuple(sorted(args.items())))
+                    if chave not in computed:
+                        with metrics.stage(f"batch_{widget.replace('-', '_')}"):
+                            computed[chave] = BATCH_WIDGETS[widget](args)
+                    body, status = computed[chave]
+                
+                results.append({
+                    'id': item.get('id', posicao),
+                    'widget': widget,
+                    'status_code': status,
+                    'data': body
+                })
+        
+        logger.debug("Lote de widgets calculado", extra={'widgets': len(widgets), 'calculados': len(computed)})
+        return jsonify({
+            'results': results,
+            'computed': len(computed),
+            'status': 'success',
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        logger.exception("Erro em /api/batch")
+        return jsonify({'error': f'Erro ao processar lote: {str(e)}', 'status': 'error'}), 500
+
+@app.route('/api/scoring/simulate', methods=['POST'])
+def api_scoring_simulate():
+    """API de simulação (what-if) de pesos do score de prioridade"""
+    try:
+        payload = request.get_json(silent=True) or {}
+        scenarios = payload.get('scenarios', [])
+        
+        if not isinstance(scenarios, list) or not scenarios:
+            return jsonify({'error': "Informe 'scenarios': [{'name': ..., 'weights': {...}}]", 'status': 'error'}), 400
+        if len(scenarios) > Config.SCORING_MAX_SCENARIOS:
+            return jsonify({'error': f'Máximo de {Config.SCORING_MAX_SCENARIOS} cenários por simulação', 'status': 'error'}), 400
+        
+        try:
+            result = simulate_scoring(
+                scenarios,
+                top_n=int(payload.get('top_n', 20)),
+                threshold=payload.get('threshold')
+            )
+        except (ValueError, TypeError, AttributeError) as e:
+            return jsonify({'error': f'Pesos inválidos: {str(e)}', 'status': 'error'}), 400
+        
+        if result is None:
+            return jsonify({'error': 'Dados de clientes não disponíveis', 'status': 'error'}), 500
+        
+        result['status'] = 'success'
+        return jsonify(result)
+        
+    except Exception as e:
+        logger.exception("Erro em /api/scoring/simulate")
+        return jsonify({'error': f'Erro na simulação: {str(e)}', 'status': 'error'}), 500
+
+@app.route('/api/scoring/batch', methods=['POST'])
+def api_scoring_batch():
+    """
+    API de pontuação em lote para linhas de clientes externas.
+    Aceita JSON (lista de objetos/tuplas ou {'rows': [...]}) ou CSV (Content-Type: text/csv).
+    Limites: Config.SCORING_BATCH_MAX_ROWS e Config.SCORING_BATCH_MAX_BYTES.
+    Vazão medida em benchmarks/bench_scoring_batch.py.
+    """
+    try:
+        if request.content_length and request.content_length > Config.SCORING_BATCH_MAX_BYTES:
+            return jsonify({
+                'error': f'Corpo excede o limite de {Config.SCORING_BATCH_MAX_BYTES} bytes',
+                'status': 'error'
+            }), 413
+        
+        try:
+            if request.mimetype == 'text/csv':
+                df_rows = pd.read_csv(io.StringIO(request.get_data(as_text=True)), dtype=str)
+                df_rows.columns = df_rows.columns.str.strip()
+            else:
+                payload = request.get_json(silent=True)
+                records = payload.get('rows') if isinstance(payload, dict) else payload
+                df_rows = build_scoring_frame(records)
+        except (ValueError, pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+            return jsonify({'error': f'Corpo inválido: {str(e)}', 'status': 'error'}), 400
+        
+        if len(df_rows) > Config.SCORING_BATCH_MAX_ROWS:
+            return jsonify({
+                'error': f'Máximo de {Config.SCORING_BATCH_MAX_ROWS} linhas por lote',
+                'status': 'error'
+            }), 413
+        
+        scores = compute_priority_scores(df_rows)
+        
+        response = {
+            'scores': scores.tolist(),
+            'count': len(df_rows),
+            'critical_count': int((scores >= Config.CRITICAL_SCORE_THRESHOLD).sum()),
+            'status': 'success'
+        }
+        if 'id' in df_rows.columns:
+            response['ids'] = df_rows['id'].astype(str).tolist()
+        
+        return jsonify(response)
+        
+    except Exception as e:
+        logger.exception("Erro em /api/scoring/batch")
+        return jsonify({'error': f'Erro na pontuação em lote: {str(e)}', 'status': 'error'}), 500
+
+@app.route('/api/actions')
+def api_actions():
+    """API da central de ações: filtros no servidor, ordenação por score e paginação por cursor"""
+    try:
+        try:
+            limit = min(int(request.args.get('limit', Config.ACTIONS_PER_PAGE)), Config.ACTIONS_MAX_PER_PAGE)
+            cursor = parse_actions_cursor(request.args.get('cursor'))
+        except ValueError:
+            return jsonify({'error': 'Parâmetros de paginação inválidos', 'status': 'error'}), 400
+        
+        filters = {
+            'status': request.args.get('status', 'aberta'),
+            'priority': request.args.get('priority'),
+            'assigned_to': request.args.get('team'),
+            'action_type': request.args.get('action_type'),
+            'client_level': request.args.get('client_level'),
+            'overdue': request.args.get('overdue') in ('1', 'true'),
+            'premium_only': request.args.get('premium_only') in ('1', 'true')
+        }
+        
+        page = list_actions_page(filters, cursor, max(1, limit))
+        page['status'] = 'success'
+        return jsonify(page)
+        
+    except Exception as e:
+        logger.exception("Erro em /api/actions")
+        return jsonify({'error': f'Erro ao carregar ações: {str(e)}', 'status': 'error'}), 500
+
+@app.route('/api/actions/<int:action_id>/execute', methods=['POST'])
+def api_execute_action(action_id):
+    """Marca uma ação como executada, registrando notas e resultado"""
+    try:
+        payload = request.get_json(silent=True) or {}
+        updated = actions_store.update_action(
+            action_id,
+            status='executada',
+            executed_at=datetime.now().isoformat(),
+            notes=payload.get('notes', ''),
+            outcome=payload.get('outcome', ''),
+            next_action=payload.get('next_action', '')
+        )
+        
+        if not updated:
+            return jsonify({'error': f'Ação {action_id} não encontrada', 'status': 'not_found'}), 404
+        
+        return jsonify({'id': action_id, 'status': 'success'})
+        
+    except Exception as e:
+        logger.exception("Erro ao executar ação", extra={'action_id': action_id})
+        return jsonify({'error': f'Erro ao executar ação: {str(e)}', 'status': 'error'}), 500
+
+@app.route('/api/metrics')
+def api_metrics():
+    """Métricas no formato texto do Prometheus (etapas, requisições, cache e snapshots)"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/cache/stats')
+def api_cache_stats():
+    """Entradas do cache (mais recentes primeiro), tamanhos, idades e hit rate por namespace"""
+    try:
+        stats = get_cache_stats()
+        namespace = request.args.get('namespace')
+        if namespace:
+            stats['entries'] = [entry for entry in stats['entries'] if entry['namespace'] == namespace]
+        if request.args.get('sort') == 'size':
+            stats['entries'].sort(key=lambda entry: -entry['size_bytes'])
+        
+        limit = max(1, int(request.args.get('limit', 200)))
+        stats['total_entries'] = len(stats['entries'])
+        stats['entries'] = stats['entries'][:limit]
+        stats['status'] = 'success'
+        stats['timestamp'] = datetime.now().isoformat()
+        return jsonify(stats)
+        
+    except ValueError:
+        return jsonify({'error': "Parâmetro 'limit' inválido", 'status': 'error'}), 400
+    except Exception as e:
+        logger.exception("Erro em /api/cache/stats")
+        return jsonify({'error': f'Erro ao coletar estatísticas do cache: {str(e)}', 'status': 'error'}), 500
+
+@app.route('/api/ready')
+def api_ready():
+    """Readiness: 200 quando os snapshots essenciais estão em memória, 503 caso contrário"""
+    try:
+        status = get_snapshot_status()
+        status['status'] = 'ready' if status['ready'] else 'warming_up'
+        status['timestamp'] = datetime.now().isoformat()
+        return jsonify(status), 200 if status['ready'] else 503
+        
+    except Exception as e:
+        return jsonify({'ready': False, 'status': 'error', 'error': str(e)}), 503
+
 # === INICIALIZAÇÃO ===
 
 if __name__ == '__main__':
@@ -478,5 +1053,8 @@ if __name__ == '__main__':
     print("   • /api/analytics-data  (Analytics)")
     print("   • /api/refresh-data    (Limpar Cache)")
     print("   • /api/test           (Teste de Conexão)")
+    print("   • /api/ready          (Prontidão dos snapshots)")
+    print()
+    print("   Produção: gunicorn -c gunicorn.conf.py app:app")
     print()
-    app.run(debug=True, host='0.0.0.0', port=5003)
\ No newline at end of file
+    app.run(debug=Config.DEBUG, host='0.0.0.0', port=int(os.environ.get('PORT', 5003)))
\ No newline at end of file
@@ -0,0 +1,136 @@
+"""
+Logging estruturado - Dashboard Papello
+
+Loggers por módulo ('papello.<modulo>') com níveis, campos estruturados via
+extra={...} e saída em texto (logfmt) ou JSON. As threads de requisição só
+enfileiram o registro (QueueHandler); a escrita no stdout acontece numa thread
+separada (QueueListener). Eventos DEBUG são amostrados (LOG_DEBUG_SAMPLE_RATE),
+com extra={'sample_rate': 1.0} para forçar um evento específico.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+from typing import Optional
+
+from config import Config
+
+ROOT_LOGGER = 'papello'
+
+# Atributos padrão do LogRecord; o que sobrar são os campos estruturados do extra
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'sample_rate'}
+
+_lock = threading.Lock()
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def _fields(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in vars(record).items()
+            if key not in _STANDARD_ATTRS and not key.startswith('_')}
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por evento: ts, level, logger, msg e os campos do extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        payload.update(_fields(record))
+        if record.exc_text:
+            payload['exc'] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    """Texto legível com os campos do extra no formato chave=valor"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s', '%Y-%m-%d %H:%M:%S')
+
+    def format(self, record: logging.LogRecord) -> str:
+        record.message = record.getMessage()
+        record.asctime = self.formatTime(record, self.datefmt)
+        linha = self.formatMessage(record)
+        campos = ' '.join(f"{key}={value}" for key, value in _fields(record).items())
+        if campos:
+            linha = f"{linha} {campos}"
+        if record.exc_text:
+            linha = f"{linha}\n{record.exc_text}"
+        return linha
+
+class SamplingFilter(logging.Filter):
+    """Deixa passar só uma fração dos eventos DEBUG; INFO e acima passam sempre"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = getattr(record, 'sample_rate', self.rate)
+        return rate >= 1.0 or random.random() < rate
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Enfileira o registro com a mensagem já resolvida, preservando os campos estruturados"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def _build_output_handler() -> logging.Handler:
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if Config.LOG_FORMAT == 'json' else TextFormatter())
+    return handler
+
+def _start_listener():
+    global _listener
+    fila = queue.SimpleQueue()
+    _queue_handler.queue = fila
+    _listener = logging.handlers.QueueListener(fila, _build_output_handler())
+    _listener.start()
+
+def configure_logging():
+    """Configura o logger raiz 'papello' uma única vez por processo"""
+    global _queue_handler
+    with _lock:
+        if _queue_handler is not None:
+            return
+        _queue_handler = _QueueHandler(queue.SimpleQueue())
+        _queue_handler.addFilter(SamplingFilter(Config.LOG_DEBUG_SAMPLE_RATE))
+
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(getattr(logging, Config.LOG_LEVEL.upper(), logging.INFO))
+        root.addHandler(_queue_handler)
+        root.propagate = False
+
+        _start_listener()
+        atexit.register(stop_logging)
+
+def restart_after_fork():
+    """No worker recém-criado a thread do listener não existe: cria fila e listener novos"""
+    with _lock:
+        if _queue_handler is not None:
+            _start_listener()
+
+def stop_logging():
+    """Esvazia a fila e encerra o listener (chamado no atexit)"""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger do módulo: get_logger(__name__) -> 'papello.data_utils'"""
+    configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark da pontuação em lote - Dashboard Papello
+
+Mede a vazão (linhas/s) de:
+  1. calculate_priority_score linha a linha (df.apply), a referência antiga
+  2. compute_priority_scores vetorizado
+  3. POST /api/scoring/batch pelo test client do Flask (JSON e CSV)
+
+Uso:  python benchmarks/bench_scoring_batch.py [linhas ...]
+"""
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from config import Config
+from data_utils import calculate_priority_score, compute_priority_scores, SCORING_BATCH_COLUMNS
+
+def gerar_linhas(n: int, seed: int = 42) -> pd.DataFrame:
+    """Gera linhas sintéticas com as categorias usadas pelo score"""
+    rng = np.random.default_rng(seed)
+    weights = Config.SCORING_WEIGHTS
+    return pd.DataFrame({
+        'nivel_cliente': rng.choice(list(weights['nivel']), n),
+        'risco_recencia': rng.choice(list(weights['risco']), n),
+        'status_churn': rng.choice(list(weights['churn']), n),
+        'top_20_valor': rng.choice(['Sim', 'Não'], n, p=[0.2, 0.8])
+    })
+
+def cronometrar(func, repeticoes: int = 3) -> float:
+    """Melhor tempo (s) entre as repetições"""
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        func()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+def main():
+    tamanhos = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+
+    from app import app
+    client = app.test_client()
+
+    print(f"{'linhas':>10} {'apply (l/s)':>15} {'vetorizado (l/s)':>18} {'API JSON (l/s)':>16} {'API CSV (l/s)':>15}")
+    for n in tamanhos:
+        df = gerar_linhas(n)
+
+        esperado = df.apply(calculate_priority_score, axis=1).to_numpy()
+        assert np.array_equal(esperado, compute_priority_scores(df)), "score vetorizado diverge do original"
+
+        t_apply = cronometrar(lambda: df.apply(calculate_priority_score, axis=1), repeticoes=1)
+        t_vetor = cronometrar(lambda: compute_priority_scores(df))
+
+        registros = df[SCORING_BATCH_COLUMNS].values.tolist()
+        csv_body = df.to_csv(index=False)
+        if n <= Config.SCORING_BATCH_MAX_ROWS:
+            t_json = cronometrar(lambda: client.post('/api/scoring/batch', json=registros))
+            t_csv = cronometrar(lambda: client.post('/api/scoring/batch', data=io.BytesIO(csv_body.encode()),
+                                                     content_type='text/csv'))
+            api_json, api_csv = f"{n / t_json:,.0f}", f"{n / t_csv:,.0f}"
+        else:
+            api_json = api_csv = "acima do limite"
+
+        print(f"{n:>10} {n / t_apply:>15,.0f} {n / t_vetor:>18,.0f} {api_json:>16} {api_csv:>15}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Suíte de benchmarks - Dashboard Papello
+
+Roda sobre os CSVs sintéticos (benchmarks/synthetic_data.py, lidos via DATA_DIR) e mede:
+  1. cada função de data_utils usada pelas rotas
+  2. cada rota /api/* pelo test client do Flask
+
+Para cada item: 'cold_s' (cache e dataset descartados, recalcula tudo inclusive a leitura dos CSVs) e
+'warm_s' (mediana de --repeat chamadas com o cache já populado). O resultado vai para
+um JSON que pode ser comparado com um baseline salvo (--baseline); com --fail-on-regression
+o processo termina com código 1 se algum item ficar mais lento que a tolerância. Um item que
+falha (exceção ou resposta 5xx inesperada) sempre termina com código 1, depois de gravar o JSON.
+
+Uso:
+  python benchmarks/bench_suite.py --orders 100000
+  python benchmarks/bench_suite.py --orders 100000 --save-baseline
+  python benchmarks/bench_suite.py --orders 100000 --baseline benchmarks/baseline.json --fail-on-regression
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..'))
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+# Diferenças menores que isso (s) são ruído de medição, nunca regressão
+MIN_DELTA_S = 0.002
+
+def _configure_environment(data_dir: str):
+    """Precisa rodar antes de importar config/data_utils: Config lê o ambiente na importação"""
+    os.environ['DATA_DIR'] = data_dir
+    os.environ.setdefault('ACTIONS_DB_PATH', os.path.join(tempfile.mkdtemp(prefix='papello-bench-'), 'cs_actions.db'))
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+def _ensure_dataset(orders: int, data_dir: str, seed: int) -> Dict[str, int]:
+    from synthetic_data import CLIENTES_CSV, PEDIDOS_CSV, PESQUISA_CSV, generate_dataset
+
+    arquivos = [os.path.join(data_dir, nome) for nome in (CLIENTES_CSV, PEDIDOS_CSV, PESQUISA_CSV)]
+    if not all(os.path.exists(arquivo) for arquivo in arquivos):
+        print(f"Gerando dados sintéticos ({orders} pedidos) em {data_dir}...")
+        generate_dataset(orders, data_dir, seed)
+
+    linhas = {}
+    for nome, arquivo in zip(('clientes', 'pedidos', 'respostas'), arquivos):
+        with open(arquivo, 'rb') as f:
+            linhas[nome] = sum(1 for _ in f) - 1
+    return linhas
+
+def function_benchmarks() -> List[Tuple[str, Callable]]:
+    """(nome, chamada) para as funções de data_utils que alimentam as rotas"""
+    import data_utils as du
+    from config import Config
+
+    fim = datetime.now()
+    inicio = fim - timedelta(days=180)
+    inicio_30 = fim - timedelta(days=30)
+
+    def client_id():
+        snapshot = du.get_clients_snapshot()
+        return str(snapshot['ids'][0])
+
+    return [
+        ('load_google_sheet_public[clientes]',
+         lambda: du.load_google_sheet_public(Config.CLASSIFICACAO_SHEET_ID, du.CLIENTES_TAB)),
+        ('load_google_sheet_public[pedidos]',
+         lambda: du.load_google_sheet_public(Config.CLASSIFICACAO_SHEET_ID, du.PEDIDOS_TAB)),
+        ('load_satisfaction_data', du.load_satisfaction_data),
+        ('get_orders_snapshot', du.get_orders_snapshot),
+        ('get_clients_snapshot', du.get_clients_snapshot),
+        ('get_satisfaction_snapshot', du.get_satisfaction_snapshot),
+        ('get_rfm_snapshot', du.get_rfm_snapshot),
+        ('get_rfm_summary', du.get_rfm_summary),
+        ('get_churn_scores', du.get_churn_scores),
+        ('get_order_segments', du.get_order_segments),
+        ('get_repurchase_table', du.get_repurchase_table),
+        ('compute_priority_scores', lambda: du.compute_priority_scores(du.get_clients_snapshot()['df'])),
+        ('get_client_360', lambda: du.get_client_360(client_id())),
+        ('compute_analytics', lambda: du.compute_analytics(90)),
+        ('compare_metrics[todas]', lambda: du.compare_metrics(sorted(du.COMPARISON_METRICS), inicio_30, fim)),
+        ('compute_recurrence_metrics', lambda: du.compute_recurrence_metrics(inicio, fim)),
+        ('compute_recurrence_metrics[Premium]', lambda: du.compute_recurrence_metrics(inicio, fim, segment='Premium')),
+        ('repurchase_latency_distribution', lambda: du.repurchase_latency_distribution(inicio, fim)),
+        ('compute_critical_analysis', du.compute_critical_analysis),
+        ('calculate_satisfaction_metrics[nps]', lambda: du.calculate_satisfaction_metrics('nps')),
+        ('analyze_client_recurrence_corrected',
+         lambda: du.analyze_client_recurrence_corrected(du.get_orders_snapshot()['df'], inicio, fim)),
+        ('get_executive_summary_data', du.get_executive_summary_data),
+        ('list_actions_page', lambda: du.list_actions_page({})),
+        ('warm_up_snapshots', du.warm_up_snapshots),
+    ]
+
+def route_requests(app) -> Tuple[List[Tuple[str, Callable]], List[str]]:
+    """
+    Uma requisição por rota /api/*. GETs sem parâmetros são chamados direto; rotas com
+    parâmetro ou corpo usam os exemplos abaixo. Rotas que alteram dados (execução de ação),
+    /api/refresh-data (invalida o cache no meio da medição) e /api/stream (conexão aberta)
+    ficam de fora.
+    """
+    import data_utils as du
+    from config import Config
+
+    client = app.test_client()
+    snapshot = du.get_clients_snapshot()
+    amostra = snapshot['df'].head(1000)
+    exemplo_id = str(snapshot['ids'][0])
+    inicio = (datetime.now() - timedelta(days=180)).strftime('%Y-%m-%d')
+    fim = datetime.now().strftime('%Y-%m-%d')
+
+    especiais = {
+        '/api/clients/<client_id>': [('GET', f'/api/clients/{exemplo_id}', None)],
+        '/api/recurrence-analysis': [
+            ('GET', '/api/recurrence-analysis', None),
+            ('GET', f'/api/recurrence-analysis?start={inicio}&end={fim}&segment=Premium', None)
+        ],
+        '/api/clients-data': [
+            ('GET', '/api/clients-data', None),
+            ('GET', '/api/clients-data?sort=churn_risk', None)
+        ],
+        '/api/scoring/simulate': [('POST', '/api/scoring/simulate', {
+            'scenarios': [{'name': 'top20_dobrado', 'weights': {'top20_bonus': Config.SCORING_WEIGHTS['top20_bonus'] * 2}}]
+        })],
+        '/api/scoring/batch': [('POST', '/api/scoring/batch', amostra[du.SCORING_BATCH_COLUMNS].values.tolist())],
+        '/api/batch': [('POST', '/api/batch', {'widgets': [
+            {'widget': 'executive-data'},
+            {'widget': 'recurrence-analysis', 'params': {'start': inicio, 'end': fim}},
+            {'widget': 'critical-analysis'},
+            {'widget': 'compare'}
+        ]})],
+    }
+    ignoradas = {'/api/refresh-data', '/api/stream', '/api/actions/<int:action_id>/execute'}
+    # Respostas >= 500 esperadas: a sonda de prontidão responde 503 com o cache frio (medição cold)
+    status_aceitos = {'/api/ready': {503}}
+
+    chamadas, puladas = [], []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+        if not rule.rule.startswith('/api/'):
+            continue
+        if rule.rule in ignoradas:
+            puladas.append(rule.rule)
+            continue
+        if rule.rule in especiais:
+            exemplos = especiais[rule.rule]
+        elif rule.arguments or 'GET' not in rule.methods:
+            puladas.append(rule.rule)
+            continue
+        else:
+            exemplos = [('GET', rule.rule, None)]
+
+        for method, url, body in exemplos:
+            def chamada(method=method, url=url, body=body, aceitos=status_aceitos.get(rule.rule, set())):
+                response = client.open(url, method=method, json=body)
+                if response.status_code >= 500 and response.status_code not in aceitos:
+                    raise RuntimeError(f"{method} {url} -> {response.status_code}")
+                return response
+            chamadas.append((f"{method} {url}", chamada))
+    return chamadas, puladas
+
+def measure(func: Callable, repeat: int) -> Dict:
+    """Cold: cache limpo antes da chamada. Warm: mediana e mínimo de 'repeat' chamadas seguintes."""
+    from data_utils import clear_cache, reset_dataset
+
+    clear_cache()
+    reset_dataset()
+    inicio = time.perf_counter()
+    func()
+    cold = time.perf_counter() - inicio
+
+    tempos = []
+    for _ in range(repeat):
+        inicio = time.perf_counter()
+        func()
+        tempos.append(time.perf_counter() - inicio)
+    return {
+        'cold_s': round(cold, 6),
+        'warm_s': round(statistics.median(tempos), 6),
+        'warm_min_s': round(min(tempos), 6),
+        'runs': repeat
+    }
+
+def run_suite(repeat: int, only: Optional[str]) -> Tuple[Dict[str, Dict], List[str]]:
+    from app import app
+
+    resultados = {}
+    grupos = [('data_utils', function_benchmarks())]
+    chamadas, puladas = route_requests(app)
+    grupos.append(('api', chamadas))
+
+    for prefixo, itens in grupos:
+        for nome, func in itens:
+            chave = f"{prefixo}.{nome}" if prefixo == 'data_utils' else nome
+            if only and only not in chave:
+                continue
+            try:
+                resultados[chave] = measure(func, repeat)
+            except Exception as e:
+                resultados[chave] = {'error': str(e)}
+            r = resultados[chave]
+            if 'error' in r:
+                print(f"  {chave:<70} ERRO: {r['error']}")
+            else:
+                print(f"  {chave:<70} cold {r['cold_s'] * 1000:>10.1f} ms   warm {r['warm_s'] * 1000:>10.2f} ms")
+    return resultados, puladas
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_with_baseline(atual: Dict, baseline: Dict, tolerance: float) -> List[Dict]:
+    """Itens em comum com o baseline; regressão = mais lento que (1 + tolerance) e acima do ruído"""
+    comparacao = []
+    for chave, r in atual['results'].items():
+        base = baseline.get('results', {}).get(chave)
+        if base is None or 'error' in r or 'error' in base:
+            continue
+        for campo in ('cold_s', 'warm_s'):
+            antes, depois = base[campo], r[campo]
+            razao = depois / antes if antes > 0 else float('inf')
+            comparacao.append({
+                'item': chave,
+                'medida': campo,
+                'baseline_s': antes,
+                'atual_s': depois,
+                'razao': round(razao, 3),
+                'regressao': razao > 1 + tolerance and depois - antes > MIN_DELTA_S
+            })
+    return comparacao
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de data_utils e das rotas /api/* sobre dados sintéticos")
+    parser.add_argument('--orders', type=int, default=100000, help="escala dos dados sintéticos (pedidos)")
+    parser.add_argument('--data-dir', default=None, help="pasta com CSVs já gerados (padrão: benchmarks/data/<pedidos>)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=5, help="chamadas com cache quente por item")
+    parser.add_argument('--only', default=None, help="mede só os itens cujo nome contém este texto")
+    parser.add_argument('--output', default=None, help="JSON de saída (padrão: benchmarks/results/<pedidos>-<data>.json)")
+    parser.add_argument('--baseline', default=None, help="JSON de uma execução anterior para comparação")
+    parser.add_argument('--save-baseline', action='store_true', help=f"grava o resultado também em {DEFAULT_BASELINE}")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="fração de lentidão aceita antes de apontar regressão")
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    data_dir = os.path.abspath(args.data_dir or os.path.join(BENCH_DIR, 'data', str(args.orders)))
+    _configure_environment(data_dir)
+    linhas = _ensure_dataset(args.orders, data_dir, args.seed)
+
+    import numpy as np
+    import pandas as pd
+
+    print(f"Benchmarks sobre {linhas['pedidos']} pedidos, {linhas['clientes']} clientes, "
+          f"{linhas['respostas']} respostas ({args.repeat} repetições)")
+    resultados, puladas = run_suite(args.repeat, args.only)
+
+    saida = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'data_dir': data_dir,
+            'rows': linhas,
+            'repeat': args.repeat,
+            'skipped_routes': puladas
+        },
+        'results': resultados
+    }
+
+    output = args.output or os.path.join(
+        BENCH_DIR, 'results', f"{args.orders}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    destinos = [output] + ([DEFAULT_BASELINE] if args.save_baseline else [])
+    for destino in destinos:
+        os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+        with open(destino, 'w', encoding='utf-8') as f:
+            json.dump(saida, f, indent=2, ensure_ascii=False)
+    print(f"Resultados em {', '.join(destinos)}")
+
+    erros = sorted(chave for chave, r in resultados.items() if 'error' in r)
+    if erros:
+        print(f"\n{len(erros)} itens falharam: {', '.join(erros)}")
+
+    if not args.baseline:
+        if erros:
+            sys.exit(1)
+        return
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('meta', {}).get('rows') != linhas:
+        print(f"⚠️ Baseline medido com outra escala: {baseline.get('meta', {}).get('rows')}")
+
+    comparacao = compare_with_baseline(saida, baseline, args.tolerance)
+    regressoes = [c for c in comparacao if c['regressao']]
+    print(f"\nComparação com {args.baseline} ({len(comparacao)} medidas, tolerância {args.tolerance:.0%}):")
+    for c in sorted(comparacao, key=lambda c: -c['razao'])[:15]:
+        marca = 'REGRESSÃO' if c['regressao'] else ''
+        print(f"  {c['item']:<60} {c['medida']:<7} {c['baseline_s'] * 1000:>10.2f} -> "
+              f"{c['atual_s'] * 1000:>10.2f} ms  x{c['razao']:<6} {marca}")
+    print(f"{len(regressoes)} regressões")
+
+    if erros or (regressoes and args.fail_on_regression):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
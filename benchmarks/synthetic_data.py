@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Gerador de dados sintéticos - Dashboard Papello
+
+Gera CSVs com o mesmo formato das planilhas usadas pelo dashboard, em qualquer escala:
+  - classificacao_clientes3.csv  (clientes já classificados)
+  - pedidos_com_id2.csv          (pedidos com data ISO, status primeiro/recompra e valor com vírgula)
+  - pesquisa_satisfacao.csv      (respostas da pesquisa, carimbo dd/mm/aaaa hh:mm:ss e notas em texto)
+
+Com DATA_DIR apontando para a pasta gerada, data_utils lê esses arquivos no lugar do Google Sheets.
+
+Uso:  python benchmarks/synthetic_data.py --orders 100000 [--out benchmarks/data/100k] [--seed 42]
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from config import Config
+
+CLIENTES_CSV = "classificacao_clientes3.csv"
+PEDIDOS_CSV = "pedidos_com_id2.csv"
+PESQUISA_CSV = "pesquisa_satisfacao.csv"
+
+PEDIDOS_POR_CLIENTE = 6       # média de pedidos por cliente
+HISTORICO_DIAS = 730          # pedidos distribuídos nos últimos 2 anos
+TAXA_RESPOSTA_PESQUISA = 0.3  # fração dos clientes com ao menos uma resposta
+
+ESTADOS = ['SP', 'RJ', 'MG', 'PR', 'SC', 'RS', 'BA', 'PE', 'GO', 'DF']
+CIDADES = {
+    'SP': 'São Paulo', 'RJ': 'Rio de Janeiro', 'MG': 'Belo Horizonte', 'PR': 'Curitiba',
+    'SC': 'Florianópolis', 'RS': 'Porto Alegre', 'BA': 'Salvador', 'PE': 'Recife',
+    'GO': 'Goiânia', 'DF': 'Brasília'
+}
+FAIXAS_NOTA = ['Entre 0 e 1', 'Entre 1 e 2', 'Entre 2 e 3', 'Entre 3 e 4', 'Entre 4 e 5',
+               'Entre 5 e 6', 'Entre 6 e 7', 'Entre 7 e 8', 'Entre 8 e 9', 'Entre 9 e 10']
+COLUNAS_PESQUISA = {
+    'atendimento': 'Como você avalia o atendimento da equipe?',
+    'produto': 'Como você avalia a qualidade do produto?',
+    'prazo': 'Como você avalia o prazo de entrega?',
+    'nps': 'Qual a possibilidade de você recomendar a Papello para um amigo?'
+}
+
+def _formatar_valores(valores: np.ndarray) -> np.ndarray:
+    """Valores monetários como texto com vírgula decimal, como vêm da planilha"""
+    return np.char.replace(np.char.mod('%.2f', valores), '.', ',')
+
+def generate_orders(n_orders: int, rng: np.random.Generator, reference: pd.Timestamp) -> pd.DataFrame:
+    """Pedidos com status coerente: o primeiro pedido de cada cliente é 'primeiro', os demais 'recompra'"""
+    n_clients = max(1, n_orders // PEDIDOS_POR_CLIENTE)
+    # Poucos clientes concentram muitos pedidos (cauda longa), como na base real
+    pesos = rng.pareto(1.5, n_clients) + 1
+    clientes = rng.choice(n_clients, n_orders, p=pesos / pesos.sum())
+
+    # Ticket médio por cliente com variação por pedido
+    ticket_cliente = rng.lognormal(np.log(350), 0.6, n_clients)
+    valores = np.round(ticket_cliente[clientes] * rng.lognormal(0, 0.3, n_orders), 2)
+
+    dias_atras = rng.integers(0, HISTORICO_DIAS, n_orders)
+    datas = reference.normalize() - pd.to_timedelta(dias_atras, unit='D')
+
+    pedidos = pd.DataFrame({
+        'id_pedido': np.arange(1, n_orders + 1),
+        'cliente_unico_id': clientes + 1,
+        'data_pedido_realizado': datas,
+        'valor': valores
+    }).sort_values(['data_pedido_realizado', 'id_pedido'], kind='stable').reset_index(drop=True)
+
+    primeiro = ~pedidos['cliente_unico_id'].duplicated()
+    estados = np.array(ESTADOS)[(pedidos['cliente_unico_id'].to_numpy() * 7) % len(ESTADOS)]
+    return pd.DataFrame({
+        'id_pedido': pedidos['id_pedido'],
+        'cliente_unico_id': pedidos['cliente_unico_id'],
+        'data_pedido_realizado': pedidos['data_pedido_realizado'].dt.strftime('%Y-%m-%d'),
+        'status_pedido': np.where(primeiro, 'Primeiro', 'Recompra'),
+        'valor_do_pedido': _formatar_valores(pedidos['valor'].to_numpy()),
+        'nome': 'Cliente ' + pedidos['cliente_unico_id'].astype(str),
+        'email': 'cliente' + pedidos['cliente_unico_id'].astype(str) + '@exemplo.com.br',
+        'cidade': pd.Series(estados).map(CIDADES).to_numpy(),
+        'estado': estados
+    })
+
+def generate_clients(df_pedidos: pd.DataFrame, rng: np.random.Generator, reference: pd.Timestamp) -> pd.DataFrame:
+    """Classificação dos clientes derivada dos próprios pedidos (mesmas categorias da planilha)"""
+    valores = pd.to_numeric(df_pedidos['valor_do_pedido'].str.replace(',', '.'))
+    agg = pd.DataFrame({
+        'id': df_pedidos['cliente_unico_id'],
+        'data': pd.to_datetime(df_pedidos['data_pedido_realizado']),
+        'valor': valores
+    }).groupby('id').agg(pedidos=('valor', 'size'), receita=('valor', 'sum'),
+                         primeira=('data', 'min'), ultima=('data', 'max'))
+
+    dias_sem_compra = (reference.normalize() - agg['ultima']).dt.days.to_numpy()
+    receita = agg['receita'].to_numpy()
+    cortes_receita = np.quantile(receita, [0.5, 0.8, 0.95])
+    nivel = np.array(['Bronze', 'Silver', 'Gold', 'Premium'])[np.searchsorted(cortes_receita, receita, side='right')]
+
+    intervalo = np.where(agg['pedidos'] > 1,
+                         (agg['ultima'] - agg['primeira']).dt.days.to_numpy() / np.maximum(agg['pedidos'] - 1, 1),
+                         Config.RFM_PARAMS['intervalo_padrao'])
+    razao = dias_sem_compra / np.maximum(intervalo, 1)
+    risco = np.select([razao >= Config.RFM_PARAMS['risco_alto'], razao >= Config.RFM_PARAMS['risco_medio']],
+                      ['Alto', 'Médio'], 'Baixo').astype(object)
+    novo = agg['pedidos'].to_numpy() == 1
+    risco[novo] = np.char.add('Novo_', risco[novo].astype(str))
+
+    status = np.select(
+        [dias_sem_compra <= Config.RFM_PARAMS['ativo_dias'], dias_sem_compra <= Config.RFM_PARAMS['dormant_dias']],
+        ['Ativo', 'Inativo'], 'Dormant'
+    ).astype(object)
+    dormant = status == 'Dormant'
+    status[dormant] = np.where(novo[dormant], 'Dormant_Novo', np.char.add('Dormant_', nivel[dormant]))
+
+    ids = agg.index.to_numpy()
+    estados = np.array(ESTADOS)[(ids * 7) % len(ESTADOS)]
+    return pd.DataFrame({
+        'cliente_unico_id': ids,
+        'nome': [f"Cliente {i}" for i in ids],
+        'email': [f"cliente{i}@exemplo.com.br" for i in ids],
+        'telefone1': [f"11{n:09d}" for n in rng.integers(900000000, 999999999, len(ids))],
+        'cpfcnpj': [f"{n:014d}" for n in rng.integers(10**12, 10**13, len(ids))],
+        'cidade': pd.Series(estados).map(CIDADES).to_numpy(),
+        'estado': estados,
+        'codigo_vendedor': rng.integers(1, 20, len(ids)),
+        'qtd_pedidos': agg['pedidos'].to_numpy(),
+        'dias_sem_compra': dias_sem_compra,
+        'receita': _formatar_valores(receita),
+        'nivel_cliente': nivel,
+        'risco_recencia': risco,
+        'status_churn': status,
+        'top_20_valor': np.where(receita >= np.quantile(receita, 0.8), 'Sim', 'Não')
+    })
+
+def generate_survey(df_clientes: pd.DataFrame, rng: np.random.Generator, reference: pd.Timestamp) -> pd.DataFrame:
+    """Respostas da pesquisa: parte dos clientes responde uma ou mais vezes, notas em faixas de texto"""
+    n_respondentes = max(1, int(len(df_clientes) * TAXA_RESPOSTA_PESQUISA))
+    respondentes = rng.choice(len(df_clientes), n_respondentes, replace=False)
+    respostas = np.concatenate([respondentes, rng.choice(respondentes, n_respondentes // 4)])
+    n = len(respostas)
+
+    segundos = rng.integers(0, HISTORICO_DIAS * 86400, n)
+    carimbos = (reference - pd.to_timedelta(segundos, unit='s')).strftime('%d/%m/%Y %H:%M:%S')
+
+    # Clientes Premium/Gold tendem a notas mais altas
+    base = np.where(np.isin(df_clientes['nivel_cliente'].to_numpy()[respostas], ['Premium', 'Gold']), 8, 7)
+    faixas = np.array(FAIXAS_NOTA)
+    survey = pd.DataFrame({
+        'Carimbo de data/hora': carimbos,
+        'Endereço de e-mail': df_clientes['email'].to_numpy()[respostas],
+        'cliente_unico_id': df_clientes['cliente_unico_id'].to_numpy()[respostas]
+    })
+    for metric, coluna in COLUNAS_PESQUISA.items():
+        notas = np.clip(np.round(rng.normal(base, 1.8)), 0, 9).astype(int)
+        survey[coluna] = faixas[notas]
+    return survey
+
+def generate_dataset(n_orders: int, out_dir: str, seed: int = 42) -> Dict[str, int]:
+    """Gera os três CSVs em out_dir e devolve a quantidade de linhas de cada um"""
+    rng = np.random.default_rng(seed)
+    reference = pd.Timestamp(datetime.now().replace(microsecond=0))
+    os.makedirs(out_dir, exist_ok=True)
+
+    df_pedidos = generate_orders(n_orders, rng, reference)
+    df_clientes = generate_clients(df_pedidos, rng, reference)
+    df_pesquisa = generate_survey(df_clientes, rng, reference)
+
+    df_pedidos.to_csv(os.path.join(out_dir, PEDIDOS_CSV), index=False)
+    df_clientes.to_csv(os.path.join(out_dir, CLIENTES_CSV), index=False)
+    df_pesquisa.to_csv(os.path.join(out_dir, PESQUISA_CSV), index=False)
+    return {'pedidos': len(df_pedidos), 'clientes': len(df_clientes), 'respostas': len(df_pesquisa)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera CSVs sintéticos no formato das planilhas do dashboard")
+    parser.add_argument('--orders', type=int, default=100000, help="quantidade de pedidos (ex: 10000 a 1000000+)")
+    parser.add_argument('--out', default=None, help="pasta de saída (padrão: benchmarks/data/<pedidos>)")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    out_dir = args.out or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', str(args.orders))
+    linhas = generate_dataset(args.orders, out_dir, args.seed)
+    print(f"{linhas['pedidos']} pedidos, {linhas['clientes']} clientes, {linhas['respostas']} respostas em {out_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+Cache em memória com limite de bytes - Dashboard Papello
+
+Substitui os dicionários _cache/_cache_timestamps de data_utils:
+  - orçamento total em bytes (CACHE_MAX_BYTES); ao passar do limite, remove as entradas
+    menos usadas recentemente (LRU)
+  - tamanho de cada entrada medido na gravação: DataFrames/Series via memory_usage(deep=True),
+    arrays NumPy via nbytes, dicts/listas (snapshots) somando o conteúdo
+  - TTL por namespace (CACHE_NAMESPACE_TTLS); sem TTL configurado vale o timeout de quem consulta
+  - estatísticas por entrada e por namespace (tamanho, idade, hits/misses) para /api/cache/stats
+  - staging: uma thread (job de atualização) grava numa camada própria, lendo o cache principal
+    para o que não mudou, e publica tudo de uma vez com publish(); as demais threads seguem
+    vendo os dados anteriores até a publicação
+
+O namespace de uma chave vem de data_utils.cache_namespace (ex: 'sheet_pedidos_com_id2', 'cmp').
+"""
+import heapq
+import itertools
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import metrics
+from app_logging import get_logger
+
+logger = get_logger('cache_store')
+
+# Elementos amostrados para estimar o tamanho de arrays de objetos (strings)
+_OBJECT_SAMPLE = 1000
+
+def estimate_size(value: Any, _seen: Optional[set] = None) -> int:
+    """Tamanho aproximado em bytes; objetos compartilhados dentro do mesmo valor contam uma vez"""
+    seen = _seen if _seen is not None else set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    if hasattr(value, 'memory_usage'):
+        # DataFrame (uma Series por coluna), Series ou Index
+        uso = value.memory_usage(deep=True)
+        return int(uso.sum()) if hasattr(uso, 'sum') else int(uso)
+    if hasattr(value, 'nbytes') and hasattr(value, 'dtype'):
+        if value.dtype == object and value.size:
+            amostra = value.ravel()[:_OBJECT_SAMPLE]
+            media = sum(sys.getsizeof(item) for item in amostra) / len(amostra)
+            return int(value.nbytes + media * value.size)
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            estimate_size(k, seen) + estimate_size(v, seen) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_size(item, seen) for item in value)
+    return sys.getsizeof(value)
+
+class CacheEntry:
+    __slots__ = ('value', 'namespace', 'size', 'stored_at', 'stored_mono', 'last_access', 'hits')
+
+    def __init__(self, value: Any, namespace: str, size: int):
+        self.value = value
+        self.namespace = namespace
+        self.size = size
+        self.stored_at = datetime.now()
+        self.stored_mono = time.monotonic()
+        self.last_access = self.stored_mono
+        self.hits = 0
+
+class BoundedCache:
+    """LRU limitado por bytes, seguro entre threads (um lock por instância)"""
+
+    def __init__(self, max_bytes: int, namespace_ttls: Dict[str, int], namespace_of: Callable[[str], str]):
+        self.max_bytes = max_bytes
+        self.namespace_ttls = dict(namespace_ttls)
+        self.namespace_of = namespace_of
+        self._entries: 'OrderedDict[str, CacheEntry]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        # Vencimentos por TTL de namespace: (expira_em, seq, chave). Itens de entradas já
+        # substituídas ou removidas ficam até vencer e são descartados ao sair do heap
+        self._expiry: List[Tuple[float, int, str]] = []
+        self._expiry_seq = itertools.count()
+        # Contadores por namespace: hits, misses, evictions (LRU) e expirations (TTL)
+        self._counters: Dict[str, Dict[str, int]] = {}
+        # Camada de staging da thread atual (ver staging())
+        self._local = threading.local()
+
+    def _staged(self, key: str) -> Optional['BoundedCache']:
+        """Camada que responde pela chave nesta thread: a de staging, se houver e a chave for dela"""
+        stage = getattr(self._local, 'stage', None)
+        if stage is not None and (key in stage.cache or key in stage.masked):
+            return stage.cache
+        return None
+
+    def _count(self, namespace: str, campo: str):
+        contadores = self._counters.setdefault(namespace, {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0})
+        contadores[campo] += 1
+
+    def _ttl(self, namespace: str, timeout: Optional[int]) -> Optional[int]:
+        return self.namespace_ttls.get(namespace, timeout)
+
+    def _remove(self, key: str, motivo: Optional[str] = None):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        if motivo:
+            self._count(entry.namespace, motivo)
+            metrics.count_cache_removal(entry.namespace, motivo)
+
+    def _insert(self, key: str, entry: CacheEntry):
+        self._entries[key] = entry
+        self._bytes += entry.size
+        expira_em = self._expires_at(entry)
+        if expira_em is not None:
+            heapq.heappush(self._expiry, (expira_em, next(self._expiry_seq), key))
+            if len(self._expiry) > 2 * len(self._entries) + 64:
+                self._rebuild_expiry()
+
+    def _expires_at(self, entry: CacheEntry) -> Optional[float]:
+        ttl = self.namespace_ttls.get(entry.namespace)
+        return entry.stored_mono + ttl if ttl is not None else None
+
+    def _rebuild_expiry(self):
+        """Refaz o heap só com as entradas vivas (limita o acúmulo de itens de entradas substituídas)"""
+        self._expiry = [(self._expires_at(entry), next(self._expiry_seq), key)
+                        for key, entry in self._entries.items() if entry.namespace in self.namespace_ttls]
+        heapq.heapify(self._expiry)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def lookup(self, key: str, timeout: Optional[int] = None) -> Tuple[bool, Any]:
+        """(hit, valor) respeitando o TTL do namespace (ou 'timeout'); entradas vencidas são removidas"""
+        staged = self._staged(key)
+        if staged is not None:
+            return staged.lookup(key, timeout)
+        with self._lock:
+            entry = self._entries.get(key)
+            namespace = entry.namespace if entry is not None else self.namespace_of(key)
+            if entry is not None:
+                ttl = self._ttl(namespace, timeout)
+                agora = time.monotonic()
+                if ttl is None or agora - entry.stored_mono < ttl:
+                    self._entries.move_to_end(key)
+                    entry.last_access = agora
+                    entry.hits += 1
+                    self._count(namespace, 'hits')
+                    return True, entry.value
+                self._remove(key, 'expirations')
+            self._count(namespace, 'misses')
+            return False, None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Acesso direto (snapshots validados pela versão): atualiza o LRU, sem TTL nem contadores"""
+        staged = self._staged(key)
+        if staged is not None:
+            return staged.get(key, default)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._entries.move_to_end(key)
+            entry.last_access = time.monotonic()
+            return entry.value
+
+    def timestamp(self, key: str) -> Optional[datetime]:
+        """Momento da gravação (usado como versão dos snapshots)"""
+        staged = self._staged(key)
+        if staged is not None:
+            return staged.timestamp(key)
+        entry = self._entries.get(key)
+        return entry.stored_at if entry is not None else None
+
+    def set(self, key: str, value: Any):
+        stage = getattr(self._local, 'stage', None)
+        if stage is not None:
+            stage.cache.set(key, value)
+            return
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._insert(key, CacheEntry(value, self.namespace_of(key), size))
+            self._enforce_budget(protect=key)
+
+    def resize(self, key: str):
+        """Remede uma entrada alterada no lugar (ex: colunas anexadas a um snapshot já em cache)"""
+        staged = self._staged(key)
+        if staged is not None:
+            staged.resize(key)
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+        size = estimate_size(entry.value)
+        with self._lock:
+            if self._entries.get(key) is entry:
+                self._bytes += size - entry.size
+                entry.size = size
+                self._enforce_budget(protect=key)
+
+    @contextmanager
+    def staging(self, masked_keys: Iterable[str]):
+        """
+        Nesta thread, gravações vão para uma camada separada e as chaves em masked_keys
+        passam a não existir (forçando recarga/reconstrução); o resto é lido do cache principal.
+        Publique o resultado com publish(stage) antes de sair do bloco.
+        """
+        stage = _Stage(BoundedCache(self.max_bytes, self.namespace_ttls, self.namespace_of), masked_keys)
+        self._local.stage = stage
+        try:
+            yield stage
+        finally:
+            self._local.stage = None
+
+    def publish(self, stage: '_Stage'):
+        """Troca atômica: as entradas do staging entram no cache principal mantendo o momento de gravação (versão)"""
+        entradas = list(stage.cache._entries.items())
+        with self._lock:
+            for key, entry in entradas:
+                if key in self._entries:
+                    self._remove(key)
+                self._insert(key, entry)
+            self._enforce_budget(protect=None)
+
+    def _enforce_budget(self, protect: Optional[str]):
+        """
+        Remove vencidas pelo TTL do namespace (só as que já saíram do heap de vencimentos) e,
+        se ainda acima do orçamento, as menos recentes pela ponta do LRU: custo proporcional
+        ao que sai, não ao total de entradas.
+        """
+        agora = time.monotonic()
+        adiadas = []
+        while self._expiry and self._expiry[0][0] <= agora:
+            item = heapq.heappop(self._expiry)
+            key = item[2]
+            entry = self._entries.get(key)
+            # Item de uma entrada já substituída ou removida
+            if entry is None or self._expires_at(entry) != item[0]:
+                continue
+            if key == protect:
+                adiadas.append(item)
+                continue
+            self._remove(key, 'expirations')
+        for item in adiadas:
+            heapq.heappush(self._expiry, item)
+
+        while self._bytes > self.max_bytes and self._entries:
+            key = next(iter(self._entries))
+            if key == protect:
+                if len(self._entries) == 1:
+                    break
+                self._entries.move_to_end(key)
+                continue
+            logger.debug("Entrada removida do cache (LRU)", extra={'key': key, 'bytes': self._entries[key].size})
+            self._remove(key, 'evictions')
+
+        if self._bytes > self.max_bytes and protect is not None:
+            logger.warning("Entrada maior que o orçamento do cache", extra={
+                'key': protect, 'bytes': self._bytes, 'max_bytes': self.max_bytes
+            })
+
+    def clear(self, namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+        """Remove tudo, um namespace ou uma chave; retorna quantas entradas saíram"""
+        with self._lock:
+            if namespace is None and key is None:
+                total = len(self._entries)
+                self._entries.clear()
+                self._expiry = []
+                self._bytes = 0
+                return total
+            alvos = [k for k, entry in self._entries.items()
+                     if (key is None or k == key) and (namespace is None or entry.namespace == namespace)]
+            for k in alvos:
+                self._remove(k)
+            return len(alvos)
+
+    @property
+    def used_bytes(self) -> int:
+        return self._bytes
+
+    def stats(self) -> Dict:
+        """Entradas (da mais para a menos recente) e totais por namespace"""
+        agora = time.monotonic()
+        with self._lock:
+            entradas = [{
+                'key': key,
+                'namespace': entry.namespace,
+                'size_bytes': entry.size,
+                'age_seconds': round(agora - entry.stored_mono, 1),
+                'idle_seconds': round(agora - entry.last_access, 1),
+                'hits': entry.hits,
+                'ttl_seconds': self.namespace_ttls.get(entry.namespace)
+            } for key, entry in reversed(self._entries.items())]
+            contadores = {ns: dict(valores) for ns, valores in self._counters.items()}
+            usados = self._bytes
+
+        namespaces = {}
+        for entrada in entradas:
+            ns = namespaces.setdefault(entrada['namespace'], {'entries': 0, 'size_bytes': 0})
+            ns['entries'] += 1
+            ns['size_bytes'] += entrada['size_bytes']
+        for namespace in set(namespaces) | set(contadores):
+            ns = namespaces.setdefault(namespace, {'entries': 0, 'size_bytes': 0})
+            ns.update(contadores.get(namespace, {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}))
+            consultas = ns['hits'] + ns['misses']
+            ns['hit_rate'] = round(ns['hits'] / consultas, 4) if consultas else None
+            ns['ttl_seconds'] = self.namespace_ttls.get(namespace)
+
+        return {
+            'max_bytes': self.max_bytes,
+            'used_bytes': usados,
+            'usage': round(usados / self.max_bytes, 4) if self.max_bytes else None,
+            'entries': entradas,
+            'namespaces': namespaces
+        }
+
+class _Stage:
+    """Camada de staging de uma thread: entradas novas e chaves invalidadas"""
+    __slots__ = ('cache', 'masked')
+
+    def __init__(self, cache: BoundedCache, masked_keys: Iterable[str]):
+        self.cache = cache
+        self.masked = set(masked_keys)
@@ -6,7 +6,8 @@ load_dotenv()
 class Config:
     # Configurações Flask
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'papello-dashboard-secret-key-2025'
-    DEBUG = os.environ.get('DEBUG', 'True').lower() == 'true'
+    # Debugger do Werkzeug só com DEBUG=true explícito (nunca em produção)
+    DEBUG = os.environ.get('DEBUG', 'False').lower() == 'true'
     
     # IDs das planilhas Google Sheets - CORRIGIDOS
     CLASSIFICACAO_SHEET_ID = "1ZKgy7jCXUzkU0oaOw5IdnezKuJrCtGOeqiks2el0olE"
@@ -28,12 +29,113 @@ class Config:
         'papello_black': '#000000' # Preto Papello
     }
     
+    # Pesos do score de prioridade dos clientes
+    SCORING_WEIGHTS = {
+        'nivel': {'Premium': 100, 'Gold': 80, 'Silver': 60, 'Bronze': 40},
+        'nivel_default': 40,
+        'risco': {
+            'Novo_Alto': 80, 'Alto': 50, 'Novo_Médio': 40,
+            'Médio': 30, 'Novo_Baixo': 20, 'Baixo': 10
+        },
+        'risco_default': 10,
+        'churn': {
+            'Dormant_Premium': 300, 'Dormant_Gold': 250, 'Dormant_Silver': 200,
+            'Dormant_Bronze': 150, 'Dormant_Novo': 120, 'Inativo': 100, 'Ativo': 0
+        },
+        'churn_default': 0,
+        'top20_bonus': 25
+    }
+    CRITICAL_SCORE_THRESHOLD = 200  # priority_score a partir do qual o cliente é crítico
+    MEDIUM_SCORE_THRESHOLD = 100    # priority_score a partir do qual a prioridade é média
+    SCORING_MAX_SCENARIOS = 20      # limite de cenários por chamada a /api/scoring/simulate
+    SCORING_BATCH_MAX_ROWS = 100000  # limite de linhas por chamada a /api/scoring/batch
+    SCORING_BATCH_MAX_BYTES = 16 * 1024 * 1024  # limite do corpo de /api/scoring/batch
+    
+    # Logging estruturado (app_logging): nível, formato 'text' ou 'json' e amostragem de eventos DEBUG
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+    LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', '0.1'))
+    
+    # Métricas de desempenho (/api/metrics); desligadas, o custo por chamada é desprezível
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() == 'true'
+    
+    # Profiling sob demanda (profiling.py): '?_profile=1' e amostragem de requisições lentas.
+    # Com PROFILING_TOKEN definido, '?_profile=1' exige o cabeçalho X-Profile-Token.
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False').lower() == 'true'
+    PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN', '')
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0.0'))
+    PROFILING_SLOW_SECONDS = float(os.environ.get('PROFILING_SLOW_SECONDS', '2.0'))
+    PROFILING_DIR = os.environ.get('PROFILING_DIR', 'profiles')
+    PROFILING_MAX_FILES = 50
+    PROFILING_TOP_N = 30
+    
+    # Atualizações ao vivo (/api/stream, live_updates.py). Cada conexão ocupa uma thread do
+    # worker gthread enquanto estiver aberta: o limite por processo deve ficar abaixo de
+    # GUNICORN_THREADS. Após SSE_MAX_SECONDS a conexão é encerrada e o navegador reconecta.
+    SSE_MAX_CONNECTIONS = int(os.environ.get('SSE_MAX_CONNECTIONS', '2'))
+    SSE_HEARTBEAT_SECONDS = 15
+    SSE_MAX_SECONDS = 300
+    SSE_RETRY_MS = 5000
+    
     # Configurações de cache
     CACHE_TIMEOUT = 300  # 5 minutos
+    # Orçamento do cache em memória (por worker); acima dele saem as entradas menos usadas (LRU)
+    CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_MB', '512')) * 1024 * 1024
+    # TTL (s) por namespace do cache; os demais usam o timeout de quem consulta (CACHE_TIMEOUT).
+    # As chaves de 'cmp' e 'analytics' já incluem a versão dos dados: o TTL só limita memória.
+    CACHE_NAMESPACE_TTLS = {
+        'cmp': 900,
+        'analytics': 900
+    }
+    
+    # Pasta com CSVs locais no lugar das planilhas (<aba>.csv e pesquisa_satisfacao.csv).
+    # Vazio = Google Sheets. Usado pelos benchmarks (benchmarks/synthetic_data.py) e para rodar offline.
+    DATA_DIR = os.environ.get('DATA_DIR', '')
     
     # URLs base das planilhas
     SHEETS_BASE_URL = "https://docs.google.com/spreadsheets/d/{}/gviz/tq?tqx=out:csv"
     
+    # Log de ações de CS (SQLite em modo WAL; o JSON legado é migrado na primeira abertura)
+    ACTIONS_DB_PATH = os.environ.get('ACTIONS_DB_PATH', 'cs_actions.db')
+    ACTIONS_LEGACY_JSON = 'cs_actions_log.json'
+    
+    # Fonte da classificação dos clientes: 'planilha' (classificacao_clientes3)
+    # ou 'rfm' (nível/risco/status derivados diretamente de pedidos_com_id2)
+    CLIENTS_SOURCE = os.environ.get('CLIENTS_SOURCE', 'planilha')
+    RFM_PARAMS = {
+        'nivel_cortes': {'Premium': 4.5, 'Gold': 3.5, 'Silver': 2.5},  # média dos scores F e M (1-5)
+        'risco_alto': 2.0,         # recência >= 2x o intervalo esperado de compra
+        'risco_medio': 1.2,
+        'ativo_dias': 90,          # até 90 dias sem comprar: Ativo
+        'dormant_dias': 180,       # acima de 180 dias: Dormant_<nível>
+        'intervalo_padrao': 30,    # intervalo esperado quando não há recompras na base
+        'top_valor_quantil': 0.8   # top 20% em receita recebem top_20_valor = 'Sim'
+    }
+    
+    # Faixas (em dias) do histograma de tempo até a recompra (/api/repurchase-latency)
+    REPURCHASE_LATENCY_BINS = [0, 7, 15, 30, 60, 90, 180, 365]
+    
+    # Modelo de risco de churn (regressão logística sobre features dos pedidos).
+    # Coeficientes ajustados offline com data_utils.fit_churn_model().
+    CHURN_MODEL = {
+        'intercept': -4.0,
+        'coefficients': {
+            'log_dias_sem_compra': 0.9,
+            'log_pedidos': -0.6,
+            'log_intervalo_medio': 0.2,
+            'tendencia_ticket': -0.5,
+            'share_recompra': -1.0
+        }
+    }
+    
+    # Sugestões automáticas de ação (geradas uma vez por snapshot de clientes)
+    SUGGESTION_COOLDOWN_DAYS = 14  # clientes com ação registrada nesse período não recebem sugestão
+    SUGGESTIONS_MAX = 5000
+    
+    # Máximo de widgets por requisição em /api/batch
+    BATCH_MAX_WIDGETS = 20
+    
     # Configurações de paginação
     CLIENTS_PER_PAGE = 10
-    ACTIONS_PER_PAGE = 20
\ No newline at end of file
+    ACTIONS_PER_PAGE = 20
+    ACTIONS_MAX_PER_PAGE = 200
\ No newline at end of file
@@ -2,27 +2,50 @@ import pandas as pd
 import numpy as np
 import requests
 from datetime import datetime, timedelta
-from typing import Optional, Dict, List, Tuple
+from typing import Callable, Optional, Dict, List, Tuple
 from config import Config
+import actions_store
+import cache_store
+import metrics
+from app_logging import get_logger
 import re
-import json
 import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
 
-# Cache simples em memória (para produção, usar Redis)
-_cache = {}
-_cache_timestamps = {}
+logger = get_logger('data_utils')
+
+def cache_namespace(key: str) -> str:
+    """Agrupa as chaves do cache para as métricas (planilhas pelo nome da aba, demais pelo prefixo)"""
+    if key.startswith(f"{Config.CLASSIFICACAO_SHEET_ID}_"):
+        return f"sheet_{key[len(Config.CLASSIFICACAO_SHEET_ID) + 1:]}"
+    return key.split('_', 1)[0]
+
+# Cache em memória limitado por bytes, com LRU e TTL por namespace (ver cache_store)
+_cache = cache_store.BoundedCache(Config.CACHE_MAX_BYTES, Config.CACHE_NAMESPACE_TTLS, cache_namespace)
 
 def get_from_cache(key: str, timeout: int = 300):
-    """Recupera dados do cache se ainda válidos"""
-    if key in _cache and key in _cache_timestamps:
-        if datetime.now() - _cache_timestamps[key] < timedelta(seconds=timeout):
-            return _cache[key]
-    return None
+    """Recupera dados do cache se ainda válidos (o TTL do namespace, se configurado, tem precedência)"""
+    hit, data = _cache.lookup(key, timeout)
+    metrics.count_cache(cache_namespace(key), hit)
+    return data if hit else None
 
 def set_cache(key: str, data):
-    """Armazena dados no cache"""
-    _cache[key] = data
-    _cache_timestamps[key] = datetime.now()
+    """Armazena dados no cache (pode remover entradas antigas para respeitar o orçamento)"""
+    _cache.set(key, data)
+
+SATISFACTION_CSV = "pesquisa_satisfacao.csv"
+
+def sheet_csv_source(sheet_id: str, tab_name: str = None, csv_name: str = None) -> str:
+    """URL de exportação CSV da planilha, ou o arquivo local em Config.DATA_DIR quando configurado"""
+    if Config.DATA_DIR:
+        return os.path.join(Config.DATA_DIR, csv_name or f"{tab_name}.csv")
+    if tab_name:
+        return f"https://docs.google.com/spreadsheets/d/{sheet_id}/gviz/tq?tqx=out:csv&sheet={tab_name}"
+    return f"https://docs.google.com/spreadsheets/d/{sheet_id}/gviz/tq?tqx=out:csv"
 
 def load_google_sheet_public(sheet_id: str, tab_name: str = None) -> pd.DataFrame:
     """Carrega planilha pública do Google Sheets com cache e correção de data."""
@@ -34,29 +57,25 @@ def load_google_sheet_public(sheet_id: str, tab_name: str = None) -> pd.DataFram
         return cached_data.copy()
     
     try:
-        if tab_name:
-            url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/gviz/tq?tqx=out:csv&sheet={tab_name}"
-        else:
-            url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/gviz/tq?tqx=out:csv"
-        
-        df = pd.read_csv(url)
+        with metrics.stage('sheet_fetch'):
+            df = pd.read_csv(sheet_csv_source(sheet_id, tab_name))
         df.columns = df.columns.str.strip()
         
         if 'data_pedido_realizado' in df.columns:
-            print("INFO: Convertendo a coluna 'data_pedido_realizado' para datetime...")
             # CORREÇÃO: Removido 'dayfirst=True'. Pandas irá inferir o formato ISO (YYYY-MM-DD) corretamente.
-            df['data_pedido_realizado'] = pd.to_datetime(df['data_pedido_realizado'], errors='coerce')
+            with metrics.stage('parse_dates'):
+                df['data_pedido_realizado'] = pd.to_datetime(df['data_pedido_realizado'], errors='coerce')
             
             validas = df['data_pedido_realizado'].notna().sum()
             total = len(df)
-            print(f"INFO: Conversão de data concluída. {validas}/{total} datas válidas ({(validas/total*100):.1f}%).")
+            logger.info("Datas de pedidos convertidas", extra={'aba': tab_name, 'validas': int(validas), 'total': total})
 
         set_cache(cache_key, df)
         # Retorna uma cópia para o uso
         return df.copy()
         
     except Exception as e:
-        print(f"ERRO: Falha ao carregar a planilha '{tab_name}': {str(e)}")
+        logger.error("Falha ao carregar a planilha", extra={'aba': tab_name, 'error': str(e)})
         return pd.DataFrame()
 
 def load_satisfaction_data() -> pd.DataFrame:
@@ -68,23 +87,24 @@ def load_satisfaction_data() -> pd.DataFrame:
         return cached_data
     
     try:
-        url = f"https://docs.google.com/spreadsheets/d/{Config.PESQUISA_SHEET_ID}/gviz/tq?tqx=out:csv"
-        df = pd.read_csv(url)
+        with metrics.stage('sheet_fetch'):
+            df = pd.read_csv(sheet_csv_source(Config.PESQUISA_SHEET_ID, csv_name=SATISFACTION_CSV))
         df.columns = df.columns.str.strip()
         
         date_cols = [col for col in df.columns if any(x in col.lower() for x in ['carimbo', 'data', 'timestamp'])]
         
-        for col in date_cols:
-            df[col] = pd.to_datetime(df[col], format='%d/%m/%Y %H:%M:%S', errors='coerce')
-            mask_null = df[col].isnull()
-            if mask_null.any():
-                df.loc[mask_null, col] = pd.to_datetime(df.loc[mask_null, col], format='%d/%m/%Y', errors='coerce')
+        with metrics.stage('parse_dates'):
+            for col in date_cols:
+                df[col] = pd.to_datetime(df[col], format='%d/%m/%Y %H:%M:%S', errors='coerce')
+                mask_null = df[col].isnull()
+                if mask_null.any():
+                    df.loc[mask_null, col] = pd.to_datetime(df.loc[mask_null, col], format='%d/%m/%Y', errors='coerce')
         
         set_cache(cache_key, df)
         return df.copy()
         
     except Exception as e:
-        print(f"Erro ao carregar dados de satisfação: {str(e)}")
+        logger.error("Erro ao carregar dados de satisfação", extra={'error': str(e)})
         return pd.DataFrame()
 
 def convert_text_score_to_number(text_score) -> float:
@@ -159,204 +179,1875 @@ def categorize_nps_from_text(text_score) -> str:
     
     return "Indefinido"
 
+def priority_score_breakdown(row, weights: Optional[Dict] = None) -> Dict[str, float]:
+    """Decompõe o score de prioridade nas parcelas de nível, risco, churn e top 20"""
+    weights = weights or Config.SCORING_WEIGHTS
+    nivel = row.get('nivel_cliente', 'Bronze')
+    risco = row.get('risco_recencia', 'Baixo')
+    churn = row.get('status_churn', 'Ativo')
+    top20 = 1 if row.get('top_20_valor', 'Não') == 'Sim' else 0
+    return {
+        'nivel': float(weights['nivel'].get(nivel, weights['nivel_default'])),
+        'risco': float(weights['risco'].get(risco, weights['risco_default'])),
+        'churn': float(weights['churn'].get(churn, weights['churn_default'])),
+        'top20': float(top20 * weights['top20_bonus'])
+    }
+
 def calculate_priority_score(row) -> float:
     try:
-        priority_weights = {'Premium': 100, 'Gold': 80, 'Silver': 60, 'Bronze': 40}
-        churn_weights = {
-            'Dormant_Premium': 300, 'Dormant_Gold': 250, 'Dormant_Silver': 200,
-            'Dormant_Bronze': 150, 'Dormant_Novo': 120, 'Inativo': 100, 'Ativo': 0
-        }
-        risk_weights = {
-            'Novo_Alto': 80, 'Alto': 50, 'Novo_Médio': 40,
-            'Médio': 30, 'Novo_Baixo': 20, 'Baixo': 10
-        }
-        nivel = row.get('nivel_cliente', 'Bronze')
-        risco = row.get('risco_recencia', 'Baixo')
-        churn = row.get('status_churn', 'Ativo')
-        top20 = 1 if row.get('top_20_valor', 'Não') == 'Sim' else 0
-        return float(priority_weights.get(nivel, 40) + risk_weights.get(risco, 10) + churn_weights.get(churn, 0) + top20 * 25)
+        return float(sum(priority_score_breakdown(row).values()))
     except:
         return 0
 
 
-def calculate_satisfaction_metrics(df_satisfacao: pd.DataFrame, column_name: str, 
-                                 is_nps: bool = False, data_inicio=None, data_fim=None) -> Dict:
-    """Calcula métricas de satisfação com comparação temporal"""
+# === SCORE VETORIZADO E SIMULAÇÃO DE PESOS ===
+
+SCORE_DIMENSIONS = [
+    ('nivel', 'nivel_cliente'),
+    ('risco', 'risco_recencia'),
+    ('churn', 'status_churn')
+]
+
+def encode_score_columns(df_clientes: pd.DataFrame) -> Dict:
+    """Fatoriza as colunas do score (códigos inteiros + categorias) uma única vez"""
+    encoded = {}
+    for dimension, column in SCORE_DIMENSIONS:
+        if column in df_clientes.columns:
+            codes, uniques = pd.factorize(df_clientes[column])
+            encoded[dimension] = (codes, list(uniques))
+        else:
+            encoded[dimension] = (np.full(len(df_clientes), -1), [])
+    if 'top_20_valor' in df_clientes.columns:
+        encoded['top20'] = (df_clientes['top_20_valor'] == 'Sim').to_numpy()
+    else:
+        encoded['top20'] = np.zeros(len(df_clientes), dtype=bool)
+    return encoded
+
+def _weights_lookup(weight_sets: List[Dict], dimension: str, uniques: List) -> np.ndarray:
+    """Tabela (cenários x categorias) com os pesos; a última coluna é o default (código -1)"""
+    return np.array([
+        [weights[dimension].get(valor, weights[f"{dimension}_default"]) for valor in uniques]
+        + [weights[f"{dimension}_default"]]
+        for weights in weight_sets
+    ], dtype=float)
+
+def scores_from_codes(encoded: Dict, weight_sets: List[Dict]) -> np.ndarray:
+    """Calcula o score de todos os clientes para vários conjuntos de pesos (matriz cenários x clientes)"""
+    scores = None
+    for dimension, _ in SCORE_DIMENSIONS:
+        codes, uniques = encoded[dimension]
+        parcela = _weights_lookup(weight_sets, dimension, uniques)[:, codes]
+        scores = parcela if scores is None else scores + parcela
+    bonus = np.array([weights['top20_bonus'] for weights in weight_sets], dtype=float)
+    return scores + bonus[:, None] * encoded['top20']
+
+@metrics.timed('priority_scoring')
+def compute_priority_scores(df_clientes: pd.DataFrame, weights: Optional[Dict] = None) -> np.ndarray:
+    """Versão vetorizada de calculate_priority_score para um DataFrame inteiro"""
+    weights = weights or Config.SCORING_WEIGHTS
+    return scores_from_codes(encode_score_columns(df_clientes), [weights])[0]
+
+SCORING_BATCH_COLUMNS = ['nivel_cliente', 'risco_recencia', 'status_churn', 'top_20_valor']
+
+def build_scoring_frame(records: List) -> pd.DataFrame:
+    """
+    Monta o DataFrame para pontuação em lote a partir de uma lista de objetos
+    ou de tuplas (nivel_cliente, risco_recencia, status_churn, top_20_valor).
+    """
+    if not isinstance(records, list):
+        raise ValueError("O corpo deve ser uma lista de registros")
+    if not records:
+        return pd.DataFrame(columns=SCORING_BATCH_COLUMNS)
+    if all(isinstance(record, dict) for record in records):
+        return pd.DataFrame.from_records(records)
+    if all(isinstance(record, (list, tuple)) and len(record) <= len(SCORING_BATCH_COLUMNS) for record in records):
+        return pd.DataFrame.from_records(records, columns=SCORING_BATCH_COLUMNS[:max(len(r) for r in records)])
+    raise ValueError("Registros devem ser todos objetos ou todos tuplas de até 4 campos")
+
+def merge_scoring_weights(overrides: Dict, base: Optional[Dict] = None) -> Dict:
+    """Aplica pesos alternativos (parciais) sobre os pesos configurados. Levanta ValueError se inválidos."""
+    base = base or Config.SCORING_WEIGHTS
+    merged = {key: (dict(value) if isinstance(value, dict) else value) for key, value in base.items()}
+    for key, value in (overrides or {}).items():
+        if key not in merged:
+            raise ValueError(f"Peso desconhecido: {key}")
+        if isinstance(merged[key], dict):
+            if not isinstance(value, dict):
+                raise ValueError(f"'{key}' deve ser um objeto categoria -> peso")
+            for categoria, peso in value.items():
+                if not isinstance(peso, (int, float)) or isinstance(peso, bool):
+                    raise ValueError(f"Peso inválido para {key}.{categoria}: {peso!r}")
+                merged[key][categoria] = float(peso)
+        else:
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                raise ValueError(f"Peso inválido para {key}: {value!r}")
+            merged[key] = float(value)
+    return merged
+
+def simulate_scoring(scenarios: List[Dict], top_n: int = 20, threshold: Optional[float] = None) -> Optional[Dict]:
+    """
+    Simula cenários de pesos sobre todos os clientes numa única passada vetorizada.
+    Retorna, por cenário, clientes críticos, receita em risco e mudanças no top N.
+    """
+    snapshot = get_clients_snapshot()
+    if snapshot is None:
+        return None
+
+    threshold = Config.CRITICAL_SCORE_THRESHOLD if threshold is None else float(threshold)
+    df_clientes = snapshot['df']
+    weight_sets = [Config.SCORING_WEIGHTS] + [
+        merge_scoring_weights(scenario.get('weights', {})) for scenario in scenarios
+    ]
+
+    # Linha 0 = pesos atuais; demais linhas = cenários
+    scores = scores_from_codes(snapshot['score_codes'], weight_sets)
+    criticos = scores >= threshold
+    receita = df_clientes['receita_num'].to_numpy(dtype=float)
+    critical_counts = criticos.sum(axis=1)
+    revenue_at_risk = criticos.astype(float) @ receita
+
+    top_n = max(1, min(int(top_n), len(df_clientes)))
+    top_sets = [np.argsort(-linha, kind='stable')[:top_n] for linha in scores]
+    id_column = 'cliente_unico_id' if 'cliente_unico_id' in df_clientes.columns else 'nome'
+
+    def describe(posicoes, linha):
+        return [{
+            'id': str(df_clientes[id_column].iat[pos]) if id_column in df_clientes.columns else int(pos),
+            'nome': str(df_clientes['nome'].iat[pos]) if 'nome' in df_clientes.columns else '',
+            'score': float(scores[linha, pos]),
+            'score_atual': float(scores[0, pos])
+        } for pos in posicoes]
+
+    baseline = {
+        'critical_count': int(critical_counts[0]),
+        'revenue_at_risk': float(revenue_at_risk[0])
+    }
+    results = []
+    for i, scenario in enumerate(scenarios, start=1):
+        entraram = np.setdiff1d(top_sets[i], top_sets[0], assume_unique=True)
+        sairam = np.setdiff1d(top_sets[0], top_sets[i], assume_unique=True)
+        results.append({
+            'name': scenario.get('name', f'cenario_{i}'),
+            'critical_count': int(critical_counts[i]),
+            'critical_delta': int(critical_counts[i] - critical_counts[0]),
+            'revenue_at_risk': float(revenue_at_risk[i]),
+            'revenue_delta': float(revenue_at_risk[i] - revenue_at_risk[0]),
+            'clients_changed': int((scores[i] != scores[0]).sum()),
+            'top_n': {
+                'entered': describe(entraram, i),
+                'left': describe(sairam, i)
+            }
+        })
+
+    return {
+        'threshold': threshold,
+        'top_n': top_n,
+        'total_clients': len(df_clientes),
+        'baseline': baseline,
+        'scenarios': results
+    }
+
+# === SNAPSHOT DE CLIENTES E SEGMENTOS MATERIALIZADOS ===
+
+CLIENTES_TAB = "classificacao_clientes3"
+NIVEIS_PREMIUM = ['Premium', 'Gold']
+RISCOS_ALTO_MEDIO = ['Alto', 'Novo_Alto', 'Médio', 'Novo_Médio']
+CRITICAL_SCORE_THRESHOLD = Config.CRITICAL_SCORE_THRESHOLD
+
+def build_client_segments(df_clientes: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Materializa as máscaras booleanas dos segmentos nomeados (uma passada por coluna)"""
+    nivel = df_clientes['nivel_cliente'].fillna('').astype(str)
+    risco = df_clientes['risco_recencia'].fillna('').astype(str)
+    status = df_clientes['status_churn'].fillna('').astype(str)
+
+    premium = nivel.isin(NIVEIS_PREMIUM).to_numpy()
+    risco_alto_medio = risco.isin(RISCOS_ALTO_MEDIO).to_numpy()
+
+    segments = {
+        'premium': premium,
+        'risco_alto_medio': risco_alto_medio,
+        'premium_em_risco': premium & risco_alto_medio,
+        'ativos': (status == 'Ativo').to_numpy(),
+        'inativos': (status == 'Inativo').to_numpy(),
+        'dormant': status.str.contains('Dormant', regex=False).to_numpy(),
+        'top20': (df_clientes['top_20_valor'] == 'Sim').to_numpy() if 'top_20_valor' in df_clientes.columns
+                 else np.zeros(len(df_clientes), dtype=bool),
+        'criticos': (df_clientes['priority_score'] >= CRITICAL_SCORE_THRESHOLD).to_numpy(),
+    }
+
+    # Um segmento por nível de cliente (nivel_Premium, nivel_Gold, ...)
+    for valor in nivel.unique():
+        if valor:
+            segments[f"nivel_{valor}"] = (nivel == valor).to_numpy()
+
+    return segments
+
+def combine_segments(segments: Dict[str, np.ndarray], names: List[str]) -> np.ndarray:
+    """Combina segmentos pré-calculados com AND. Levanta KeyError para segmento desconhecido."""
+    mask = None
+    for name in names:
+        if name not in segments:
+            raise KeyError(name)
+        mask = segments[name] if mask is None else (mask & segments[name])
+    return mask
+
+# === REPONTUAÇÃO INCREMENTAL ENTRE SNAPSHOTS ===
+
+SCORE_COLUMNS = ['nivel_cliente', 'risco_recencia', 'status_churn', 'top_20_valor']
+
+# Último snapshot pontuado (sobrevive ao clear_cache para servir de base ao diff)
+_last_scored_clients = None
+
+def score_fingerprints(df_clientes: pd.DataFrame) -> np.ndarray:
+    """Hash por linha das colunas que influenciam o score de prioridade"""
+    cols = [col for col in SCORE_COLUMNS if col in df_clientes.columns]
+    if not cols:
+        return np.zeros(len(df_clientes), dtype=np.uint64)
+    return pd.util.hash_pandas_object(df_clientes[cols].fillna('').astype(str), index=False).to_numpy()
+
+@metrics.timed('priority_rescore')
+def rescore_clients_incremental(df_clientes: pd.DataFrame, previous: Optional[Dict]) -> Dict:
+    """
+    Pontua apenas as linhas novas ou alteradas em relação ao snapshot anterior
+    e corrige a ordem de prioridade por merge, sem reordenar a base inteira.
+    """
+    total = len(df_clientes)
+    fingerprints = score_fingerprints(df_clientes)
+    ids = (normalize_client_ids(df_clientes['cliente_unico_id']).to_numpy()
+           if 'cliente_unico_id' in df_clientes.columns else None)
+
+    scores = np.zeros(total, dtype=float)
+    unchanged = np.zeros(total, dtype=bool)
+    prev_pos = np.full(total, -1)
+
+    if previous is not None and ids is not None and previous.get('ids') is not None:
+        prev_ids = pd.Series(previous['ids'])
+        primeiros = ~prev_ids.duplicated().to_numpy()
+        prev_index = pd.Index(prev_ids[primeiros])
+        prev_positions = np.flatnonzero(primeiros)
+
+        found = prev_index.get_indexer(ids)
+        # IDs duplicados no snapshot novo são sempre repontuados
+        found[pd.Series(ids).duplicated().to_numpy()] = -1
+        mask_found = found >= 0
+        prev_pos[mask_found] = prev_positions[found[mask_found]]
+
+        unchanged[mask_found] = previous['fingerprints'][prev_pos[mask_found]] == fingerprints[mask_found]
+        scores[unchanged] = previous['scores'][prev_pos[unchanged]]
+
+    changed = np.flatnonzero(~unchanged)
+    if len(changed) > 0:
+        scores[changed] = compute_priority_scores(df_clientes.iloc[changed])
+
+    if previous is not None and unchanged.any():
+        # Linhas inalteradas mantêm a ordem relativa do snapshot anterior
+        prev_to_new = np.full(len(previous['scores']), -1)
+        prev_to_new[prev_pos[unchanged]] = np.flatnonzero(unchanged)
+        kept = prev_to_new[previous['order']]
+        kept = kept[kept >= 0]
+
+        changed_sorted = changed[np.argsort(-scores[changed], kind='stable')]
+        insert_at = np.searchsorted(-scores[kept], -scores[changed_sorted], side='right')
+        order = np.insert(kept, insert_at, changed_sorted)
+    else:
+        order = np.argsort(-scores, kind='stable')
+
+    return {
+        'scores': scores,
+        'order': order,
+        'ids': ids,
+        'fingerprints': fingerprints,
+        'stats': {
+            'total': total,
+            'rescored': int(len(changed)),
+            'reused': int(total - len(changed))
+        }
+    }
+
+def get_clients_snapshot() -> Optional[Dict]:
+    """
+    Snapshot de clientes do dataset fixado na requisição atual, já com satisfação e risco de
+    churn por cliente (ou o do cache, sem essas colunas, fora de requisições)
+    """
+    dataset = current_dataset()
+    if dataset is not None:
+        return dataset['clients']
+    return _load_clients_snapshot()
+
+def _load_clients_snapshot() -> Optional[Dict]:
+    """
+    Retorna o snapshot de clientes pontuado (priority_score, receita_num) com os
+    segmentos materializados. É recalculado apenas quando a planilha é recarregada.
+    """
+    # Com CLIENTS_SOURCE='rfm' a classificação vem dos pedidos e a versão segue a planilha de pedidos
+    rfm_source = Config.CLIENTS_SOURCE == 'rfm'
+    sheet_key = f"{Config.CLASSIFICACAO_SHEET_ID}_{PEDIDOS_TAB if rfm_source else CLIENTES_TAB}"
+    snapshot = _cache.get('clients_snapshot')
+    if (snapshot is not None
+            and get_from_cache(sheet_key, Config.CACHE_TIMEOUT) is not None
+            and snapshot['version'] == _cache.timestamp(sheet_key)):
+        return snapshot
+
+    if rfm_source:
+        rfm = get_rfm_snapshot()
+        df_clientes = rfm['df'].copy() if rfm is not None else pd.DataFrame()
+    else:
+        df_clientes = load_google_sheet_public(Config.CLASSIFICACAO_SHEET_ID, CLIENTES_TAB)
+    if df_clientes.empty:
+        return None
+
+    global _last_scored_clients
+    df_clientes = df_clientes.reset_index(drop=True)
+    scoring = rescore_clients_incremental(df_clientes, _last_scored_clients)
+    df_clientes['priority_score'] = scoring['scores']
+    _last_scored_clients = {key: scoring[key] for key in ('scores', 'order', 'ids', 'fingerprints')}
+    logger.info("Score de prioridade atualizado", extra=dict(scoring['stats']))
+    df_clientes['receita_num'] = pd.to_numeric(
+        df_clientes['receita'].astype(str).str.replace(',', '.'),
+        errors='coerce'
+    ).fillna(0)
+
+    snapshot = {
+        'version': _cache.timestamp(sheet_key),
+        'df': df_clientes,
+        'segments': build_client_segments(df_clientes),
+        'index': build_id_index(df_clientes),
+        'ids': scoring['ids'],
+        'order': scoring['order'],
+        'scoring': scoring['stats'],
+        'score_codes': encode_score_columns(df_clientes)
+    }
+    set_cache('clients_snapshot', snapshot)
+    return snapshot
+
+
+# === SNAPSHOT DE PEDIDOS E ÍNDICES POR CLIENTE ===
+
+PEDIDOS_TAB = "pedidos_com_id2"
+
+def normalize_client_ids(ids: pd.Series) -> pd.Series:
+    """Normaliza IDs de cliente como texto (planilhas podem trazer '123.0')"""
+    return ids.astype(str).str.strip().str.replace(r'\.0$', '', regex=True)
+
+def build_id_index(df: pd.DataFrame, column: str = 'cliente_unico_id') -> Dict[str, np.ndarray]:
+    """Índice hash: id do cliente -> posições das linhas no DataFrame"""
+    if column not in df.columns or df.empty:
+        return {}
+    ids = normalize_client_ids(df[column])
+    index = ids.groupby(ids, sort=False).indices
+    for invalido in ('', 'nan', 'None'):
+        index.pop(invalido, None)
+    return index
+
+def parse_order_values(valores: pd.Series) -> pd.Series:
+    """Converte 'valor_do_pedido' (texto com vírgula) para numérico"""
+    return pd.to_numeric(
+        valores.astype(str).str.replace(',', '.').str.replace(r'[^\d.]', '', regex=True),
+        errors='coerce'
+    ).fillna(0)
+
+def get_orders_snapshot() -> Optional[Dict]:
+    """Snapshot de pedidos do dataset fixado na requisição atual (ou o do cache, fora de requisições)"""
+    dataset = current_dataset()
+    if dataset is not None:
+        return dataset['orders']
+    return _load_orders_snapshot()
+
+def _load_orders_snapshot() -> Optional[Dict]:
+    """
+    Retorna o snapshot de pedidos com valor/status normalizados e o índice
+    cliente_unico_id -> posições. Recalculado apenas quando a planilha é recarregada.
+    """
+    sheet_key = f"{Config.CLASSIFICACAO_SHEET_ID}_{PEDIDOS_TAB}"
+    snapshot = _cache.get('orders_snapshot')
+    if (snapshot is not None
+            and get_from_cache(sheet_key, Config.CACHE_TIMEOUT) is not None
+            and snapshot['version'] == _cache.timestamp(sheet_key)):
+        return snapshot
+
+    df_pedidos = load_google_sheet_public(Config.CLASSIFICACAO_SHEET_ID, PEDIDOS_TAB)
+    if df_pedidos.empty:
+        return None
+
+    df_pedidos = df_pedidos.reset_index(drop=True)
+    if 'valor_do_pedido' in df_pedidos.columns:
+        df_pedidos['valor_numerico'] = parse_order_values(df_pedidos['valor_do_pedido'])
+    if 'status_pedido' in df_pedidos.columns:
+        df_pedidos['status_clean'] = df_pedidos['status_pedido'].astype(str).str.strip().str.lower()
+
+    # Posições ordenadas por data: janelas de período viram fatias via searchsorted
+    by_date = np.array([], dtype=int)
+    dates_sorted = np.array([], dtype='datetime64[ns]')
+    if 'data_pedido_realizado' in df_pedidos.columns:
+        datas = df_pedidos['data_pedido_realizado'].to_numpy(dtype='datetime64[ns]')
+        validas = np.flatnonzero(~np.isnat(datas))
+        by_date = validas[np.argsort(datas[validas], kind='stable')]
+        dates_sorted = datas[by_date]
+
+    snapshot = {
+        'version': _cache.timestamp(sheet_key),
+        'df': df_pedidos,
+        'index': build_id_index(df_pedidos),
+        'ids': (normalize_client_ids(df_pedidos['cliente_unico_id']).to_numpy()
+                if 'cliente_unico_id' in df_pedidos.columns else None),
+        'by_date': by_date,
+        'dates_sorted': dates_sorted
+    }
+    set_cache('orders_snapshot', snapshot)
+    return snapshot
+
+# === CLASSIFICAÇÃO RFM DERIVADA DOS PEDIDOS ===
+
+RFM_CARRY_COLUMNS = ['nome', 'email', 'telefone1', 'cpfcnpj', 'cidade', 'estado', 'codigo_vendedor']
+RFM_HASH_COLUMNS = ['cliente_unico_id', 'data_pedido_realizado', 'valor_do_pedido']
+
+# Agregados RFM do último processamento (sobrevive ao clear_cache para permitir atualização incremental)
+_rfm_state = None
+
+def _rfm_row_hashes(df_pedidos: pd.DataFrame) -> np.ndarray:
+    """Hash por linha das colunas que alimentam o RFM (detecta se os pedidos antigos mudaram)"""
+    cols = [col for col in RFM_HASH_COLUMNS if col in df_pedidos.columns]
+    return pd.util.hash_pandas_object(df_pedidos[cols], index=False).to_numpy()
+
+def aggregate_orders_rfm(orders_snapshot: Dict, start: int = 0) -> pd.DataFrame:
+    """Um groupby sobre os pedidos a partir da linha start: primeira/última compra, pedidos e receita por cliente"""
+    df_pedidos = orders_snapshot['df'].iloc[start:]
+    frame = pd.DataFrame({
+        'id': orders_snapshot['ids'][start:],
+        'data': (df_pedidos['data_pedido_realizado'].to_numpy() if 'data_pedido_realizado' in df_pedidos.columns
+                 else np.full(len(df_pedidos), np.datetime64('NaT'), dtype='datetime64[ns]')),
+        'valor': (df_pedidos['valor_numerico'].to_numpy() if 'valor_numerico' in df_pedidos.columns
+                  else np.zeros(len(df_pedidos)))
+    })
+    extras = [col for col in RFM_CARRY_COLUMNS if col in df_pedidos.columns]
+    for col in extras:
+        frame[col] = df_pedidos[col].to_numpy()
+
+    return frame.groupby('id', sort=False).agg(
+        primeira=('data', 'min'),
+        ultima=('data', 'max'),
+        pedidos=('valor', 'size'),
+        monetario=('valor', 'sum'),
+        **{col: (col, 'last') for col in extras}
+    )
+
+def merge_rfm_aggregates(anterior: pd.DataFrame, novos: pd.DataFrame) -> pd.DataFrame:
+    """Combina agregados por cliente (min/max/soma); custo proporcional a clientes + pedidos novos"""
+    if novos.empty:
+        return anterior
+    extras = [col for col in RFM_CARRY_COLUMNS if col in novos.columns or col in anterior.columns]
+    return pd.concat([anterior, novos]).groupby(level=0, sort=False).agg(
+        primeira=('primeira', 'min'),
+        ultima=('ultima', 'max'),
+        pedidos=('pedidos', 'sum'),
+        monetario=('monetario', 'sum'),
+        **{col: (col, 'last') for col in extras}
+    )
+
+def rfm_quantile_scores(valores: np.ndarray, bins: int = 5) -> np.ndarray:
+    """Score 1..bins por quantis (searchsorted nos cortes; empates caem no mesmo bin)"""
+    if len(valores) == 0:
+        return np.array([], dtype=int)
+    cortes = np.quantile(valores, np.linspace(0, 1, bins + 1)[1:-1])
+    return np.searchsorted(cortes, valores, side='right') + 1
+
+def classify_rfm(agg: pd.DataFrame, reference_date, params: Optional[Dict] = None) -> pd.DataFrame:
+    """
+    Deriva nivel_cliente, risco_recencia, status_churn e top_20_valor dos agregados RFM,
+    com as mesmas categorias da planilha classificacao_clientes3.
+    """
+    params = params or Config.RFM_PARAMS
+    referencia = pd.Timestamp(reference_date)
+
+    pedidos = agg['pedidos'].to_numpy()
+    monetario = agg['monetario'].to_numpy(dtype=float)
+    recencia = (referencia - agg['ultima']).dt.days.clip(lower=0)
+    recencia = recencia.fillna(recencia.max() if recencia.notna().any() else 0).to_numpy(dtype=float)
+    intervalo = ((agg['ultima'] - agg['primeira']).dt.days / (agg['pedidos'] - 1)).where(agg['pedidos'] > 1)
+
+    r_score = 6 - rfm_quantile_scores(recencia)  # menos dias sem comprar = score maior
+    f_score = rfm_quantile_scores(pedidos)
+    m_score = rfm_quantile_scores(monetario)
+
+    cortes = params['nivel_cortes']
+    valor_score = (f_score + m_score) / 2
+    nivel = np.select(
+        [valor_score >= cortes['Premium'], valor_score >= cortes['Gold'], valor_score >= cortes['Silver']],
+        ['Premium', 'Gold', 'Silver'], 'Bronze'
+    )
+
+    # Risco: recência relativa ao intervalo de compra esperado (do próprio cliente ou mediano da base)
+    novo = pedidos <= 1
+    intervalo_base = intervalo.median()
+    if pd.isna(intervalo_base):
+        intervalo_base = params['intervalo_padrao']
+    esperado = intervalo.fillna(intervalo_base).clip(lower=1).to_numpy()
+    razao = recencia / esperado
+    risco = np.select([razao >= params['risco_alto'], razao >= params['risco_medio']], ['Alto', 'Médio'], 'Baixo')
+    risco = np.where(novo, np.char.add('Novo_', risco.astype(str)), risco)
+
+    dormant = np.char.add('Dormant_', np.where(novo, 'Novo', nivel).astype(str))
+    status = np.select([recencia <= params['ativo_dias'], recencia <= params['dormant_dias']], ['Ativo', 'Inativo'], '')
+    status = np.where(status == '', dormant, status)
+
+    corte_top = np.quantile(monetario, params['top_valor_quantil']) if len(monetario) else 0
+    extras = [col for col in RFM_CARRY_COLUMNS if col in agg.columns]
+
+    df_rfm = agg[extras].reset_index().rename(columns={'id': 'cliente_unico_id'})
+    df_rfm['nivel_cliente'] = nivel
+    df_rfm['risco_recencia'] = risco
+    df_rfm['status_churn'] = status
+    df_rfm['top_20_valor'] = np.where(monetario >= corte_top, 'Sim', 'Não')
+    df_rfm['receita'] = np.round(monetario, 2)
+    df_rfm['frequency'] = pedidos
+    df_rfm['recency_days'] = recencia.astype(int)
+    df_rfm['ipt_cliente'] = intervalo.round(1).to_numpy()
+    df_rfm['r_score'] = r_score
+    df_rfm['f_score'] = f_score
+    df_rfm['m_score'] = m_score
+    return df_rfm
+
+def get_rfm_snapshot() -> Optional[Dict]:
+    """
+    Classificação RFM de todos os clientes a partir do snapshot de pedidos. Quando a nova
+    planilha só acrescenta pedidos ao final, agrega apenas as linhas novas e combina com os
+    agregados anteriores.
+    """
+    orders_snapshot = get_orders_snapshot()
+    if orders_snapshot is None or orders_snapshot['ids'] is None:
+        return None
+    cached = _cache.get('rfm_snapshot')
+    if cached is not None and cached['version'] == orders_snapshot['version']:
+        return cached
+
+    global _rfm_state
+    df_pedidos = orders_snapshot['df']
+    total = len(df_pedidos)
+    hashes = _rfm_row_hashes(df_pedidos)
+
+    processados = _rfm_state['rows'] if _rfm_state is not None else 0
+    incremental = (_rfm_state is not None and 0 < processados <= total
+                   and hashes[:processados].sum() == _rfm_state['prefix_hash'])
+
+    if incremental:
+        agg = merge_rfm_aggregates(_rfm_state['agg'], aggregate_orders_rfm(orders_snapshot, processados))
+        linhas_novas = total - processados
+    else:
+        agg = aggregate_orders_rfm(orders_snapshot)
+        linhas_novas = total
+    _rfm_state = {'rows': total, 'prefix_hash': hashes.sum(), 'agg': agg}
+
+    referencia = (pd.Timestamp(orders_snapshot['dates_sorted'][-1]) if len(orders_snapshot['dates_sorted'])
+                  else pd.Timestamp(datetime.now()))
+    df_rfm = classify_rfm(agg, referencia)
+    logger.info("RFM classificado", extra={'clientes': len(df_rfm), 'pedidos_agregados': linhas_novas, 'pedidos': total})
+
+    rfm = {
+        'version': orders_snapshot['version'],
+        'df': df_rfm,
+        'reference_date': referencia,
+        'stats': {
+            'clientes': int(len(df_rfm)),
+            'pedidos': int(total),
+            'pedidos_agregados': int(linhas_novas),
+            'incremental': bool(incremental)
+        }
+    }
+    set_cache('rfm_snapshot', rfm)
+    return rfm
+
+def get_rfm_summary() -> Optional[Dict]:
+    """Distribuição da classificação RFM e concordância com a planilha de classificação"""
+    rfm = get_rfm_snapshot()
+    if rfm is None:
+        return None
+    df_rfm = rfm['df']
+    summary = {
+        'reference_date': rfm['reference_date'].strftime('%Y-%m-%d'),
+        'stats': rfm['stats'],
+        'distribution': {
+            col: {str(k): int(v) for k, v in df_rfm[col].value_counts().items()}
+            for col in ('nivel_cliente', 'risco_recencia', 'status_churn', 'top_20_valor')
+        },
+        'agreement': None
+    }
+
+    if Config.CLIENTS_SOURCE != 'rfm':
+        clients_snapshot = get_clients_snapshot()
+        if clients_snapshot is not None and clients_snapshot['ids'] is not None:
+            posicoes = pd.Index(df_rfm['cliente_unico_id']).get_indexer(clients_snapshot['ids'])
+            encontrados = posicoes >= 0
+            agreement = {'clientes_comparados': int(encontrados.sum())}
+            for col in ('nivel_cliente', 'risco_recencia', 'status_churn'):
+                planilha = clients_snapshot['df'][col].astype(str).to_numpy()[encontrados]
+                derivado = df_rfm[col].to_numpy()[posicoes[encontrados]]
+                agreement[col] = float((planilha == derivado).mean() * 100) if encontrados.any() else None
+            summary['agreement'] = agreement
+    return summary
+
+def get_client_360(client_id: str) -> Optional[Dict]:
+    """
+    Visão 360 de um cliente: linha da classificação, composição do score,
+    histórico de pedidos e estatísticas de recompra. Custo O(pedidos do cliente).
+    """
+    clients_snapshot = get_clients_snapshot()
+    if clients_snapshot is None:
+        return None
+
+    client_id = normalize_client_ids(pd.Series([client_id])).iloc[0]
+    posicoes = clients_snapshot['index'].get(client_id)
+    if posicoes is None or len(posicoes) == 0:
+        return None
+
+    cliente_row = clients_snapshot['df'].iloc[posicoes[0]]
+    cliente = clients_snapshot['df'].iloc[[posicoes[0]]].drop(columns=['receita_num']).fillna('').to_dict('records')[0]
+
+    orders_snapshot = get_orders_snapshot()
+    pedidos = pd.DataFrame()
+    if orders_snapshot is not None:
+        posicoes_pedidos = orders_snapshot['index'].get(client_id)
+        if posicoes_pedidos is not None:
+            pedidos = orders_snapshot['df'].iloc[posicoes_pedidos]
+
+    repurchase = {
+        'total_pedidos': len(pedidos),
+        'pedidos_primeira': 0,
+        'pedidos_recompra': 0,
+        'valor_total': 0.0,
+        'ticket_medio': 0.0,
+        'primeiro_pedido': None,
+        'ultimo_pedido': None,
+        'intervalo_medio_dias': None
+    }
+    historico = []
+
+    if not pedidos.empty:
+        if 'data_pedido_realizado' in pedidos.columns:
+            pedidos = pedidos.sort_values('data_pedido_realizado', ascending=False)
+            datas = pedidos['data_pedido_realizado'].dropna()
+            if len(datas) > 0:
+                repurchase['primeiro_pedido'] = datas.min().strftime('%d/%m/%Y')
+                repurchase['ultimo_pedido'] = datas.max().strftime('%d/%m/%Y')
+            if len(datas) > 1:
+                gaps = datas.sort_values().diff().dt.days.dropna()
+                repurchase['intervalo_medio_dias'] = float(gaps.mean())
+        if 'status_clean' in pedidos.columns:
+            repurchase['pedidos_primeira'] = int((pedidos['status_clean'] == 'primeiro').sum())
+            repurchase['pedidos_recompra'] = int((pedidos['status_clean'] == 'recompra').sum())
+        if 'valor_numerico' in pedidos.columns:
+            repurchase['valor_total'] = float(pedidos['valor_numerico'].sum())
+            repurchase['ticket_medio'] = float(pedidos['valor_numerico'].mean())
+
+        historico_df = pedidos.drop(columns=['status_clean'], errors='ignore').copy()
+        if 'data_pedido_realizado' in historico_df.columns:
+            historico_df['data_pedido_realizado'] = historico_df['data_pedido_realizado'].dt.strftime('%Y-%m-%d')
+        historico = historico_df.fillna('').to_dict('records')
+
+    breakdown = priority_score_breakdown(cliente_row)
+
+    return {
+        'cliente': cliente,
+        'priority': {
+            'score': float(cliente_row['priority_score']),
+            'breakdown': breakdown
+        },
+        'pedidos': historico,
+        'recompra': repurchase
+    }
+
+
+# === MODELO DE RISCO DE CHURN ===
+
+CHURN_FEATURES = ['log_dias_sem_compra', 'log_pedidos', 'log_intervalo_medio', 'tendencia_ticket', 'share_recompra']
+
+def build_churn_features(orders_snapshot: Dict, reference_date=None) -> pd.DataFrame:
+    """
+    Features por cliente a partir dos pedidos até reference_date (padrão: último pedido
+    da base), num único groupby sobre os pedidos já ordenados por data.
+    """
+    posicoes = orders_snapshot['by_date']
+    datas = orders_snapshot['dates_sorted']
+    if reference_date is not None:
+        limite = np.searchsorted(datas, np.datetime64(pd.Timestamp(reference_date)), side='right')
+        posicoes, datas = posicoes[:limite], datas[:limite]
+    if len(posicoes) == 0 or orders_snapshot['ids'] is None:
+        return pd.DataFrame(columns=CHURN_FEATURES)
+
+    df_pedidos = orders_snapshot['df']
+    valores = df_pedidos['valor_numerico'].to_numpy()[posicoes] if 'valor_numerico' in df_pedidos.columns \
+        else np.zeros(len(posicoes))
+    recompra = (df_pedidos['status_clean'].to_numpy()[posicoes] == 'recompra') if 'status_clean' in df_pedidos.columns \
+        else np.zeros(len(posicoes), dtype=bool)
+
+    frame = pd.DataFrame({
+        'id': orders_snapshot['ids'][posicoes],
+        'data': datas,
+        'valor': valores,
+        'recompra': recompra
+    })
+    agg = frame.groupby('id', sort=False).agg(
+        primeira=('data', 'min'),
+        ultima=('data', 'max'),
+        pedidos=('data', 'size'),
+        ticket_medio=('valor', 'mean'),
+        ultimo_valor=('valor', 'last'),
+        share_recompra=('recompra', 'mean')
+    )
+
+    referencia = pd.Timestamp(reference_date) if reference_date is not None else pd.Timestamp(datas[-1])
+    dias_sem_compra = (referencia - agg['ultima']).dt.days.clip(lower=0)
+    intervalo = ((agg['ultima'] - agg['primeira']).dt.days / (agg['pedidos'] - 1)).where(agg['pedidos'] > 1, 0)
+    ticket_medio = agg['ticket_medio'].replace(0, np.nan)
+    tendencia = (agg['ultimo_valor'] / ticket_medio - 1).fillna(0).clip(-1, 2)
+
+    features = pd.DataFrame({
+        'log_dias_sem_compra': np.log1p(dias_sem_compra),
+        'log_pedidos': np.log1p(agg['pedidos']),
+        'log_intervalo_medio': np.log1p(intervalo),
+        'tendencia_ticket': tendencia,
+        'share_recompra': agg['share_recompra'].astype(float)
+    }, index=agg.index)
+    features['dias_sem_compra'] = dias_sem_compra
+    return features
+
+def predict_churn(features: pd.DataFrame, model: Optional[Dict] = None) -> np.ndarray:
+    """Probabilidade de churn (sigmoide de X·w + b) para todos os clientes de uma vez"""
+    model = model or Config.CHURN_MODEL
+    if features.empty:
+        return np.array([], dtype=float)
+    pesos = np.array([model['coefficients'][name] for name in CHURN_FEATURES], dtype=float)
+    logits = features[CHURN_FEATURES].to_numpy(dtype=float) @ pesos + model['intercept']
+    return 1.0 / (1.0 + np.exp(-logits))
+
+def fit_churn_model(horizon_days: int = 90, iterations: int = 2000, learning_rate: float = 0.1,
+                    l2: float = 0.01) -> Optional[Dict]:
+    """
+    Ajuste offline dos coeficientes (gradiente descendente em NumPy). Usa como rótulo
+    'não comprou nos horizon_days seguintes ao corte'. Copie o resultado para Config.CHURN_MODEL.
+    """
+    orders_snapshot = get_orders_snapshot()
+    if orders_snapshot is None or len(orders_snapshot['dates_sorted']) == 0:
+        return None
+
+    corte = pd.Timestamp(orders_snapshot['dates_sorted'][-1]) - pd.Timedelta(days=horizon_days)
+    features = build_churn_features(orders_snapshot, corte)
+    if features.empty:
+        return None
+    posteriores = orders_in_window(orders_snapshot, corte + pd.Timedelta(seconds=1), orders_snapshot['dates_sorted'][-1])
+    voltaram = set(orders_snapshot['ids'][posteriores])
+    y = (~features.index.isin(list(voltaram))).astype(float)
+
+    X = features[CHURN_FEATURES].to_numpy(dtype=float)
+    media, desvio = X.mean(axis=0), X.std(axis=0)
+    desvio[desvio == 0] = 1.0
+    Xs = (X - media) / desvio
+
+    w, b = np.zeros(Xs.shape[1]), 0.0
+    for _ in range(iterations):
+        p = 1.0 / (1.0 + np.exp(-(Xs @ w + b)))
+        erro = p - y
+        w -= learning_rate * (Xs.T @ erro / len(y) + l2 * w)
+        b -= learning_rate * erro.mean()
+
+    # Volta para a escala original das features
+    pesos = w / desvio
+    intercept = b - float((media * pesos).sum())
+    return {
+        'intercept': round(float(intercept), 4),
+        'coefficients': {name: round(float(peso), 4) for name, peso in zip(CHURN_FEATURES, pesos)},
+        'training': {'clientes': int(len(y)), 'taxa_churn': float(y.mean()), 'corte': corte.strftime('%Y-%m-%d')}
+    }
+
+def get_churn_scores(orders_snapshot: Optional[Dict] = None) -> Optional[Dict]:
+    """Scores de churn por cliente, calculados uma vez por snapshot de pedidos"""
+    orders_snapshot = orders_snapshot or get_orders_snapshot()
+    if orders_snapshot is None:
+        return None
+    cached = _cache.get('churn_scores')
+    if cached is not None and cached['version'] == orders_snapshot['version']:
+        return cached
+
+    features = build_churn_features(orders_snapshot)
+    churn = {
+        'version': orders_snapshot['version'],
+        'features': features,
+        'scores': pd.Series(predict_churn(features), index=features.index, dtype=float)
+    }
+    set_cache('churn_scores', churn)
+    return churn
+
+def build_client_churn_risk(clients_snapshot: Dict, churn: Optional[Dict]) -> np.ndarray:
+    """Risco de churn alinhado às linhas do snapshot de clientes (NaN para quem não tem pedidos)"""
+    total = len(clients_snapshot['df'])
+    if churn is None or clients_snapshot['ids'] is None:
+        return np.full(total, np.nan)
+    posicoes = churn['scores'].index.get_indexer(clients_snapshot['ids'])
+    return np.where(posicoes >= 0, churn['scores'].to_numpy()[posicoes], np.nan)
+
+def client_churn_risk(clients_snapshot: Dict) -> np.ndarray:
+    """
+    Risco de churn por cliente. O snapshot do dataset publicado já o traz calculado; fora
+    dele (jobs, aquecimento) é calculado na hora, sem alterar o snapshot compartilhado.
+    """
+    risco = clients_snapshot.get('churn_risk')
+    if risco is not None:
+        return risco
+    return build_client_churn_risk(clients_snapshot, get_churn_scores())
+
+
+# === ENGINE DE ANALYTICS (PERÍODO / COMPARAÇÃO / SEGMENTO) ===
+
+ACTION_DONE_STATUSES = ['executada', 'concluida', 'concluída', 'done']
+
+# Segmentos do seletor da página de analytics -> segmentos materializados do snapshot
+ANALYTICS_SEGMENTS = {
+    'all': None,
+    'premium': 'premium',
+    'high-value': 'top20',
+    'at-risk': 'risco_alto_medio'
+}
+
+def get_actions_frame() -> pd.DataFrame:
+    """Log de ações como DataFrame com datas convertidas (recarregado só quando o log muda)"""
+    version = actions_store.get_store_version()
+    cached = _cache.get('actions_frame')
+    if cached is not None and cached['version'] == version:
+        return cached['df']
+
+    df_actions = pd.DataFrame(load_actions_log())
+    for col in ('timestamp', 'executed_at', 'due_date'):
+        if col in df_actions.columns:
+            df_actions[col] = pd.to_datetime(df_actions[col], errors='coerce')
+
+    set_cache('actions_frame', {'version': version, 'df': df_actions})
+    return df_actions
+
+COMPARISON_MODES = ['previous', 'year', 'none']
+
+def comparison_window(data_inicio: datetime, data_fim: datetime, comparison: str) -> Optional[Tuple[datetime, datetime]]:
+    """Janela de comparação: período anterior, mesmo período do ano passado ou nenhuma"""
+    if comparison == 'previous':
+        return data_inicio - (data_fim - data_inicio), data_inicio
+    if comparison == 'year':
+        return data_inicio - timedelta(days=365), data_fim - timedelta(days=365)
+    return None
+
+def orders_in_window(orders_snapshot: Dict, data_inicio, data_fim) -> np.ndarray:
+    """Posições dos pedidos com data em [data_inicio, data_fim] (fatia do índice por data)"""
+    return window_positions(orders_snapshot, data_inicio, data_fim)
+
+def _summarize_orders_window(orders_snapshot: Optional[Dict], data_inicio, data_fim,
+                             segment_ids: Optional[np.ndarray]) -> Dict:
+    """Receita, pedidos e clientes únicos de uma janela, opcionalmente restrita a um segmento"""
+    if orders_snapshot is None:
+        return {'revenue': 0.0, 'orders': 0, 'clients': 0}
+    posicoes = orders_in_window(orders_snapshot, data_inicio, data_fim)
+    if segment_ids is not None and orders_snapshot['ids'] is not None:
+        posicoes = posicoes[np.isin(orders_snapshot['ids'][posicoes], segment_ids)]
+    df_pedidos = orders_snapshot['df']
+    revenue = float(df_pedidos['valor_numerico'].to_numpy()[posicoes].sum()) if 'valor_numerico' in df_pedidos.columns else 0.0
+    clients = len(np.unique(orders_snapshot['ids'][posicoes])) if orders_snapshot['ids'] is not None else 0
+    return {'revenue': revenue, 'orders': int(len(posicoes)), 'clients': int(clients)}
+
+def _summarize_team_window(df_actions: pd.DataFrame, data_inicio, data_fim,
+                           segment_ids: Optional[np.ndarray]) -> Dict:
+    """Performance da equipe numa janela a partir do log de ações"""
+    vazio = {'actions_executed': 0, 'actions_pending': 0, 'execution_rate': 0.0, 'avg_response_time': None}
+    if df_actions.empty or 'timestamp' not in df_actions.columns:
+        return vazio
+
+    if segment_ids is not None:
+        if 'client_id' not in df_actions.columns:
+            return vazio
+        df_actions = df_actions[normalize_client_ids(df_actions['client_id']).isin(segment_ids)]
+
+    status = df_actions['status'].astype(str).str.lower() if 'status' in df_actions.columns \
+        else pd.Series('pendente', index=df_actions.index)
+    # Sugestões automáticas ainda não assumidas pela equipe não contam como trabalho
+    df_actions, status = df_actions[status != actions_store.SUGGESTED_STATUS], status[status != actions_store.SUGGESTED_STATUS]
+
+    criada = df_actions['timestamp']
+    executada = status.isin(ACTION_DONE_STATUSES)
+    concluida_em = df_actions['executed_at'].fillna(criada) if 'executed_at' in df_actions.columns else criada
+
+    criada_na_janela = (criada >= data_inicio) & (criada <= data_fim)
+    executada_na_janela = executada & (concluida_em >= data_inicio) & (concluida_em <= data_fim)
+    pendente = ~executada & (criada <= data_fim)
+
+    criadas = int(criada_na_janela.sum())
+    tempos = ((concluida_em - criada)[executada_na_janela].dt.total_seconds() / 3600).dropna()
+
+    return {
+        'actions_executed': int(executada_na_janela.sum()),
+        'actions_pending': int(pendente.sum()),
+        'execution_rate': float((executada & criada_na_janela).sum() / criadas * 100) if criadas else 0.0,
+        'avg_response_time': float(tempos.mean()) if len(tempos) > 0 else None
+    }
+
+def _delta(atual: float, anterior: float) -> Optional[float]:
+    """Variação percentual entre janelas sobre a base em módulo (None se a base for zero)"""
+    return float((atual - anterior) / abs(anterior) * 100) if anterior else None
+
+@metrics.timed('analytics')
+def compute_analytics(period_days: int = 90, comparison: str = 'previous', segment: str = 'all') -> Optional[Dict]:
+    """
+    Agrega performance da equipe (log de ações) e receita/receita em risco
+    (snapshots de clientes e pedidos) para o período, segmento e janela de comparação.
+    Resultado memoizado por versão dos dados + parâmetros.
+    """
+    if segment not in ANALYTICS_SEGMENTS:
+        raise ValueError(f"Segmento inválido: {segment}")
+
+    clients_snapshot = get_clients_snapshot()
+    if clients_snapshot is None:
+        return None
+    orders_snapshot = get_orders_snapshot()
+    df_actions = get_actions_frame()
+
+    # A janela termina agora: o dia do fim entra na chave para a virada do dia não servir a janela anterior
+    data_fim = datetime.now()
+    cache_key = "analytics_{}_{}_{}_{}_{}_{}_{}".format(
+        clients_snapshot['version'], orders_snapshot['version'] if orders_snapshot else None,
+        _cache.get('actions_frame', {}).get('version'), period_days, comparison, segment,
+        data_fim.strftime('%Y-%m-%d')
+    )
+    cached = get_from_cache(cache_key, Config.CACHE_TIMEOUT)
+    if cached is not None:
+        return cached
+
+    data_inicio = data_fim - timedelta(days=period_days)
+    janela_comp = comparison_window(data_inicio, data_fim, comparison)
+
+    segments = clients_snapshot['segments']
+    segment_name = ANALYTICS_SEGMENTS[segment]
+    segment_mask = segments[segment_name] if segment_name else np.ones(len(clients_snapshot['df']), dtype=bool)
+    segment_ids = None
+    if segment_name and clients_snapshot['ids'] is not None:
+        segment_ids = np.unique(clients_snapshot['ids'][segment_mask])
+
+    # Métricas de base (estado atual do segmento)
+    receita = clients_snapshot['df']['receita_num'].to_numpy()
+    total_segmento = int(segment_mask.sum())
+    em_risco = segment_mask & segments['risco_alto_medio']
+    ativos = int((segment_mask & segments['ativos']).sum())
+
+    churn_risk = client_churn_risk(clients_snapshot)[segment_mask]
+    churn_risk = churn_risk[~np.isnan(churn_risk)]
+    churn_prediction = float(churn_risk.mean() * 100) if len(churn_risk) > 0 else None
+
+    team = _summarize_team_window(df_actions, data_inicio, data_fim, segment_ids)
+    orders = _summarize_orders_window(orders_snapshot, data_inicio, data_fim, segment_ids)
+
+    result = {
+        'period': period_days,
+        'comparison': comparison,
+        'segment': segment,
+        'window': {'inicio': data_inicio.strftime('%d/%m/%Y'), 'fim': data_fim.strftime('%d/%m/%Y')},
+        'team_performance': team,
+        'financial_analysis': {
+            'total_revenue': float(receita[segment_mask].sum()),
+            'revenue_at_risk': float(receita[em_risco].sum()),
+            'period_revenue': orders['revenue'],
+            'period_orders': orders['orders'],
+            'period_clients': orders['clients'],
+            'churn_prediction': churn_prediction
+        },
+        'churn_analysis': {
+            'total_clients': total_segmento,
+            'retention_rate': float(ativos / total_segmento * 100) if total_segmento else 0.0,
+            'clients_at_risk': int(em_risco.sum())
+        },
+        'comparison_data': None
+    }
+
+    if janela_comp is not None:
+        team_comp = _summarize_team_window(df_actions, janela_comp[0], janela_comp[1], segment_ids)
+        orders_comp = _summarize_orders_window(orders_snapshot, janela_comp[0], janela_comp[1], segment_ids)
+        result['comparison_data'] = {
+            'window': {'inicio': janela_comp[0].strftime('%d/%m/%Y'), 'fim': janela_comp[1].strftime('%d/%m/%Y')},
+            'team_performance': team_comp,
+            'period_revenue': orders_comp['revenue'],
+            'period_orders': orders_comp['orders'],
+            'deltas': {
+                'period_revenue': _delta(orders['revenue'], orders_comp['revenue']),
+                'period_orders': _delta(orders['orders'], orders_comp['orders']),
+                'actions_executed': _delta(team['actions_executed'], team_comp['actions_executed'])
+            }
+        }
+
+    set_cache(cache_key, result)
+    return result
+
+# === ENGINE DE COMPARAÇÃO ENTRE JANELAS (ATUAL VS ANTERIOR) ===
+
+SATISFACTION_TAB_KEY = "satisfaction_data"
+
+# Métrica de satisfação -> trechos que identificam a coluna na planilha de pesquisa
+SATISFACTION_COLUMN_PATTERNS = {
+    'atendimento': ['atendimento'],
+    'produto': ['produto'],
+    'prazo': ['prazo'],
+    'nps': ['possibilidade', 'recomenda']
+}
+
+def find_satisfaction_columns(df_satisfacao: pd.DataFrame) -> Dict[str, Optional[str]]:
+    """Localiza a coluna de cada métrica de satisfação (primeira que casar, sem repetir coluna)"""
+    colunas = {metric: None for metric in SATISFACTION_COLUMN_PATTERNS}
+    for col in df_satisfacao.columns:
+        col_lower = col.lower()
+        for metric, padroes in SATISFACTION_COLUMN_PATTERNS.items():
+            if colunas[metric] is None and any(padrao in col_lower for padrao in padroes):
+                colunas[metric] = col
+                break
+    return colunas
+
+def get_satisfaction_snapshot() -> Optional[Dict]:
+    """Snapshot da pesquisa do dataset fixado na requisição atual (ou o do cache, fora de requisições)"""
+    dataset = current_dataset()
+    if dataset is not None:
+        return dataset['satisfaction']
+    return _load_satisfaction_snapshot()
+
+def _load_satisfaction_snapshot() -> Optional[Dict]:
+    """
+    Snapshot da pesquisa de satisfação com respostas já convertidas (notas numéricas e
+    categoria NPS) e posições ordenadas por data. Recalculado apenas quando a planilha é recarregada.
+    """
+    snapshot = _cache.get('satisfaction_snapshot')
+    if (snapshot is not None
+            and get_from_cache(SATISFACTION_TAB_KEY, Config.CACHE_TIMEOUT) is not None
+            and snapshot['version'] == _cache.timestamp(SATISFACTION_TAB_KEY)):
+        return snapshot
+
+    df_satisfacao = load_satisfaction_data()
     if df_satisfacao.empty:
-        return {
-            'value': 'N/A',
-            'trend': 'Sem dados',
-            'color_class': 'info',
-            'details': {}
+        return None
+    df_satisfacao = df_satisfacao.reset_index(drop=True)
+
+    date_column = next((col for col in df_satisfacao.columns
+                        if any(x in col.lower() for x in ['carimbo', 'data', 'timestamp', 'time'])), None)
+    by_date = np.array([], dtype=int)
+    dates_sorted = np.array([], dtype='datetime64[ns]')
+    if date_column is not None:
+        datas = pd.to_datetime(df_satisfacao[date_column], errors='coerce').to_numpy(dtype='datetime64[ns]')
+        validas = np.flatnonzero(~np.isnat(datas))
+        by_date = validas[np.argsort(datas[validas], kind='stable')]
+        dates_sorted = datas[by_date]
+
+    # Conversão de texto feita uma vez por valor distinto, não por resposta
+    columns = find_satisfaction_columns(df_satisfacao)
+    scores, nps_categoria = {}, None
+    for metric, col in columns.items():
+        if col is None:
+            continue
+        respostas = df_satisfacao[col]
+        if metric == 'nps':
+            categorias = {valor: categorize_nps_from_text(valor) for valor in respostas.dropna().unique()}
+            nps_categoria = respostas.map(categorias).fillna('').to_numpy()
+        else:
+            notas = {valor: convert_text_score_to_number(valor) for valor in respostas.dropna().unique()}
+            scores[metric] = pd.to_numeric(respostas.map(notas), errors='coerce').to_numpy(dtype=float)
+
+    snapshot = {
+        'version': _cache.timestamp(SATISFACTION_TAB_KEY),
+        'df': df_satisfacao,
+        'date_column': date_column,
+        'columns': columns,
+        'scores': scores,
+        'nps_categoria': nps_categoria,
+        'by_date': by_date,
+        'dates_sorted': dates_sorted
+    }
+    set_cache('satisfaction_snapshot', snapshot)
+    return snapshot
+
+# === DATASET: CLIENTES + PEDIDOS + PESQUISA SOB UMA VERSÃO ÚNICA ===
+
+# Dataset publicado: trocado inteiro (atribuição única), nunca alterado no lugar
+_dataset: Optional[Dict] = None
+_dataset_version = 0
+_dataset_lock = threading.Lock()
+# Intervalo mínimo entre atualizações automáticas (evita repetir jobs quando a planilha falha)
+DATASET_REFRESH_RETRY_SECONDS = 60
+_dataset_refresh_requested_at = 0.0
+# Estado por thread: dataset fixado na requisição e flag de montagem (evita recursão)
+_dataset_scope = threading.local()
+# Chamados (fora do lock) a cada versão nova publicada, ex: live_updates acorda os streams
+_dataset_listeners: List[Callable[[Dict], None]] = []
+
+def build_dataset() -> Optional[Dict]:
+    """
+    Monta o dataset a partir dos snapshots em cache (recarregando o que tiver vencido) e o
+    publica. Só ganha versão nova se alguma planilha mudou desde o dataset anterior. Se um
+    snapshot presente no dataset atual não carregar, o dataset atual continua valendo.
+    """
+    _dataset_scope.building = True
+    try:
+        orders = _load_orders_snapshot()
+        clients = _load_clients_snapshot()
+        satisfaction = _load_satisfaction_snapshot()
+    finally:
+        _dataset_scope.building = False
+    atual = _dataset
+    if atual is not None:
+        faltando = [nome for nome, snapshot in (('clientes', clients), ('pedidos', orders), ('satisfacao', satisfaction))
+                    if snapshot is None and atual['sheet_versions'][nome] is not None]
+        if faltando:
+            logger.warning("Dataset mantido: snapshots indisponíveis", extra={
+                'dataset_version': atual['version'], 'faltando': faltando
+            })
+            return atual
+    if clients is None:
+        return None
+    return publish_dataset(clients, orders, satisfaction)
+
+def derive_dataset_snapshots(clients: Dict, orders: Optional[Dict], satisfaction: Optional[Dict]) -> tuple:
+    """
+    Campos que dependem de mais de uma planilha (satisfação e risco de churn por cliente,
+    segmentação dos pedidos por nível), calculados antes da publicação em cópias rasas dos
+    snapshots: depois de publicado, o dataset só é lido.
+    """
+    clients = with_client_satisfaction(clients, satisfaction)
+    churn = get_churn_scores(orders) if orders is not None else None
+    clients['churn_risk'] = build_client_churn_risk(clients, churn)
+    if orders is not None and orders['ids'] is not None and clients['ids'] is not None:
+        orders = dict(orders, client_segments=build_order_segments(orders, clients))
+    return clients, orders
+
+def publish_dataset(clients: Dict, orders: Optional[Dict], satisfaction: Optional[Dict]) -> Dict:
+    global _dataset, _dataset_version
+    sheet_versions = {
+        'clientes': clients['version'],
+        'pedidos': orders['version'] if orders else None,
+        'satisfacao': satisfaction['version'] if satisfaction else None
+    }
+    atual = _dataset
+    if atual is not None and atual['sheet_versions'] == sheet_versions:
+        return atual
+    clients, orders = derive_dataset_snapshots(clients, orders, satisfaction)
+    with _dataset_lock:
+        if _dataset is not None and _dataset['sheet_versions'] == sheet_versions:
+            return _dataset
+        _dataset_version += 1
+        dataset = _dataset = {
+            'version': _dataset_version,
+            'created_at': datetime.now(),
+            'sheet_versions': sheet_versions,
+            'clients': clients,
+            'orders': orders,
+            'satisfaction': satisfaction
         }
-    
+    logger.info("Dataset publicado", extra={'dataset_version': dataset['version']})
+    for listener in list(_dataset_listeners):
+        try:
+            listener(dataset)
+        except Exception:
+            logger.exception("Erro ao notificar nova versão do dataset")
+    return dataset
+
+def add_dataset_listener(listener: Callable[[Dict], None]):
+    """Registra uma função chamada com o dataset a cada versão nova publicada neste processo"""
+    _dataset_listeners.append(listener)
+
+def get_dataset() -> Optional[Dict]:
+    """
+    Dataset atual. Só bloqueia na primeira carga; depois de CACHE_TIMEOUT agenda uma
+    atualização em segundo plano e continua servindo o dataset anterior até a troca.
+    """
+    global _dataset_refresh_requested_at
+    dataset = _dataset
+    if dataset is None:
+        with _refresh_build_lock:
+            return _dataset if _dataset is not None else build_dataset()
+    if ((datetime.now() - dataset['created_at']).total_seconds() > Config.CACHE_TIMEOUT
+            and time.monotonic() - _dataset_refresh_requested_at > DATASET_REFRESH_RETRY_SECONDS):
+        _dataset_refresh_requested_at = time.monotonic()
+        start_refresh_job()
+    return dataset
+
+def reset_dataset():
+    """Descarta o dataset publicado: o próximo acesso monta um novo (a versão continua crescendo)"""
+    global _dataset
+    with _dataset_lock:
+        _dataset = None
+
+def begin_dataset_scope():
+    """Início de requisição: o dataset é fixado no primeiro acesso e vale até o fim dela"""
+    _dataset_scope.active = True
+    _dataset_scope.dataset = None
+
+def end_dataset_scope():
+    _dataset_scope.active = False
+    _dataset_scope.dataset = None
+
+@contextmanager
+def pinned_dataset(dataset: Dict):
+    """Fixa um dataset específico nesta thread fora do ciclo da requisição (ex: payload do stream)"""
+    anterior = (getattr(_dataset_scope, 'active', False), getattr(_dataset_scope, 'dataset', None))
+    _dataset_scope.active = True
+    _dataset_scope.dataset = dataset
+    try:
+        yield dataset
+    finally:
+        _dataset_scope.active, _dataset_scope.dataset = anterior
+
+def current_dataset(load: bool = True) -> Optional[Dict]:
+    """Dataset fixado nesta thread (None fora de requisições ou durante a montagem do dataset)"""
+    if not getattr(_dataset_scope, 'active', False) or getattr(_dataset_scope, 'building', False):
+        return None
+    if _dataset_scope.dataset is None and load:
+        _dataset_scope.dataset = get_dataset()
+    return _dataset_scope.dataset
+
+# === LOTE DE WIDGETS (/api/batch): INTERMEDIÁRIOS COMPARTILHADOS DENTRO DO LOTE ===
+
+_batch_scope = threading.local()
+
+@contextmanager
+def batch_memo():
+    """
+    Durante um lote, as agregações de janela do engine de comparação ficam num memo do
+    próprio lote: widgets com janelas em comum (ex: satisfação dos últimos 30 dias na Visão
+    Executiva e em /api/compare) reaproveitam o resultado sem passar pelo cache compartilhado
+    e sem risco de remoção pelo LRU no meio do lote.
+    """
+    _batch_scope.memo = {}
+    try:
+        yield _batch_scope.memo
+    finally:
+        _batch_scope.memo = None
+
+def batch_memo_dict() -> Optional[Dict]:
+    """Memo do lote em andamento nesta thread (None fora de /api/batch)"""
+    return getattr(_batch_scope, 'memo', None)
+
+def window_positions(dated_snapshot: Dict, data_inicio, data_fim) -> np.ndarray:
+    """Posições das linhas com data em [data_inicio, data_fim] em qualquer snapshot ordenado por data"""
+    dates = dated_snapshot['dates_sorted']
+    lo = np.searchsorted(dates, np.datetime64(pd.Timestamp(data_inicio)), side='left')
+    hi = np.searchsorted(dates, np.datetime64(pd.Timestamp(data_fim)), side='right')
+    return dated_snapshot['by_date'][lo:hi]
+
+# --- Agregações registradas (recebem o snapshot e as posições da janela) ---
+
+def _order_values(orders_snapshot: Dict, posicoes: np.ndarray) -> np.ndarray:
+    df_pedidos = orders_snapshot['df']
+    if 'valor_numerico' not in df_pedidos.columns:
+        return np.zeros(len(posicoes))
+    return df_pedidos['valor_numerico'].to_numpy()[posicoes]
+
+def _order_status(orders_snapshot: Dict, posicoes: np.ndarray) -> np.ndarray:
+    df_pedidos = orders_snapshot['df']
+    if 'status_clean' not in df_pedidos.columns:
+        return np.full(len(posicoes), '')
+    return df_pedidos['status_clean'].to_numpy()[posicoes]
+
+def _agg_receita(orders_snapshot, posicoes):
+    return {'value': float(_order_values(orders_snapshot, posicoes).sum())}
+
+def _agg_pedidos(orders_snapshot, posicoes):
+    return {'value': float(len(posicoes))}
+
+def _agg_ticket_medio(orders_snapshot, posicoes):
+    valores = _order_values(orders_snapshot, posicoes)
+    return {'value': float(valores.mean()) if len(valores) else None}
+
+def _agg_clientes_unicos(orders_snapshot, posicoes):
+    ids = orders_snapshot['ids']
+    return {'value': float(len(np.unique(ids[posicoes]))) if ids is not None else None}
+
+def _agg_pedidos_status(status_alvo: str):
+    def aggregate(orders_snapshot, posicoes):
+        return {'value': float((_order_status(orders_snapshot, posicoes) == status_alvo).sum())}
+    return aggregate
+
+def _agg_ticket_status(status_alvo: str):
+    def aggregate(orders_snapshot, posicoes):
+        valores = _order_values(orders_snapshot, posicoes)[_order_status(orders_snapshot, posicoes) == status_alvo]
+        return {'value': float(valores.mean()) if len(valores) else None}
+    return aggregate
+
+def _agg_taxa_conversao(orders_snapshot, posicoes):
+    """Clientes com primeira compra na janela que também recompraram na janela (%)"""
+    ids = orders_snapshot['ids']
+    if ids is None:
+        return {'value': None}
+    status = _order_status(orders_snapshot, posicoes)
+    primeiro = np.unique(ids[posicoes][status == 'primeiro'])
+    if len(primeiro) == 0:
+        return {'value': None}
+    recompra = np.unique(ids[posicoes][status == 'recompra'])
+    convertidos = len(np.intersect1d(primeiro, recompra, assume_unique=True))
+    return {'value': float(convertidos / len(primeiro) * 100)}
+
+def _agg_nps(satisfaction_snapshot, posicoes):
+    categorias = satisfaction_snapshot['nps_categoria']
+    if categorias is None:
+        return {'value': None}
+    categorias = categorias[posicoes]
+    promotores = int((categorias == 'Promotor').sum())
+    neutros = int((categorias == 'Neutro').sum())
+    detratores = int((categorias == 'Detrator').sum())
+    total = promotores + neutros + detratores
+    return {
+        'value': float((promotores - detratores) / total * 100) if total else None,
+        'promotores': promotores,
+        'neutros': neutros,
+        'detratores': detratores,
+        'total_validas': total
+    }
+
+def _agg_nota_media(metric: str):
+    def aggregate(satisfaction_snapshot, posicoes):
+        notas = satisfaction_snapshot['scores'].get(metric)
+        if notas is None:
+            return {'value': None}
+        notas = notas[posicoes]
+        notas = notas[~np.isnan(notas)]
+        return {'value': float(notas.mean()) if len(notas) else None, 'total_respostas': int(len(notas))}
+    return aggregate
+
+# Fontes datadas disponíveis para o engine (resolvidas na hora da chamada)
+COMPARISON_SOURCES = {
+    'pedidos': lambda: get_orders_snapshot(),
+    'satisfacao': lambda: get_satisfaction_snapshot()
+}
+
+COMPARISON_METRICS: Dict[str, Dict] = {}
+
+def register_comparison_metric(name: str, source: str, aggregate, tolerance: float = 0.0,
+                               higher_is_better: bool = True, color_thresholds: Optional[Tuple[float, float]] = None,
+                               decimals: int = 1, unit: str = '', percent_delta: bool = True):
+    """
+    Registra uma métrica comparável: aggregate(snapshot, posicoes) -> {'value': ..., detalhes}.
+    Variações dentro de tolerance são 'stable'; color_thresholds=(bom, atenção) colore o valor absoluto.
+    percent_delta=False para métricas em pontos (NPS, taxas): delta_pct fica None, só o delta absoluto.
+    """
+    COMPARISON_METRICS[name] = {
+        'source': source,
+        'aggregate': aggregate,
+        'tolerance': tolerance,
+        'higher_is_better': higher_is_better,
+        'color_thresholds': color_thresholds,
+        'decimals': decimals,
+        'unit': unit,
+        'percent_delta': percent_delta
+    }
+
+# Recorrência e receita (pedidos)
+register_comparison_metric('receita', 'pedidos', _agg_receita, decimals=2)
+register_comparison_metric('pedidos', 'pedidos', _agg_pedidos, decimals=0)
+register_comparison_metric('ticket_medio', 'pedidos', _agg_ticket_medio, decimals=2)
+register_comparison_metric('clientes_unicos', 'pedidos', _agg_clientes_unicos, decimals=0)
+register_comparison_metric('pedidos_primeira', 'pedidos', _agg_pedidos_status('primeiro'), decimals=0)
+register_comparison_metric('pedidos_recompra', 'pedidos', _agg_pedidos_status('recompra'), decimals=0)
+register_comparison_metric('ticket_primeira', 'pedidos', _agg_ticket_status('primeiro'), decimals=2)
+register_comparison_metric('ticket_recompra', 'pedidos', _agg_ticket_status('recompra'), decimals=2)
+register_comparison_metric('taxa_conversao', 'pedidos', _agg_taxa_conversao, tolerance=1.0, unit=' pp',
+                           percent_delta=False)
+
+# Satisfação (mesmas tolerâncias e faixas de cor do cálculo original)
+register_comparison_metric('nps', 'satisfacao', _agg_nps, tolerance=5, color_thresholds=(50, 0), decimals=0, unit=' pts',
+                           percent_delta=False)
+for _metric in ('atendimento', 'produto', 'prazo'):
+    register_comparison_metric(_metric, 'satisfacao', _agg_nota_media(_metric), tolerance=0.3,
+                               color_thresholds=(8, 6), decimals=1)
+
+RECURRENCE_COMPARISON_METRICS = ['pedidos_primeira', 'pedidos_recompra', 'taxa_conversao',
+                                 'ticket_primeira', 'ticket_recompra', 'clientes_unicos', 'pedidos']
+
+def _metric_window(name: str, snapshot: Dict, data_inicio: pd.Timestamp, data_fim: pd.Timestamp) -> Dict:
+    """Agregação de uma janela, memoizada por versão do snapshot + janela"""
+    cache_key = f"cmp_{name}_{snapshot['version']}_{data_inicio}_{data_fim}"
+    memo = batch_memo_dict()
+    if memo is not None and cache_key in memo:
+        return memo[cache_key]
+    result = get_from_cache(cache_key, Config.CACHE_TIMEOUT)
+    if result is None:
+        posicoes = window_positions(snapshot, data_inicio, data_fim)
+        result = COMPARISON_METRICS[name]['aggregate'](snapshot, posicoes)
+        result['count'] = int(len(posicoes))
+        set_cache(cache_key, result)
+    if memo is not None:
+        memo[cache_key] = result
+    return result
+
+def _value_color(metric: Dict, value: Optional[float]) -> str:
+    if value is None or metric['color_thresholds'] is None:
+        return 'info'
+    bom, atencao = metric['color_thresholds']
+    return 'success' if value >= bom else 'warning' if value >= atencao else 'danger'
+
+def compare_metric(name: str, data_inicio, data_fim, comparison: str = 'previous',
+                   segment: Optional[str] = None) -> Optional[Dict]:
+    """
+    Valor da métrica registrada na janela atual e na de comparação (uma fatia da
+    ordem por data para cada), com delta e classe de tendência. Com segment (nível do
+    cliente) a fatia é feita sobre a ordem por data dos pedidos daquele nível.
+    Levanta KeyError para métrica desconhecida; retorna None se a fonte não estiver disponível.
+    """
+    metric = COMPARISON_METRICS[name]
+    if segment is not None:
+        if metric['source'] != 'pedidos':
+            raise ValueError(f"Métrica '{name}' não pode ser segmentada por nível")
+        snapshot = segment_orders_view(segment)
+    else:
+        snapshot = COMPARISON_SOURCES[metric['source']]()
+    if snapshot is None:
+        return None
+
+    # Janelas relativas a "agora" reaproveitam o resultado dentro do mesmo minuto
+    data_inicio = pd.Timestamp(data_inicio).floor('min')
+    data_fim = pd.Timestamp(data_fim).floor('min')
+    atual = _metric_window(name, snapshot, data_inicio, data_fim)
+
+    result = {
+        'metric': name,
+        'value': atual['value'],
+        'details': {k: v for k, v in atual.items() if k != 'value'},
+        'previous': None,
+        'previous_details': None,
+        'delta': None,
+        'delta_pct': None,
+        'trend': 'sem_comparacao',
+        'color_class': _value_color(metric, atual['value']),
+        'window': {'inicio': data_inicio.strftime('%d/%m/%Y'), 'fim': data_fim.strftime('%d/%m/%Y')},
+        'comparison_window': None,
+        'version': str(snapshot['version'])
+    }
+
+    janela = comparison_window(data_inicio, data_fim, comparison)
+    if janela is None:
+        return result
+    anterior = _metric_window(name, snapshot, janela[0], janela[1])
+    result['comparison_window'] = {'inicio': janela[0].strftime('%d/%m/%Y'), 'fim': janela[1].strftime('%d/%m/%Y')}
+    result['previous'] = anterior['value']
+    result['previous_details'] = {k: v for k, v in anterior.items() if k != 'value'}
+
+    if atual['value'] is None or anterior['value'] is None:
+        return result
+
+    delta = atual['value'] - anterior['value']
+    result['delta'] = float(delta)
+    if metric['percent_delta']:
+        result['delta_pct'] = _delta(atual['value'], anterior['value'])
+    if abs(delta) <= metric['tolerance']:
+        result['trend'] = 'stable'
+    else:
+        result['trend'] = 'up' if delta > 0 else 'down'
+        melhorou = (delta > 0) == metric['higher_is_better']
+        result['color_class'] = 'success' if melhorou else 'danger'
+    return result
+
+def describe_comparison_trend(name: str, comparison_result: Dict) -> str:
+    """Texto de tendência no formato usado pelos cards ("↗️ +3 pts vs anterior")"""
+    metric = COMPARISON_METRICS[name]
+    if comparison_result['trend'] == 'sem_comparacao':
+        details = comparison_result['details']
+        total = details.get('total_validas', details.get('total_respostas', details.get('count', 0)))
+        return f"{total} avaliações"
+    delta = comparison_result['delta']
+    formato = f"{{:{'+' if comparison_result['trend'] == 'stable' else ''}.{metric['decimals']}f}}"
+    seta = {'up': '↗️ +', 'down': '↘️ ', 'stable': '➡️ '}[comparison_result['trend']]
+    return f"{seta}{formato.format(delta)}{metric['unit']} vs anterior"
+
+def compare_metrics(names: List[str], data_inicio, data_fim, comparison: str = 'previous',
+                    segment: Optional[str] = None) -> Dict[str, Optional[Dict]]:
+    """Compara várias métricas registradas na mesma janela. Levanta KeyError para métrica desconhecida."""
+    for name in names:
+        if name not in COMPARISON_METRICS:
+            raise KeyError(name)
+    return {name: compare_metric(name, data_inicio, data_fim, comparison, segment) for name in names}
+
+# === PEDIDOS POR SEGMENTO (NÍVEL DO CLIENTE) ===
+
+CLIENT_LEVELS = ['Premium', 'Gold', 'Silver', 'Bronze']
+
+def build_order_segments(orders_snapshot: Dict, clients_snapshot: Dict) -> Dict:
+    """
+    Enriquece os pedidos com o nível do cliente (mapa id -> nível, sem merge) e separa
+    a ordem por data de cada nível, para que janelas por segmento sejam uma fatia.
+    """
+    clientes_ids = pd.Series(clients_snapshot['ids'])
+    primeiros = ~clientes_ids.duplicated().to_numpy()
+    niveis = clients_snapshot['df']['nivel_cliente'].fillna('').astype(str).to_numpy()
+    nivel_por_id = pd.Series(niveis[primeiros], index=clientes_ids[primeiros].to_numpy())
+
+    nivel_pedido = pd.Series(orders_snapshot['ids']).map(nivel_por_id).fillna('').to_numpy()
+    codes, uniques = pd.factorize(nivel_pedido)
+    by_date = orders_snapshot['by_date']
+    codigos_por_data = codes[by_date]
+
+    groups = {}
+    for code, nivel in enumerate(uniques):
+        if not nivel:
+            continue
+        selecao = codigos_por_data == code
+        groups[nivel] = {
+            'by_date': by_date[selecao],
+            'dates_sorted': orders_snapshot['dates_sorted'][selecao]
+        }
+
+    return {
+        'key': (orders_snapshot['version'], clients_snapshot['version']),
+        'nivel': nivel_pedido,
+        'groups': groups
+    }
+
+def get_order_segments() -> Optional[Dict]:
+    """Segmentação dos pedidos por nível do dataset atual"""
+    orders_snapshot = get_orders_snapshot()
+    clients_snapshot = get_clients_snapshot()
+    if (orders_snapshot is None or clients_snapshot is None
+            or orders_snapshot['ids'] is None or clients_snapshot['ids'] is None):
+        return None
+
+    # Calculada na publicação do dataset; fora dele é montada na hora, sem gravar no snapshot
+    order_segments = orders_snapshot.get('client_segments')
+    if order_segments is not None and order_segments['key'] == (orders_snapshot['version'], clients_snapshot['version']):
+        return order_segments
+    return build_order_segments(orders_snapshot, clients_snapshot)
+
+def segment_orders_view(segment: str) -> Optional[Dict]:
+    """Visão datada só com os pedidos de clientes do nível (mesma interface do snapshot de pedidos)"""
+    orders_snapshot = get_orders_snapshot()
+    order_segments = get_order_segments()
+    if order_segments is None:
+        return None
+
+    group = order_segments['groups'].get(segment, {
+        'by_date': np.array([], dtype=int),
+        'dates_sorted': np.array([], dtype='datetime64[ns]')
+    })
+    return {
+        'version': f"{orders_snapshot['version']}_{order_segments['key'][1]}_{segment}",
+        'df': orders_snapshot['df'],
+        'ids': orders_snapshot['ids'],
+        'by_date': group['by_date'],
+        'dates_sorted': group['dates_sorted']
+    }
+
+def default_recurrence_window() -> Tuple[datetime, datetime]:
+    """
+    Janela padrão da recorrência: 180 dias até o fim de hoje. Fixa ao longo do dia, então a
+    Visão Executiva e /api/recurrence-analysis usam as mesmas chaves do memo do lote e do cache.
+    """
+    data_fim = datetime.now().replace(hour=23, minute=59, second=59, microsecond=0)
+    return data_fim - timedelta(days=180), data_fim
+
+def compute_recurrence_metrics(data_inicio, data_fim, comparison: str = 'previous',
+                               segment: Optional[str] = None) -> Optional[Dict]:
+    """Métricas de recorrência da janela (e comparação), opcionalmente só de um nível de cliente"""
+    comparacao = compare_metrics(RECURRENCE_COMPARISON_METRICS, data_inicio, data_fim, comparison, segment)
+    if any(result is None for result in comparacao.values()):
+        return None
+
+    def valor(name, padrao=0):
+        return comparacao[name]['value'] if comparacao[name]['value'] is not None else padrao
+
+    return {
+        'metrics': {
+            'pedidos_primeira': int(valor('pedidos_primeira')),
+            'pedidos_recompra': int(valor('pedidos_recompra')),
+            'taxa_conversao': float(valor('taxa_conversao', 0.0)),
+            'ticket_primeira': float(valor('ticket_primeira', 0.0)),
+            'ticket_recompra': float(valor('ticket_recompra', 0.0)),
+            'clientes_unicos': int(valor('clientes_unicos')),
+            'total_pedidos': int(valor('pedidos'))
+        },
+        'comparison': comparacao
+    }
+
+# === LATÊNCIA DE RECOMPRA (PRIMEIRO E SEGUNDO PEDIDO POR CLIENTE) ===
+
+def build_repurchase_table(orders_snapshot: Dict) -> Dict:
+    """
+    Data do primeiro e do segundo pedido de cada cliente, numa passada sobre os pedidos
+    já ordenados por data (cumcount por cliente). A tabela fica ordenada pela data do
+    primeiro pedido, então uma coorte é uma fatia via searchsorted.
+    """
+    by_date = orders_snapshot['by_date']
+    frame = pd.DataFrame({'id': orders_snapshot['ids'][by_date], 'data': orders_snapshot['dates_sorted']})
+    ordem_no_cliente = frame.groupby('id', sort=False).cumcount().to_numpy()
+
+    primeiros = frame[ordem_no_cliente == 0]
+    segundos = frame[ordem_no_cliente == 1].set_index('id')['data']
+
+    segunda = segundos.reindex(primeiros['id'].to_numpy()).to_numpy(dtype='datetime64[ns]')
+    primeira = primeiros['data'].to_numpy(dtype='datetime64[ns]')
+    latencia = (segunda - primeira) / np.timedelta64(1, 'D')
+
+    return {
+        'version': orders_snapshot['version'],
+        'ids': primeiros['id'].to_numpy(),
+        'primeira': primeira,
+        'segunda': segunda,
+        'latencia_dias': latencia.astype(float)
+    }
+
+def get_repurchase_table() -> Optional[Dict]:
+    """Tabela de primeiro/segundo pedido, construída uma vez por snapshot de pedidos"""
+    orders_snapshot = get_orders_snapshot()
+    if orders_snapshot is None or orders_snapshot['ids'] is None:
+        return None
+    cached = _cache.get('repurchase_table')
+    if cached is not None and cached['version'] == orders_snapshot['version']:
+        return cached
+    table = build_repurchase_table(orders_snapshot)
+    set_cache('repurchase_table', table)
+    return table
+
+def repurchase_latency_distribution(data_inicio, data_fim, bins: Optional[List[float]] = None) -> Optional[Dict]:
+    """
+    Coorte de clientes com primeiro pedido em [data_inicio, data_fim]: taxa de recompra,
+    percentis e histograma dos dias até o segundo pedido. Não relê os pedidos.
+    """
+    table = get_repurchase_table()
+    if table is None:
+        return None
+
+    lo = np.searchsorted(table['primeira'], np.datetime64(pd.Timestamp(data_inicio)), side='left')
+    hi = np.searchsorted(table['primeira'], np.datetime64(pd.Timestamp(data_fim)), side='right')
+    latencias = table['latencia_dias'][lo:hi]
+    recompraram = latencias[~np.isnan(latencias)]
+
+    cohort_size = int(hi - lo)
+    bordas = list(bins or Config.REPURCHASE_LATENCY_BINS)
+    contagens, _ = np.histogram(recompraram, bins=bordas + [np.inf])
+    histogram = [
+        {
+            'faixa': f"{int(inicio)}-{int(fim)}" if np.isfinite(fim) else f"{int(inicio)}+",
+            'min_dias': float(inicio),
+            'max_dias': float(fim) if np.isfinite(fim) else None,
+            'clientes': int(total)
+        }
+        for inicio, fim, total in zip(bordas, bordas[1:] + [np.inf], contagens)
+    ]
+
+    percentis = {}
+    if len(recompraram) > 0:
+        for p, valor in zip((25, 50, 75, 90), np.percentile(recompraram, [25, 50, 75, 90])):
+            percentis[f"p{p}"] = float(valor)
+
+    return {
+        'cohort': {'inicio': pd.Timestamp(data_inicio).strftime('%d/%m/%Y'), 'fim': pd.Timestamp(data_fim).strftime('%d/%m/%Y')},
+        'cohort_size': cohort_size,
+        'repurchased': int(len(recompraram)),
+        'repurchase_rate': float(len(recompraram) / cohort_size * 100) if cohort_size else 0.0,
+        'mean_days': float(recompraram.mean()) if len(recompraram) > 0 else None,
+        'percentiles': percentis,
+        'histogram': histogram
+    }
+
+# === SATISFAÇÃO POR CLIENTE (JOIN COM A PESQUISA) ===
+
+SATISFACTION_CLIENT_SEGMENTS = {'detratores': 'Detrator', 'neutros': 'Neutro', 'promotores': 'Promotor'}
+
+def _survey_email_column(df_satisfacao: pd.DataFrame) -> Optional[str]:
+    return next((col for col in df_satisfacao.columns if 'email' in col.lower() or 'e-mail' in col.lower()), None)
+
+def _normalize_emails(emails: pd.Series) -> np.ndarray:
+    return emails.fillna('').astype(str).str.strip().str.lower().to_numpy()
+
+def build_client_satisfaction(clients_snapshot: Dict, satisfaction_snapshot: Dict) -> Dict[str, np.ndarray]:
+    """
+    Hash join cliente <-> pesquisa por cliente_unico_id (ou email, para quem não casar pelo id):
+    categoria NPS da resposta mais recente e média das notas de cada cliente.
+    """
+    df_clientes = clients_snapshot['df']
+    df_satisfacao = satisfaction_snapshot['df']
+    total = len(df_clientes)
+
+    # Respostas em ordem cronológica (sem data primeiro), para que 'last' seja a mais recente
+    sem_data = np.setdiff1d(np.arange(len(df_satisfacao)), satisfaction_snapshot['by_date'])
+    ordem = np.concatenate([sem_data, satisfaction_snapshot['by_date']]).astype(int)
+    respostas = pd.DataFrame({'pos': ordem})
+    for metric, notas in satisfaction_snapshot['scores'].items():
+        respostas[metric] = notas[ordem]
+
+    pares = []
+    if 'cliente_unico_id' in df_satisfacao.columns and clients_snapshot['ids'] is not None:
+        pares.append((normalize_client_ids(df_satisfacao['cliente_unico_id']).to_numpy(), clients_snapshot['ids']))
+    email_col = _survey_email_column(df_satisfacao)
+    if email_col is not None and 'email' in df_clientes.columns:
+        pares.append((_normalize_emails(df_satisfacao[email_col]), _normalize_emails(df_clientes['email'])))
+
+    ultima = np.full(total, -1)
+    medias = {metric: np.full(total, np.nan) for metric in satisfaction_snapshot['scores']}
+    for chaves_pesquisa, chaves_clientes in pares:
+        respostas['chave'] = chaves_pesquisa[ordem]
+        validas = respostas[~np.isin(respostas['chave'].to_numpy(), ['', 'nan'])]
+        if validas.empty:
+            continue
+        grupos = validas.groupby('chave', sort=False)
+        pendentes = ultima < 0
+        encontrada = grupos['pos'].last().reindex(chaves_clientes).to_numpy()
+        casou = pendentes & ~np.isnan(encontrada)
+        ultima[casou] = encontrada[casou].astype(int)
+        if medias:
+            medias_chave = grupos[list(medias)].mean().reindex(chaves_clientes)
+            for metric in medias:
+                medias[metric][casou] = medias_chave[metric].to_numpy()[casou]
+
+    com_pesquisa = ultima >= 0
+    categorias = np.full(total, '', dtype=object)
+    if satisfaction_snapshot['nps_categoria'] is not None:
+        categorias[com_pesquisa] = satisfaction_snapshot['nps_categoria'][ultima[com_pesquisa]]
+    ultima_pesquisa = np.full(total, '', dtype=object)
+    if satisfaction_snapshot['date_column'] is not None:
+        datas = pd.to_datetime(df_satisfacao[satisfaction_snapshot['date_column']], errors='coerce').dt.strftime('%Y-%m-%d')
+        ultima_pesquisa[com_pesquisa] = datas.fillna('').to_numpy()[ultima[com_pesquisa]]
+
+    columns = {'nps_categoria': categorias, 'ultima_pesquisa': ultima_pesquisa}
+    for metric, valores in medias.items():
+        columns[f"satisfacao_{metric}"] = np.round(valores, 1)
+    return columns
+
+def with_client_satisfaction(clients_snapshot: Dict, satisfaction_snapshot: Optional[Dict]) -> Dict:
+    """
+    Cópia do snapshot de clientes com as colunas de satisfação (e os segmentos detratores/
+    neutros/promotores). O DataFrame é copiado sem duplicar as colunas existentes: o
+    snapshot original, compartilhado entre versões do dataset, não é alterado.
+    """
+    total = len(clients_snapshot['df'])
+    if satisfaction_snapshot is not None:
+        columns = build_client_satisfaction(clients_snapshot, satisfaction_snapshot)
+    else:
+        columns = {'nps_categoria': np.full(total, '', dtype=object)}
+
+    df_clientes = clients_snapshot['df'].copy(deep=False)
+    for col, valores in columns.items():
+        df_clientes[col] = valores
+    segments = dict(clients_snapshot['segments'])
+    categorias = columns['nps_categoria']
+    for segment_name, categoria in SATISFACTION_CLIENT_SEGMENTS.items():
+        segments[segment_name] = categorias == categoria
+    segments['com_pesquisa'] = categorias != ''
+
+    logger.info("Satisfação por cliente associada", extra={'com_nps': int((categorias != '').sum()), 'clientes': total})
+    return dict(clients_snapshot, df=df_clientes, segments=segments)
+
+def compute_critical_analysis(segment: Optional[str] = None, nps: Optional[str] = None) -> Optional[Dict]:
+    """
+    Clientes em risco, receita em risco e taxas de inativos/dormant. Sem segmento, considera
+    Premium/Gold em risco; com segmento, os clientes em risco daquele nível. nps
+    (detratores/neutros/promotores) restringe tudo à categoria NPS mais recente do cliente.
+    Fora de um dataset publicado (jobs, aquecimento) não há satisfação por cliente e os
+    segmentos NPS ficam vazios.
+    """
+    if nps is not None and nps not in SATISFACTION_CLIENT_SEGMENTS:
+        raise ValueError(f"Categoria NPS inválida: {nps}")
+    snapshot = get_clients_snapshot()
+    if snapshot is None:
+        return None
+
+    df_clientes = snapshot['df']
+    segments = snapshot['segments']
+    sem_pesquisa = np.zeros(len(df_clientes), dtype=bool)
+    if segment is None:
+        base = np.ones(len(df_clientes), dtype=bool)
+        em_risco = segments['premium_em_risco']
+    else:
+        base = segments.get(f"nivel_{segment}", np.zeros(len(df_clientes), dtype=bool))
+        em_risco = base & segments['risco_alto_medio']
+    detratores_em_risco = int((em_risco & segments.get('detratores', sem_pesquisa)).sum())
+    if nps is not None:
+        base = base & segments.get(nps, sem_pesquisa)
+        em_risco = em_risco & segments.get(nps, sem_pesquisa)
+
+    total_base = int(base.sum())
+    clientes_em_risco = df_clientes[em_risco]
+    taxa_inativos = float((base & segments['inativos']).sum() / total_base * 100) if total_base else 0.0
+    taxa_dormant = float((base & segments['dormant']).sum() / total_base * 100) if total_base else 0.0
+
+    top_criticos = clientes_em_risco.nlargest(3, 'priority_score') if len(clientes_em_risco) > 0 else pd.DataFrame()
+    return {
+        'segment': segment,
+        'nps': nps,
+        'detratores_em_risco': detratores_em_risco,
+        'total_base': total_base,
+        'total_premium': int(segments['premium'].sum()) if segment is None else total_base,
+        'em_risco': int(len(clientes_em_risco)),
+        'receita_em_risco': float(clientes_em_risco['receita_num'].sum()),
+        'taxa_inativos': taxa_inativos,
+        'taxa_dormant': taxa_dormant,
+        'top_criticos': [
+            {
+                'nome': cliente.get('nome', 'N/A'),
+                'nivel': cliente.get('nivel_cliente', 'N/A'),
+                'score': float(cliente.get('priority_score', 0)),
+                'receita': float(cliente.get('receita_num', 0))
+            }
+            for _, cliente in top_criticos.iterrows()
+        ]
+    }
+
+@metrics.timed('satisfaction_metrics')
+def calculate_satisfaction_metrics(metric_name: str, data_inicio=None, data_fim=None) -> Dict:
+    """Calcula métricas de satisfação com comparação temporal (via engine de comparação)"""
     # Usar período padrão se não especificado
     if not data_inicio or not data_fim:
         data_fim = datetime.now()
         data_inicio = data_fim - timedelta(days=30)
-    
-    # Buscar coluna de data
-    date_column = None
-    for col in df_satisfacao.columns:
-        if any(x in col.lower() for x in ['carimbo', 'data', 'timestamp', 'time']):
-            date_column = col
-            break
-    
-    if not date_column or column_name not in df_satisfacao.columns:
-        return {
-            'value': 'N/A',
-            'trend': 'Coluna não encontrada',
-            'color_class': 'info',
-            'details': {}
-        }
-    
-    # Filtrar dados no período
-    df_valid = df_satisfacao.dropna(subset=[date_column])
-    dados_periodo = df_valid[
-        (df_valid[date_column] >= data_inicio) & 
-        (df_valid[date_column] <= data_fim)
-    ]
-    
-    respostas_periodo = dados_periodo[column_name].dropna()
-    
-    if len(respostas_periodo) == 0:
+
+    snapshot = get_satisfaction_snapshot()
+    if snapshot is None:
+        return {'value': 'N/A', 'trend': 'Sem dados', 'color_class': 'info', 'details': {}}
+
+    if snapshot['date_column'] is None or snapshot['columns'].get(metric_name) is None:
+        return {'value': 'N/A', 'trend': 'Coluna não encontrada', 'color_class': 'info', 'details': {}}
+
+    comparacao = compare_metric(metric_name, data_inicio, data_fim)
+    valor = comparacao['value']
+    details = comparacao['details']
+
+    if valor is None:
         return {
             'value': 'N/A',
-            'trend': 'Sem dados no período',
+            'trend': 'Sem dados no período' if details['count'] == 0 else 'Sem respostas válidas',
             'color_class': 'warning',
             'details': {}
         }
-    
-    # Período de comparação
-    periodo_dias = (data_fim - data_inicio).days
-    inicio_comparacao = data_inicio - timedelta(days=periodo_dias)
-    fim_comparacao = data_inicio
-    
-    dados_comparacao = df_valid[
-        (df_valid[date_column] >= inicio_comparacao) & 
-        (df_valid[date_column] < fim_comparacao)
-    ]
-    respostas_comparacao = dados_comparacao[column_name].dropna()
-    
-    if is_nps:
-        # Cálculo NPS
-        categorias_periodo = respostas_periodo.apply(categorize_nps_from_text)
-        promotores = (categorias_periodo == 'Promotor').sum()
-        neutros = (categorias_periodo == 'Neutro').sum()
-        detratores = (categorias_periodo == 'Detrator').sum()
-        total_validas = promotores + neutros + detratores
-        
-        if total_validas == 0:
-            return {
-                'value': 'N/A',
-                'trend': 'Sem respostas válidas',
-                'color_class': 'warning',
-                'details': {}
-            }
-            
-        nps_valor = ((promotores - detratores) / total_validas * 100)
-        
-        # Comparação com período anterior
-        if len(respostas_comparacao) > 0:
-            categorias_comp = respostas_comparacao.apply(categorize_nps_from_text)
-            promotores_comp = (categorias_comp == 'Promotor').sum()
-            detratores_comp = (categorias_comp == 'Detrator').sum()
-            neutros_comp = (categorias_comp == 'Neutro').sum()
-            total_comp = promotores_comp + neutros_comp + detratores_comp
-            
-            if total_comp > 0:
-                nps_comp = ((promotores_comp - detratores_comp) / total_comp * 100)
-                diferenca = nps_valor - nps_comp
-                
-                if diferenca > 5:
-                    trend = f"↗️ +{diferenca:.0f} pts vs anterior"
-                    color_class = "success"
-                elif diferenca < -5:
-                    trend = f"↘️ {diferenca:.0f} pts vs anterior"
-                    color_class = "danger"
-                else:
-                    trend = f"➡️ {diferenca:+.0f} pts vs anterior"
-                    color_class = "success" if nps_valor >= 50 else "warning" if nps_valor >= 0 else "danger"
-            else:
-                trend = f"{total_validas} avaliações"
-                color_class = "success" if nps_valor >= 50 else "warning" if nps_valor >= 0 else "danger"
-        else:
-            trend = f"{total_validas} avaliações"
-            color_class = "success" if nps_valor >= 50 else "warning" if nps_valor >= 0 else "danger"
-            
-        return {
-            'value': f"{nps_valor:.0f}",
-            'trend': trend,
-            'color_class': color_class,
-            'details': {
-                'promotores': int(promotores),
-                'neutros': int(neutros),
-                'detratores': int(detratores),
-                'total_validas': int(total_validas),
-                'nps_valor': float(nps_valor)
-}
-        }
-    
-    else:
-        # Outras métricas (Atendimento, Produto, Prazo)
-        scores = respostas_periodo.apply(convert_text_score_to_number).dropna()
-        
-        if len(scores) == 0:
-            return {
-                'value': 'N/A',
-                'trend': 'Erro na conversão',
-                'color_class': 'warning',
-                'details': {}
-            }
-            
-        valor = scores.mean()
-        
-        if len(respostas_comparacao) > 0:
-            scores_comp = respostas_comparacao.apply(convert_text_score_to_number).dropna()
-            if len(scores_comp) > 0:
-                valor_comp = scores_comp.mean()
-                diferenca = valor - valor_comp
-                
-                if diferenca > 0.3:
-                    trend = f"↗️ +{diferenca:.1f} vs anterior"
-                    color_class = "success"
-                elif diferenca < -0.3:
-                    trend = f"↘️ {diferenca:.1f} vs anterior"
-                    color_class = "danger"
-                else:
-                    trend = f"➡️ {diferenca:+.1f} vs anterior"
-                    color_class = "success" if valor >= 8 else "warning" if valor >= 6 else "danger"
-            else:
-                trend = f"{len(respostas_periodo)} avaliações"
-                color_class = "success" if valor >= 8 else "warning" if valor >= 6 else "danger"
-        else:
-            trend = f"{len(respostas_periodo)} avaliações"
-            color_class = "success" if valor >= 8 else "warning" if valor >= 6 else "danger"
-            
+
+    trend = describe_comparison_trend(metric_name, comparacao)
+
+    if metric_name == 'nps':
         return {
-            'value': f"{valor:.1f}/10",
+            'value': f"{valor:.0f}",
             'trend': trend,
-            'color_class': color_class,
+            'color_class': comparacao['color_class'],
             'details': {
-                'valor_medio': valor,
-                'total_respostas': len(respostas_periodo)
+                'promotores': details['promotores'],
+                'neutros': details['neutros'],
+                'detratores': details['detratores'],
+                'total_validas': details['total_validas'],
+                'nps_valor': float(valor)
             }
         }
 
+    # Outras métricas (Atendimento, Produto, Prazo)
+    return {
+        'value': f"{valor:.1f}/10",
+        'trend': trend,
+        'color_class': comparacao['color_class'],
+        'details': {
+            'valor_medio': valor,
+            'total_respostas': details['total_respostas']
+        }
+    }
+
 def load_google_sheet_corrected(sheet_id: str, sheet_name: str) -> pd.DataFrame:
     """Carregamento corrigido do Google Sheets que funciona com datas ISO"""
     try:
         url = f"https://docs.google.com/spreadsheets/d/{sheet_id}/gviz/tq?tqx=out:csv&sheet={sheet_name}"
-        print(f"📊 Carregando aba '{sheet_name}' com método corrigido...")
+        logger.debug("Carregando aba com método corrigido", extra={'aba': sheet_name})
         
         # Carregar dados
         df = pd.read_csv(url)
-        print(f"✅ {len(df)} registros carregados")
+        logger.debug("Registros carregados", extra={'aba': sheet_name, 'linhas': len(df)})
         
         # Se tem coluna de data, converter corretamente
         if 'data_pedido_realizado' in df.columns:
-            print("🔄 Convertendo datas com método corrigido...")
-            
             # Múltiplos métodos de conversão para garantir sucesso
             df['data_original'] = df['data_pedido_realizado'].copy()
             
@@ -366,7 +2057,7 @@ def load_google_sheet_corrected(sheet_id: str, sheet_name: str) -> pd.DataFrame:
             # Método 2: Se falhou, tentar outros formatos
             mask_nat = df['data_convertida'].isna()
             if mask_nat.sum() > 0:
-                print(f"⚠️ {mask_nat.sum()} datas falharam na conversão ISO, tentando outros formatos...")
+                logger.warning("Datas fora do formato ISO, tentando outros formatos", extra={'falhas': int(mask_nat.sum())})
                 
                 # Tentar formato DD/MM/YYYY
                 df.loc[mask_nat, 'data_convertida'] = pd.to_datetime(
@@ -390,7 +2081,7 @@ def load_google_sheet_corrected(sheet_id: str, sheet_name: str) -> pd.DataFrame:
             # Estatísticas de conversão
             validas = df['data_pedido_realizado'].notna().sum()
             total = len(df)
-            print(f"📊 Conversão de datas: {validas}/{total} ({validas/total*100:.1f}%) válidas")
+            logger.info("Datas de pedidos convertidas", extra={'aba': sheet_name, 'validas': int(validas), 'total': total})
             
             # Limpar colunas auxiliares
             df = df.drop(['data_original', 'data_convertida'], axis=1, errors='ignore')
@@ -398,9 +2089,10 @@ def load_google_sheet_corrected(sheet_id: str, sheet_name: str) -> pd.DataFrame:
         return df
         
     except Exception as e:
-        print(f"❌ Erro ao carregar planilha: {e}")
+        logger.error("Erro ao carregar planilha", extra={'aba': sheet_name, 'error': str(e)})
         return pd.DataFrame()
 
+@metrics.timed('recurrence_analysis')
 def analyze_client_recurrence_corrected(df_pedidos: pd.DataFrame, data_inicio=None, data_fim=None) -> Dict:
     """
     Versão corrigida e simplificada que analisa a recorrência de clientes.
@@ -410,11 +2102,9 @@ def analyze_client_recurrence_corrected(df_pedidos: pd.DataFrame, data_inicio=No
         return {}
     
     try:
-        print("🔍 ANÁLISE DE RECORRÊNCIA - INICIANDO...")
-        
         required_cols = ['data_pedido_realizado', 'status_pedido', 'cliente_unico_id', 'valor_do_pedido']
         if not all(col in df_pedidos.columns for col in required_cols):
-            print(f"❌ Colunas necessárias não encontradas. Requeridas: {required_cols}")
+            logger.error("Colunas necessárias não encontradas", extra={'requeridas': required_cols})
             return {}
         
         # Trabalhar com cópia e garantir que a coluna de data é do tipo datetime
@@ -423,7 +2113,7 @@ def analyze_client_recurrence_corrected(df_pedidos: pd.DataFrame, data_inicio=No
         
         # Remover quaisquer linhas onde a data não pôde ser convertida
         df_valid_dates = df_work.dropna(subset=['data_pedido_realizado'])
-        print(f"📊 Total de pedidos com datas válidas: {len(df_valid_dates)} de {len(df_pedidos)}")
+        logger.debug("Pedidos com datas válidas", extra={'validos': len(df_valid_dates), 'total': len(df_pedidos)})
 
         # Aplicar filtro de data se fornecido
         if data_inicio and data_fim:
@@ -435,7 +2125,7 @@ def analyze_client_recurrence_corrected(df_pedidos: pd.DataFrame, data_inicio=No
             # Se não houver período, analisa todos os dados com datas válidas
             df_periodo = df_valid_dates
         
-        print(f"📊 Pedidos no período selecionado: {len(df_periodo)}")
+        logger.debug("Pedidos no período selecionado", extra={'pedidos': len(df_periodo)})
         if df_periodo.empty:
             return {
                 'pedidos_primeira': 0, 'pedidos_recompra': 0, 'taxa_conversao': 0.0,
@@ -478,114 +2168,60 @@ def analyze_client_recurrence_corrected(df_pedidos: pd.DataFrame, data_inicio=No
             'clientes_unicos': df_periodo['cliente_unico_id'].nunique()
         }
         
-        print(f"✅ RESULTADO: {primeiro_count} primeira, {recompra_count} recompra, {taxa_conversao:.1f}% conversão")
+        logger.debug("Recorrência calculada", extra={
+            'primeira': int(primeiro_count), 'recompra': int(recompra_count), 'taxa_conversao': round(taxa_conversao, 1)
+        })
         return result
         
-    except Exception as e:
-        print(f"❌ Erro na análise de recorrência: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Erro na análise de recorrência")
         return {}
 
-def get_latest_update_date(df_pedidos: pd.DataFrame) -> str:
-    """Pega a data mais recente da planilha de pedidos"""
-    if df_pedidos.empty:
-        return "N/A"
-    
-    try:
-        if 'data_pedido_realizado' not in df_pedidos.columns:
-            return "N/A"
-        
-        df_temp = df_pedidos.copy()
-        df_temp['data_pedido_realizado'] = pd.to_datetime(df_temp['data_pedido_realizado'], errors='coerce')
-        
-        dates_valid = df_temp['data_pedido_realizado'].dropna()
-        
-        if len(dates_valid) == 0:
-            return "N/A"
-        
-        latest_date = dates_valid.max()
-        
-        if pd.isna(latest_date):
-            return "N/A"
-        
-        return latest_date.strftime('%d/%m/%Y')
-    
-    except Exception as e:
+def latest_order_date(orders_snapshot: Optional[Dict]) -> str:
+    """Data do pedido mais recente (última posição da ordem por data do snapshot)"""
+    if orders_snapshot is None or len(orders_snapshot['dates_sorted']) == 0:
         return "N/A"
+    return pd.Timestamp(orders_snapshot['dates_sorted'][-1]).strftime('%d/%m/%Y')
 
 
+@metrics.timed('executive_summary')
 def get_executive_summary_data() -> Dict:
     """Carrega todos os dados necessários para a Visão Executiva - VERSÃO COMPLETA"""
     try:
-        print("📊 Iniciando carregamento dos dados executivos...")
+        # Carregar dados das planilhas (clientes já pontuados e segmentados no snapshot)
+        snapshot = get_clients_snapshot()
+        orders_snapshot = get_orders_snapshot()
+        satisfaction = get_satisfaction_snapshot()
 
-        # Carregar dados das planilhas
-        df_clientes = load_google_sheet_public(Config.CLASSIFICACAO_SHEET_ID, "classificacao_clientes3")
-        df_pedidos = load_google_sheet_public(Config.CLASSIFICACAO_SHEET_ID, "pedidos_com_id2")
-        df_satisfacao = load_satisfaction_data()
-
-        print(f"✅ Dados carregados: {len(df_clientes)} clientes, {len(df_pedidos)} pedidos, {len(df_satisfacao)} respostas de satisfação")
-
-        if df_clientes.empty:
-            print("❌ Planilha de clientes vazia")
+        if snapshot is None:
+            logger.error("Planilha de clientes vazia")
             return {'error': 'Não foi possível carregar dados dos clientes'}
 
-        # Processar dados dos clientes
-        df_clientes = df_clientes.copy()
-        df_clientes['priority_score'] = df_clientes.apply(calculate_priority_score, axis=1)
-
-        # Converter receita para numérico (essencial para cálculos)
-        df_clientes['receita_num'] = pd.to_numeric(
-            df_clientes['receita'].str.replace(',', '.'),
-            errors='coerce'
-        ).fillna(0)
+        df_clientes = snapshot['df']
+        segments = snapshot['segments']
 
-        print(f"✅ Dados processados: receita total R$ {df_clientes['receita_num'].sum():.0f}")
+        logger.debug("Dados executivos carregados", extra={
+            'clientes': len(df_clientes), 'pedidos': len(orders_snapshot['df']) if orders_snapshot else 0,
+            'respostas_satisfacao': len(satisfaction['df']) if satisfaction else 0
+        })
 
         # KPIs principais
         total_clientes = len(df_clientes)
-        clientes_ativos = len(df_clientes[df_clientes['status_churn'] == 'Ativo'])
-        clientes_criticos = len(df_clientes[df_clientes['priority_score'] >= 200])
+        clientes_ativos = int(segments['ativos'].sum())
+        clientes_criticos = int(segments['criticos'].sum())
         receita_total = df_clientes['receita_num'].sum()
 
-        print(f"✅ KPIs calculados: {total_clientes} clientes, {clientes_ativos} ativos, {clientes_criticos} críticos")
-
-        # Análise de recorrência (últimos 6 meses por padrão)
-        data_fim_rec = datetime.now()
-        data_inicio_rec = data_fim_rec - timedelta(days=180)
-        recurrence_data = analyze_client_recurrence_corrected(df_pedidos, data_inicio_rec, data_fim_rec)
+        # Análise de recorrência (últimos 6 meses) pelo engine de comparação: janelas em memo no lote
+        data_inicio_rec, data_fim_rec = default_recurrence_window()
+        recorrencia = compute_recurrence_metrics(data_inicio_rec, data_fim_rec, 'none')
+        recurrence_data = recorrencia['metrics'] if recorrencia is not None else {}
 
-        # Buscar colunas de satisfação automaticamente
-        satisfaction_columns = {
-            'atendimento': None, 'produto': None, 'prazo': None, 'nps': None
+        # Métricas de satisfação (período padrão de 30 dias, comparadas com os 30 dias anteriores)
+        satisfaction_metrics = {
+            metric_name: calculate_satisfaction_metrics(metric_name)
+            for metric_name in SATISFACTION_COLUMN_PATTERNS
         }
 
-        if not df_satisfacao.empty:
-            for col in df_satisfacao.columns:
-                col_lower = col.lower()
-                if 'atendimento' in col_lower and not satisfaction_columns['atendimento']:
-                    satisfaction_columns['atendimento'] = col
-                elif 'produto' in col_lower and not satisfaction_columns['produto']:
-                    satisfaction_columns['produto'] = col
-                elif 'prazo' in col_lower and not satisfaction_columns['prazo']:
-                    satisfaction_columns['prazo'] = col
-                elif any(x in col_lower for x in ['possibilidade', 'recomenda']) and not satisfaction_columns['nps']:
-                    satisfaction_columns['nps'] = col
-
-        # Calcular métricas de satisfação (período padrão de 30 dias)
-        satisfaction_metrics = {}
-        for metric_name, column_name in satisfaction_columns.items():
-            if column_name:
-                is_nps = (metric_name == 'nps')
-                satisfaction_metrics[metric_name] = calculate_satisfaction_metrics(
-                    df_satisfacao, column_name, is_nps
-                )
-            else:
-                satisfaction_metrics[metric_name] = {
-                    'value': 'N/A', 'trend': 'Coluna não encontrada', 'color_class': 'info', 'details': {}
-                }
-
         # Distribuições para gráficos
         nivel_distribution = df_clientes['nivel_cliente'].value_counts().to_dict()
         churn_distribution = df_clientes['status_churn'].value_counts().to_dict()
@@ -596,12 +2232,7 @@ def get_executive_summary_data() -> Dict:
         }).fillna('Sem Classificação').value_counts().to_dict()
 
         # Clientes Premium em risco para análise crítica
-        premium_em_risco = df_clientes[
-            (df_clientes['nivel_cliente'].isin(['Premium', 'Gold'])) &
-            (df_clientes['risco_recencia'].isin(['Alto', 'Novo_Alto', 'Médio', 'Novo_Médio']))
-        ]
-
-        print("✅ Dados executivos processados com sucesso")
+        premium_em_risco = df_clientes[segments['premium_em_risco']]
 
         # Estrutura de retorno completa para a API
         return {
@@ -629,28 +2260,237 @@ def get_executive_summary_data() -> Dict:
             },
             'critical_analysis': {
                 'premium_em_risco': len(premium_em_risco),
-                'total_premium': len(df_clientes[df_clientes['nivel_cliente'].isin(['Premium', 'Gold'])]),
+                'total_premium': int(segments['premium'].sum()),
                 'receita_em_risco': premium_em_risco['receita_num'].sum() if len(premium_em_risco) > 0 else 0
             },
-            'latest_update': get_latest_update_date(df_pedidos)
+            'latest_update': latest_order_date(orders_snapshot)
         }
 
     except Exception as e:
-        print(f"❌ Erro ao carregar dados executivos: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Erro ao carregar dados executivos")
         return {'error': f'Erro ao processar dados: {str(e)}'}
         
 
 
-def clear_cache():
-    """Limpa o cache interno"""
-    global _cache, _cache_timestamps
-    _cache.clear()
-    _cache_timestamps.clear()
-    print("✅ Cache limpo com sucesso")
+# === AQUECIMENTO E PRONTIDÃO (SERVIDOR DE PRODUÇÃO) ===
+
+# Nome público -> chave do snapshot no _cache
+SNAPSHOT_CACHE_KEYS = {
+    'clientes': 'clients_snapshot',
+    'pedidos': 'orders_snapshot',
+    'satisfacao': 'satisfaction_snapshot',
+    'churn': 'churn_scores',
+    'recompra': 'repurchase_table',
+    'rfm': 'rfm_snapshot'
+}
+READY_REQUIRED_SNAPSHOTS = ['clientes', 'pedidos']
+
+def warm_up_snapshots() -> Dict[str, float]:
+    """
+    Carrega as planilhas e monta todos os snapshots derivados (score, segmentos, churn,
+    recompra). Não publica dataset: quem aquece chama build_dataset() depois (no job de
+    atualização, só após publicar o staging). Retorna o tempo de cada etapa em segundos.
+    """
+    etapas = [
+        ('pedidos', get_orders_snapshot),
+        ('clientes', get_clients_snapshot),
+        ('satisfacao', get_satisfaction_snapshot),
+        ('churn', get_churn_scores),
+        ('recompra', get_repurchase_table)
+    ]
+    tempos = {}
+    for nome, etapa in etapas:
+        inicio = time.perf_counter()
+        try:
+            etapa()
+        except Exception:
+            logger.exception("Aquecimento de snapshot falhou", extra={'snapshot': nome})
+        tempos[nome] = round(time.perf_counter() - inicio, 3)
+    logger.info("Snapshots aquecidos", extra={'segundos': round(sum(tempos.values()), 2), 'etapas': tempos})
+    return tempos
+
+# === ATUALIZAÇÃO ASSÍNCRONA DOS DADOS (JOBS DE REFRESH) ===
+
+# Fonte pública -> chave da planilha no cache
+REFRESH_SOURCES = {
+    'clientes': f"{Config.CLASSIFICACAO_SHEET_ID}_{CLIENTES_TAB}",
+    'pedidos': f"{Config.CLASSIFICACAO_SHEET_ID}_{PEDIDOS_TAB}",
+    'satisfacao': SATISFACTION_TAB_KEY
+}
+REFRESH_JOBS_KEPT = 50
+
+_refresh_jobs: 'OrderedDict[str, Dict]' = OrderedDict()
+_refresh_jobs_lock = threading.Lock()
+# Um job monta dados por vez (os estados incrementais de score/RFM são do processo)
+_refresh_build_lock = threading.Lock()
+
+def start_refresh_job(sources: Optional[List[str]] = None) -> Dict:
+    """
+    Agenda o recarregamento das planilhas em 'sources' (padrão: todas) numa thread.
+    Se já houver job pendente cobrindo essas fontes, devolve o mesmo job.
+    Cada worker do gunicorn tem seu próprio cache: o job atualiza o processo que o recebeu.
+    """
+    sources = sorted(set(sources or REFRESH_SOURCES))
+    invalidas = [source for source in sources if source not in REFRESH_SOURCES]
+    if invalidas:
+        raise ValueError(f"Fonte(s) inválida(s): {', '.join(invalidas)}. Use: {', '.join(REFRESH_SOURCES)}")
+
+    with _refresh_jobs_lock:
+        for job in reversed(_refresh_jobs.values()):
+            if job['status'] in ('queued', 'running') and set(sources) <= set(job['sources']):
+                return dict(job)
+        job = {
+            'job_id': uuid.uuid4().hex[:12],
+            'sources': sources,
+            'status': 'queued',
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'started_at': None,
+            'finished_at': None,
+            'duration_seconds': None,
+            'versions': {},
+            'error': None
+        }
+        _refresh_jobs[job['job_id']] = job
+        while len(_refresh_jobs) > REFRESH_JOBS_KEPT:
+            _refresh_jobs.popitem(last=False)
+
+    threading.Thread(target=_run_refresh_job, args=(job,), name=f"refresh-{job['job_id']}", daemon=True).start()
+    return dict(job)
+
+def _run_refresh_job(job: Dict):
+    """
+    Recarrega as fontes e reconstrói todos os snapshots numa camada de staging do cache;
+    só publica (troca atômica) se todas as fontes pedidas carregarem. Até lá, as requisições
+    continuam usando os dados anteriores.
+    """
+    with _refresh_build_lock:
+        job['status'] = 'running'
+        job['started_at'] = datetime.now().isoformat(timespec='seconds')
+        inicio = time.perf_counter()
+        masked = [REFRESH_SOURCES[source] for source in job['sources']] + list(SNAPSHOT_CACHE_KEYS.values())
+        try:
+            with _cache.staging(masked) as stage:
+                warm_up_snapshots()
+                falharam = [source for source in job['sources'] if REFRESH_SOURCES[source] not in stage.cache]
+                if falharam:
+                    raise RuntimeError(f"Não foi possível carregar: {', '.join(falharam)}")
+                _cache.publish(stage)
+            dataset = build_dataset()
+            job['dataset_version'] = dataset['version'] if dataset else None
+            job['versions'] = {source: _cache.timestamp(REFRESH_SOURCES[source]).isoformat()
+                               for source in job['sources']}
+            job['status'] = 'done'
+        except Exception as e:
+            logger.exception("Job de atualização falhou", extra={'job_id': job['job_id'], 'sources': job['sources']})
+            job['status'] = 'error'
+            job['error'] = str(e)
+        job['duration_seconds'] = round(time.perf_counter() - inicio, 3)
+        job['finished_at'] = datetime.now().isoformat(timespec='seconds')
+        logger.info("Job de atualização finalizado", extra={
+            'job_id': job['job_id'], 'status': job['status'], 'segundos': job['duration_seconds']
+        })
+
+def get_refresh_job(job_id: str) -> Optional[Dict]:
+    with _refresh_jobs_lock:
+        job = _refresh_jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+def list_refresh_jobs() -> List[Dict]:
+    """Jobs mais recentes primeiro"""
+    with _refresh_jobs_lock:
+        return [dict(job) for job in reversed(_refresh_jobs.values())]
+
+def _snapshot_rows(snapshot: Dict) -> int:
+    """Linhas de um snapshot: DataFrame principal, scores por cliente (churn) ou ids (recompra)"""
+    for key in ('df', 'scores', 'ids'):
+        if snapshot.get(key) is not None:
+            return len(snapshot[key])
+    return 0
+
+def get_snapshot_status() -> Dict:
+    """Estado dos snapshots em memória (sem disparar carregamentos): versão, idade e linhas"""
+    agora = datetime.now()
+    snapshots = {}
+    for nome, cache_key in SNAPSHOT_CACHE_KEYS.items():
+        snapshot = _cache.get(cache_key)
+        if snapshot is None:
+            snapshots[nome] = {'loaded': False}
+            continue
+        version = snapshot.get('version')
+        carregado_em = version if isinstance(version, datetime) else _cache.timestamp(cache_key)
+        age = (agora - carregado_em).total_seconds() if carregado_em else None
+        linhas = _snapshot_rows(snapshot)
+        snapshots[nome] = {
+            'loaded': True,
+            'version': carregado_em.isoformat() if carregado_em else None,
+            'age_seconds': round(age, 1) if age is not None else None,
+            'stale': bool(age is not None and age > Config.CACHE_TIMEOUT),
+            'rows': int(linhas)
+        }
+
+    dataset = _dataset
+    return {
+        'ready': all(snapshots[nome]['loaded'] for nome in READY_REQUIRED_SNAPSHOTS),
+        'dataset_version': dataset['version'] if dataset else None,
+        'dataset_created_at': dataset['created_at'].isoformat() if dataset else None,
+        'snapshots': snapshots
+    }
+
+def _snapshot_gauges():
+    """Gauges de /api/metrics: linhas e idade de cada snapshot e entradas no cache"""
+    status = get_snapshot_status()['snapshots']
+    carregados = {nome: info for nome, info in status.items() if info['loaded']}
+    return [
+        ('papello_snapshot_rows', 'Linhas por snapshot em memória',
+         [({'snapshot': nome}, info['rows']) for nome, info in carregados.items()]),
+        ('papello_snapshot_age_seconds', 'Idade dos dados de cada snapshot',
+         [({'snapshot': nome}, info['age_seconds']) for nome, info in carregados.items() if info['age_seconds'] is not None]),
+        ('papello_cache_entries', 'Entradas no cache interno', [({}, len(_cache))]),
+        ('papello_cache_bytes', 'Bytes estimados ocupados pelo cache interno', [({}, _cache.used_bytes)])
+    ]
+
+metrics.register_gauges(_snapshot_gauges)
+
+def clear_cache(namespace: Optional[str] = None, key: Optional[str] = None) -> int:
+    """Limpa o cache interno: tudo, só um namespace (ex: 'cmp') ou só uma chave"""
+    removidas = _cache.clear(namespace=namespace, key=key)
+    logger.info("Cache limpo", extra={'namespace': namespace, 'key': key, 'entradas': removidas})
+    return removidas
+
+def get_cache_stats() -> Dict:
+    """Entradas, tamanhos, idades e hit rate por namespace do cache interno"""
+    return _cache.stats()
     
 
+def format_executive_kpis(kpis: Dict) -> Dict:
+    """KPIs da Visão Executiva no formato dos cards (valor formatado, bruto, subtítulo e cor)"""
+    return {
+        'total_clientes': {
+            'value': f"{kpis['total_clientes']:,}".replace(',', '.'),
+            'raw': kpis['total_clientes'],
+            'subtitle': 'Base de clientes total',
+            'color_class': 'info'
+        },
+        'taxa_retencao': {
+            'value': f"{kpis['taxa_retencao']:.1f}%",
+            'raw': kpis['taxa_retencao'],
+            'subtitle': f"{kpis['clientes_ativos']:,} clientes ativos".replace(',', '.'),
+            'color_class': 'success' if kpis['taxa_retencao'] >= 70 else 'warning' if kpis['taxa_retencao'] >= 50 else 'danger'
+        },
+        'taxa_criticos': {
+            'value': f"{kpis['taxa_criticos']:.1f}%",
+            'raw': kpis['taxa_criticos'],
+            'subtitle': f"{kpis['clientes_criticos']:,} precisam atenção".replace(',', '.'),
+            'color_class': 'danger' if kpis['taxa_criticos'] >= 20 else 'warning' if kpis['taxa_criticos'] >= 10 else 'success'
+        },
+        'receita_total': {
+            'value': f"R$ {kpis['receita_total']:,.0f}".replace(',', '.'),
+            'raw': kpis['receita_total'],
+            'subtitle': 'Receita acumulada',
+            'color_class': 'success'
+        }
+    }
+
 def format_number(value, prefix="", suffix=""):
     """Formata números para exibição"""
     if pd.isna(value) or value == 0:
@@ -762,31 +2602,204 @@ def categorize_nps_from_text(text_score):
     
     return "Indefinido"
 
+# === CENTRAL DE AÇÕES (LISTAGEM PAGINADA NO SERVIDOR) ===
+
+def priority_label(score: float) -> str:
+    """Faixa de prioridade usada na central de ações"""
+    if score >= CRITICAL_SCORE_THRESHOLD:
+        return 'alta'
+    if score >= Config.MEDIUM_SCORE_THRESHOLD:
+        return 'media'
+    return 'baixa'
+
+# Tabela de regras das sugestões automáticas (a primeira regra que casar define a ação)
+ACTION_SUGGESTION_RULES = [
+    {
+        'rule': 'reativacao_dormant_premium',
+        'status_churn': ['Dormant_Premium', 'Dormant_Gold'],
+        'action_type': 'Contato Direto',
+        'description': 'Ligação direta para reativar cliente {nivel} sem compras recentes',
+        'due_days': 1
+    },
+    {
+        'rule': 'segunda_compra_novo',
+        'risco_recencia': ['Novo_Alto'],
+        'action_type': 'Email Follow-up',
+        'description': 'Follow-up de segunda compra para cliente novo em risco alto',
+        'due_days': 2
+    },
+    {
+        'rule': 'relacionamento_em_risco',
+        'nivel_cliente': ['Premium', 'Gold'],
+        'risco_recencia': ['Alto', 'Médio'],
+        'action_type': 'Reunião',
+        'description': 'Reunião de relacionamento com cliente {nivel} em risco {risco}',
+        'due_days': 3
+    },
+    {
+        'rule': 'reativacao_dormant',
+        'status_churn': ['Dormant_Silver', 'Dormant_Bronze', 'Dormant_Novo'],
+        'action_type': 'Email Follow-up',
+        'description': 'Campanha de reativação para cliente {nivel} dormant',
+        'due_days': 5
+    },
+    {
+        'rule': 'retorno_inativo',
+        'status_churn': ['Inativo'],
+        'min_score': 100,
+        'action_type': 'Proposta Comercial',
+        'description': 'Proposta comercial de retorno para cliente inativo',
+        'due_days': 7
+    }
+]
+
+def build_action_suggestions(snapshot: Dict, exclude_ids: List[str]) -> List[Dict]:
+    """
+    Aplica a tabela de regras a todos os clientes de uma vez (máscaras vetorizadas),
+    remove clientes com ações recentes e devolve a fila ordenada por score.
+    """
+    df_clientes = snapshot['df']
+    total = len(df_clientes)
+    colunas = {
+        col: df_clientes[col].fillna('').astype(str) if col in df_clientes.columns else pd.Series('', index=df_clientes.index)
+        for col in ('status_churn', 'risco_recencia', 'nivel_cliente')
+    }
+    scores = df_clientes['priority_score'].to_numpy(dtype=float)
+
+    regra = np.full(total, -1)
+    for i, rule in enumerate(ACTION_SUGGESTION_RULES):
+        mask = regra == -1
+        for col, serie in colunas.items():
+            if col in rule:
+                mask &= serie.isin(rule[col]).to_numpy()
+        if 'min_score' in rule:
+            mask &= scores >= rule['min_score']
+        regra[mask] = i
+
+    elegiveis = regra >= 0
+    if exclude_ids:
+        elegiveis &= ~np.isin(snapshot['ids'], exclude_ids)
+    posicoes = np.flatnonzero(elegiveis)
+    posicoes = posicoes[np.argsort(-scores[posicoes], kind='stable')][:Config.SUGGESTIONS_MAX]
+
+    agora = datetime.now()
+    nomes = df_clientes['nome'].fillna('').astype(str).to_numpy() if 'nome' in df_clientes.columns else np.full(total, '')
+    emails = df_clientes['email'].fillna('').astype(str).to_numpy() if 'email' in df_clientes.columns else np.full(total, '')
+    niveis, riscos = colunas['nivel_cliente'].to_numpy(), colunas['risco_recencia'].to_numpy()
+
+    suggestions = []
+    for rank, pos in enumerate(posicoes, start=1):
+        rule = ACTION_SUGGESTION_RULES[regra[pos]]
+        suggestions.append({
+            'client_id': snapshot['ids'][pos],
+            'rule': rule['rule'],
+            'client_name': nomes[pos],
+            'client_email': emails[pos],
+            'client_level': niveis[pos],
+            'action_type': rule['action_type'],
+            'description': rule['description'].format(nivel=niveis[pos], risco=riscos[pos]),
+            'priority_score': float(scores[pos]),
+            'priority': priority_label(scores[pos]),
+            'rank': rank,
+            'timestamp': agora.isoformat(),
+            'due_date': (agora + timedelta(days=rule['due_days'])).isoformat(),
+            'source': 'sugestao_automatica'
+        })
+    return suggestions
+
+_synced_actions_version = None
+
+def sync_actions_with_clients_snapshot():
+    """
+    Uma vez por versão do snapshot de clientes: espelha os scores no armazenamento
+    de ações e sincroniza a fila de sugestões automáticas (ids estáveis por cliente + regra).
+    """
+    global _synced_actions_version
+    snapshot = get_clients_snapshot()
+    if snapshot is None or snapshot['ids'] is None:
+        return
+    version = str(snapshot['version'])
+    if version == _synced_actions_version:
+        return
+
+    df_clientes = snapshot['df']
+    colunas = [df_clientes[col].fillna('').astype(str).to_numpy() if col in df_clientes.columns
+               else np.full(len(df_clientes), None) for col in ('nivel_cliente', 'nome', 'email')]
+    rows = list(zip(snapshot['ids'], df_clientes['priority_score'].to_numpy(dtype=float).tolist(), *colunas))
+    alteracoes = actions_store.sync_client_scores(rows)
+    if alteracoes is not None:
+        logger.info("Scores sincronizados com o log de ações", extra=dict(alteracoes, clientes=len(rows)))
+
+    desde = datetime.now() - timedelta(days=Config.SUGGESTION_COOLDOWN_DAYS)
+    suggestions = build_action_suggestions(snapshot, actions_store.recent_action_client_ids(desde))
+    alteracoes = actions_store.sync_suggestions(suggestions)
+    if alteracoes is not None:
+        logger.info("Sugestões de ação sincronizadas", extra=dict(alteracoes, sugestoes=len(suggestions)))
+    _synced_actions_version = version
+
+def list_actions_page(filters: Dict, cursor: Optional[Tuple[float, int]] = None, limit: int = 20) -> Dict:
+    """Página da central de ações, filtrada e ordenada por score no armazenamento indexado"""
+    sync_actions_with_clients_snapshot()
+    page = actions_store.query_actions_page(filters, cursor, limit)
+    agora = datetime.now().isoformat()
+
+    actions = []
+    for action in page['actions']:
+        score = float(action.get('priority_score') or 0)
+        status = action.get('status') or 'pendente'
+        due_date = action.get('due_date')
+        actions.append({
+            'id': action['id'],
+            'clientId': action.get('client_id'),
+            'clientName': action.get('client_name') or 'N/A',
+            'clientEmail': action.get('client_email') or '',
+            'clientLevel': action.get('client_level') or 'N/A',
+            'actionType': action.get('action_type') or 'N/A',
+            'description': action.get('description') or '',
+            'priority': priority_label(score),
+            'priorityScore': score,
+            'assignedTo': action.get('assigned_to') or '',
+            'createdDate': action.get('timestamp'),
+            'dueDate': due_date,
+            'status': status,
+            'isOverdue': bool(due_date) and status in ('pendente', actions_store.SUGGESTED_STATUS) and str(due_date) < agora
+        })
+
+    next_cursor = page['next_cursor']
+    return {
+        'actions': actions,
+        'next_cursor': f"{next_cursor[0]}:{next_cursor[1]}" if next_cursor else None,
+        'stats': {
+            'total': page['total'],
+            'high_priority': page['high_priority'],
+            'executed_today': page['executed_today']
+        }
+    }
+
+def parse_actions_cursor(cursor: Optional[str]) -> Optional[Tuple[float, int]]:
+    """Decodifica o cursor 'score:id' da paginação. Levanta ValueError se inválido."""
+    if not cursor:
+        return None
+    score, action_id = cursor.rsplit(':', 1)
+    return float(score), int(action_id)
+
 def load_actions_log():
-    """Carrega log de ações (para compatibilidade com o Streamlit)"""
-    actions_file = "cs_actions_log.json"
-    if os.path.exists(actions_file):
-        try:
-            with open(actions_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Erro ao carregar actions log: {str(e)}")
-            return []
-    return []
+    """Carrega log de ações (armazenado em SQLite, ver actions_store)"""
+    try:
+        return actions_store.load_all_actions()
+    except Exception as e:
+        logger.error("Erro ao carregar actions log", extra={'error': str(e)})
+        return []
 
 def save_action_log(action_data):
-    """Salva ação no log"""
-    actions_file = "cs_actions_log.json"
-    actions = load_actions_log()
+    """Salva ação no log (inserção O(1), segura entre workers)"""
     action_data['timestamp'] = datetime.now().isoformat()
-    actions.append(action_data)
     
     try:
-        with open(actions_file, 'w', encoding='utf-8') as f:
-            json.dump(actions, f, ensure_ascii=False, indent=2)
-        print(f"✅ Ação salva: {action_data.get('action_type', 'N/A')}")
-    except Exception as e:
-        print(f"❌ Erro ao salvar ação: {str(e)}")
+        action_data['id'] = actions_store.append_action(action_data)
+        logger.info("Ação salva", extra={'action_type': action_data.get('action_type', 'N/A')})
+    except Exception:
+        logger.exception("Erro ao salvar ação")
 
 
 # === ADICIONAR esta função no data_utils.py para DEBUG ===
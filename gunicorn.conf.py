@@ -0,0 +1,50 @@
+"""
+Configuração do gunicorn - Dashboard Papello
+
+Uso:  gunicorn -c gunicorn.conf.py app:app
+
+- preload_app: o app (e os snapshots aquecidos) é carregado uma vez no master e
+  compartilhado com os workers via fork (copy-on-write)
+- workers/threads ajustáveis por GUNICORN_WORKERS / GUNICORN_THREADS
+- cada worker só aceita requisições depois de aquecer snapshots e o log de ações
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('GUNICORN_WORKERS', min(multiprocessing.cpu_count() * 2 + 1, 4)))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True').lower() == 'true'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))  # downloads frios das planilhas podem demorar
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
+errorlog = '-'
+
+def when_ready(server):
+    """Master: aquece os snapshots antes do fork, para os workers já nascerem com os dados"""
+    if not preload_app:
+        return
+    from data_utils import warm_up_snapshots, build_dataset
+    server.log.info("Aquecendo snapshots no master antes de iniciar os workers...")
+    warm_up_snapshots()
+    build_dataset()
+
+def post_fork(server, worker):
+    """Worker recém-criado: descarta conexão SQLite herdada do master e recria a thread de logging"""
+    import actions_store
+    import app_logging
+    actions_store.discard_connection()
+    app_logging.restart_after_fork()
+
+def post_worker_init(worker):
+    """Antes de aceitar tráfego: garante snapshots (hits se herdados do master) e sincroniza ações"""
+    from data_utils import warm_up_snapshots, sync_actions_with_clients_snapshot, get_dataset
+    worker.log.info(f"Worker {worker.pid}: aquecendo antes de aceitar requisições...")
+    warm_up_snapshots()
+    get_dataset()
+    try:
+        sync_actions_with_clients_snapshot()
+    except Exception as e:
+        worker.log.warning(f"Worker {worker.pid}: falha ao sincronizar ações: {e}")
@@ -0,0 +1,211 @@
+"""
+Atualizações ao vivo (Server-Sent Events) - Dashboard Papello
+
+/api/stream mantém a conexão aberta e envia um evento a cada versão nova do dataset:
+  - 'snapshot': todos os valores (ao conectar, ou quando o cliente perdeu versões intermediárias)
+  - 'update': só o que mudou desde a versão anterior, com o 'id' do evento sendo a versão
+
+Os valores são os da Visão Executiva que dependem apenas dos dados: KPIs já formatados para
+os cards, distribuições (nível, churn, risco), análise crítica e data do último pedido. Um KPI
+ou uma distribuição que mudou vai inteiro; o que não mudou não vai.
+
+O payload de cada versão (e o texto dos eventos) é calculado uma vez por processo, pela
+primeira conexão que precisar dele, e reaproveitado pelas demais. A publicação de um dataset
+novo acorda as conexões (data_utils.add_dataset_listener); sem notificação, cada conexão
+confere a versão a cada SSE_HEARTBEAT_SECONDS, quando também envia um keep-alive.
+"""
+import json
+import threading
+import time
+from typing import Dict, Iterator, Optional
+
+import metrics
+from app_logging import get_logger
+from config import Config
+from data_utils import (
+    add_dataset_listener,
+    format_executive_kpis,
+    get_dataset,
+    get_executive_summary_data,
+    pinned_dataset
+)
+
+logger = get_logger('live_updates')
+
+# Seções comparadas chave a chave (cada KPI/distribuição vai inteiro quando muda);
+# as demais vão inteiras quando qualquer valor muda
+KEYED_SECTIONS = ('kpis', 'distributions')
+
+_changed = threading.Condition()
+# Publicações vistas neste processo: a conexão compara com o valor que já conhecia e não
+# perde uma publicação ocorrida entre o cálculo do evento e o wait()
+_published = 0
+_payload_lock = threading.Lock()
+# Última versão calculada: payload, eventos prontos e a diferença para a versão anterior
+_latest: Dict = {'version': None, 'previous_version': None, 'payload': None,
+                 'snapshot_event': None, 'update_event': None}
+
+_connections = 0
+_connections_lock = threading.Lock()
+
+def _plain(value):
+    """Tipos NumPy (contagens, somas) para tipos nativos do JSON"""
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+def build_payload(dataset: Dict) -> Optional[Dict]:
+    """Valores da Visão Executiva para uma versão do dataset (None se não der para calcular)"""
+    with pinned_dataset(dataset):
+        data = get_executive_summary_data()
+    if 'error' in data:
+        logger.error("Erro ao montar payload do stream", extra={
+            'dataset_version': dataset['version'], 'error': data['error']
+        })
+        return None
+    payload = {
+        'kpis': format_executive_kpis(data['kpis']),
+        'distributions': data['distributions'],
+        'critical_analysis': data['critical_analysis'],
+        'latest_update': data['latest_update']
+    }
+    # Ida e volta pelo JSON: tipos nativos, comparáveis entre versões
+    return json.loads(json.dumps(payload, default=_plain))
+
+def diff_payload(anterior: Dict, atual: Dict) -> Dict:
+    """O que mudou de 'anterior' para 'atual'; chaves removidas de uma seção aparecem como None"""
+    changed = {}
+    for secao, valores in atual.items():
+        antigos = anterior.get(secao)
+        if secao in KEYED_SECTIONS and isinstance(valores, dict) and isinstance(antigos, dict):
+            alterados = {key: value for key, value in valores.items() if antigos.get(key) != value}
+            alterados.update({key: None for key in antigos if key not in valores})
+            if alterados:
+                changed[secao] = alterados
+        elif valores != antigos:
+            changed[secao] = valores
+    return changed
+
+def _event(event: str, version: int, data: Dict) -> str:
+    corpo = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return f"id: {version}\nevent: {event}\ndata: {corpo}\n\n"
+
+def latest_update() -> Dict:
+    """Estado da versão atual do dataset, calculando o payload se esta versão ainda não tiver um"""
+    global _latest
+    dataset = get_dataset()
+    if dataset is None or _latest['version'] == dataset['version']:
+        return _latest
+    with _payload_lock:
+        if _latest['version'] == dataset['version']:
+            return _latest
+        payload = build_payload(dataset)
+        if payload is None:
+            return _latest
+
+        anterior = _latest
+        version = dataset['version']
+        atual = {
+            'version': version,
+            'previous_version': anterior['version'],
+            'payload': payload,
+            'snapshot_event': _event('snapshot', version, {
+                'version': version,
+                'created_at': dataset['created_at'].isoformat(),
+                'values': payload
+            }),
+            'update_event': None
+        }
+        if anterior['payload'] is not None:
+            changed = diff_payload(anterior['payload'], payload)
+            atual['update_event'] = _event('update', version, {
+                'version': version,
+                'previous_version': anterior['version'],
+                'created_at': dataset['created_at'].isoformat(),
+                'changed': changed
+            })
+            logger.info("Atualização do stream calculada", extra={
+                'dataset_version': version, 'secoes_alteradas': sorted(changed)
+            })
+        # Troca por atribuição única: quem leu o estado anterior continua com ele inteiro
+        _latest = atual
+        return atual
+
+def _on_dataset_published(dataset: Dict):
+    global _published
+    with _changed:
+        _published += 1
+        _changed.notify_all()
+
+add_dataset_listener(_on_dataset_published)
+
+def _event_since(estado: Dict, last_version: Optional[int]) -> Optional[str]:
+    """Evento para quem já tem last_version: nada, a diferença (uma versão atrás) ou tudo"""
+    if estado['version'] is None or estado['version'] == last_version:
+        return None
+    if last_version is not None and estado['previous_version'] == last_version and estado['update_event']:
+        return estado['update_event']
+    return estado['snapshot_event']
+
+def open_stream(last_version: Optional[int]) -> Optional['EventStream']:
+    """Eventos de uma conexão, ou None se o limite de conexões do processo foi atingido"""
+    global _connections
+    with _connections_lock:
+        if _connections >= Config.SSE_MAX_CONNECTIONS:
+            return None
+        _connections += 1
+    return EventStream(last_version)
+
+class EventStream:
+    """
+    Iterador de uma conexão. A vaga é liberada em close(), que o servidor WSGI chama ao fim
+    da resposta ou quando o cliente desconecta, mesmo que a iteração nem tenha começado.
+    """
+
+    def __init__(self, last_version: Optional[int]):
+        self._events = _events(last_version)
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        return next(self._events)
+
+    def close(self):
+        global _connections
+        if self._closed:
+            return
+        self._closed = True
+        self._events.close()
+        with _connections_lock:
+            _connections -= 1
+
+def _events(last_version: Optional[int]) -> Iterator[str]:
+    fim = time.monotonic() + Config.SSE_MAX_SECONDS
+    yield f"retry: {Config.SSE_RETRY_MS}\n\n"
+    while True:
+        visto = _published
+        try:
+            estado = latest_update()
+            evento = _event_since(estado, last_version)
+        except Exception:
+            logger.exception("Erro ao calcular evento do stream")
+            evento = None
+        if evento is not None:
+            last_version = estado['version']
+            yield evento
+
+        restante = fim - time.monotonic()
+        if restante <= 0:
+            return
+        with _changed:
+            notificado = _changed.wait_for(lambda: _published != visto,
+                                           timeout=min(Config.SSE_HEARTBEAT_SECONDS, restante))
+        if not notificado:
+            yield ": keep-alive\n\n"
+
+def _stream_gauges():
+    return [('papello_sse_connections', 'Conexões abertas em /api/stream', [({}, _connections)])]
+
+metrics.register_gauges(_stream_gauges)
@@ -0,0 +1,198 @@
+"""
+Métricas de desempenho - Dashboard Papello
+
+Timers por etapa (download das planilhas, conversão de datas, score, recorrência,
+satisfação, serialização JSON), contadores de hit/miss do cache e gauges dos
+snapshots, expostos em /api/metrics no formato texto do Prometheus.
+
+Com METRICS_ENABLED=False, stage() devolve um context manager vazio e timed()
+chama a função direto: o custo fica em uma leitura de variável por chamada.
+Cada worker do gunicorn mantém suas próprias métricas (o label 'pid' identifica o processo).
+"""
+import os
+import threading
+import time
+from functools import wraps
+from typing import Callable, Dict, List, Tuple
+
+from app_logging import get_logger
+from config import Config
+
+logger = get_logger('metrics')
+
+# Limites dos buckets dos histogramas (segundos)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_enabled = Config.METRICS_ENABLED
+_lock = threading.Lock()
+
+def enabled() -> bool:
+    return _enabled
+
+def set_enabled(value: bool):
+    """Liga/desliga a coleta em tempo de execução"""
+    global _enabled
+    _enabled = bool(value)
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(pairs: List[Tuple[str, str]]) -> str:
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram:
+    """Histograma com um label (ex: stage, endpoint) e buckets cumulativos"""
+
+    def __init__(self, name: str, help_text: str, label: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series: Dict[str, List] = {}  # valor do label -> [contagens por bucket, soma, total]
+
+    def observe(self, label_value: str, seconds: float):
+        with _lock:
+            serie = self._series.get(label_value)
+            if serie is None:
+                serie = self._series[label_value] = [[0] * len(self.buckets), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if seconds <= limite:
+                    serie[0][i] += 1
+                    break
+            serie[1] += seconds
+            serie[2] += 1
+
+    def render(self) -> List[str]:
+        linhas = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            series = {k: ([*v[0]], v[1], v[2]) for k, v in self._series.items()}
+        for label_value, (contagens, soma, total) in sorted(series.items()):
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, contagens):
+                acumulado += contagem
+                labels = _labels([(self.label, label_value), ('pid', str(os.getpid())), ('le', _format_value(limite))])
+                linhas.append(f"{self.name}_bucket{labels} {acumulado}")
+            labels_inf = _labels([(self.label, label_value), ('pid', str(os.getpid())), ('le', '+Inf')])
+            linhas.append(f"{self.name}_bucket{labels_inf} {total}")
+            labels = _labels([(self.label, label_value), ('pid', str(os.getpid()))])
+            linhas.append(f"{self.name}_sum{labels} {soma!r}")
+            linhas.append(f"{self.name}_count{labels} {total}")
+        return linhas
+
+class Counter:
+    """Contador monotônico com labels fixos"""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with _lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        linhas = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with _lock:
+            valores = dict(self._values)
+        for label_values, valor in sorted(valores.items()):
+            labels = _labels(list(zip(self.labels, label_values)) + [('pid', str(os.getpid()))])
+            linhas.append(f"{self.name}{labels} {_format_value(valor)}")
+        return linhas
+
+STAGE_DURATION = Histogram(
+    'papello_stage_duration_seconds', 'Duração das etapas de processamento dos dados', 'stage'
+)
+HTTP_DURATION = Histogram(
+    'papello_http_request_duration_seconds', 'Duração das requisições por endpoint', 'endpoint'
+)
+CACHE_REQUESTS = Counter(
+    'papello_cache_requests_total', 'Consultas ao cache interno por namespace e resultado', ('namespace', 'result')
+)
+CACHE_REMOVALS = Counter(
+    'papello_cache_removals_total', 'Entradas removidas do cache por namespace e motivo (LRU ou TTL)', ('namespace', 'reason')
+)
+
+# Callbacks que devolvem gauges no momento da coleta: [(nome, ajuda, [(labels, valor), ...]), ...]
+_gauge_callbacks: List[Callable] = []
+
+def register_gauges(callback: Callable):
+    _gauge_callbacks.append(callback)
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    __slots__ = ('name', 'inicio')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_DURATION.observe(self.name, time.perf_counter() - self.inicio)
+        return False
+
+def stage(name: str):
+    """Context manager que mede uma etapa: with metrics.stage('sheet_fetch'): ..."""
+    return _Stage(name) if _enabled else _NULL_STAGE
+
+def timed(name: str):
+    """Decorator que mede cada chamada da função como a etapa 'name'"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            inicio = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                STAGE_DURATION.observe(name, time.perf_counter() - inicio)
+        return wrapper
+    return decorator
+
+def count_cache(namespace: str, hit: bool):
+    if _enabled:
+        CACHE_REQUESTS.inc(namespace, 'hit' if hit else 'miss')
+
+def count_cache_removal(namespace: str, reason: str):
+    if _enabled:
+        CACHE_REMOVALS.inc(namespace, reason)
+
+def observe_request(endpoint: str, seconds: float):
+    if _enabled:
+        HTTP_DURATION.observe(endpoint, seconds)
+
+def render_prometheus() -> str:
+    """Todas as métricas no formato de exposição texto do Prometheus (0.0.4)"""
+    linhas = []
+    for metric in (STAGE_DURATION, HTTP_DURATION, CACHE_REQUESTS, CACHE_REMOVALS):
+        linhas.extend(metric.render())
+    for callback in _gauge_callbacks:
+        try:
+            gauges = callback()
+        except Exception:
+            logger.exception("Erro ao coletar gauges")
+            continue
+        for name, help_text, amostras in gauges:
+            linhas.append(f"# HELP {name} {help_text}")
+            linhas.append(f"# TYPE {name} gauge")
+            for labels, valor in amostras:
+                linhas.append(f"{name}{_labels(list(labels.items()) + [('pid', str(os.getpid()))])} {_format_value(valor)}")
+    return '\n'.join(linhas) + '\n'
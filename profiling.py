@@ -0,0 +1,131 @@
+"""
+Profiling de requisições sob demanda - Dashboard Papello
+
+Dois modos, ambos desligados por padrão (PROFILING_ENABLED=False):
+  - explícito: '?_profile=1' roda a requisição sob cProfile e devolve as funções com
+    maior tempo acumulado no lugar da resposta. Se PROFILING_TOKEN estiver definido,
+    exige o cabeçalho 'X-Profile-Token' (acesso de administrador).
+  - amostrado: uma fração das requisições (PROFILING_SAMPLE_RATE) é perfilada; as que
+    passarem de PROFILING_SLOW_SECONDS são gravadas em PROFILING_DIR, que mantém só os
+    PROFILING_MAX_FILES perfis mais recentes.
+
+Há no máximo um profiler ativo por processo: com o gunicorn em gthread, requisições
+concorrentes não são perfiladas enquanto outra estiver em andamento. Os arquivos .prof
+abrem com pstats/snakeviz; o .json ao lado traz o resumo.
+"""
+import cProfile
+import hmac
+import json
+import os
+import pstats
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app_logging import get_logger
+from config import Config
+
+logger = get_logger('profiling')
+
+_active = threading.Lock()
+
+def enabled() -> bool:
+    return Config.PROFILING_ENABLED
+
+def authorized(token: Optional[str]) -> bool:
+    """Perfil explícito: liberado pelo flag e, se houver PROFILING_TOKEN, só com o token certo"""
+    if not Config.PROFILING_ENABLED:
+        return False
+    if not Config.PROFILING_TOKEN:
+        return True
+    return token is not None and hmac.compare_digest(token, Config.PROFILING_TOKEN)
+
+def should_sample() -> bool:
+    return Config.PROFILING_ENABLED and random.random() < Config.PROFILING_SAMPLE_RATE
+
+def start() -> Optional[cProfile.Profile]:
+    """Inicia um profiler, ou None se já houver outro ativo neste processo"""
+    if not _active.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except Exception:
+        _active.release()
+        raise
+    return profiler
+
+def stop(profiler: cProfile.Profile):
+    profiler.disable()
+    _active.release()
+
+def top_functions(profiler: cProfile.Profile, limit: Optional[int] = None) -> List[Dict]:
+    """Funções ordenadas por tempo acumulado (inclui o tempo das chamadas internas)"""
+    stats = pstats.Stats(profiler)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE)
+    funcoes = []
+    for func in stats.fcn_list[:limit or Config.PROFILING_TOP_N]:
+        arquivo, linha, nome = func
+        chamadas_primitivas, chamadas, tempo_proprio, tempo_acumulado, _ = stats.stats[func]
+        funcoes.append({
+            'function': nome,
+            'file': os.path.relpath(arquivo) if arquivo.startswith(os.getcwd()) else arquivo,
+            'line': linha,
+            'calls': chamadas,
+            'primitive_calls': chamadas_primitivas,
+            'self_s': round(tempo_proprio, 6),
+            'cumulative_s': round(tempo_acumulado, 6)
+        })
+    return funcoes
+
+def build_report(profiler: cProfile.Profile, method: str, path: str, seconds: float, status_code: int) -> Dict:
+    return {
+        'request': f"{method} {path}",
+        'status_code': status_code,
+        'duration_s': round(seconds, 6),
+        'pid': os.getpid(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'top_functions': top_functions(profiler)
+    }
+
+def save_profile(profiler: cProfile.Profile, report: Dict, endpoint: str) -> Optional[str]:
+    """Grava <data>_<endpoint>_<ms>ms.prof e o resumo .json; descarta os perfis mais antigos"""
+    try:
+        os.makedirs(Config.PROFILING_DIR, exist_ok=True)
+        nome = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{os.getpid()}_{endpoint}_{int(report['duration_s'] * 1000)}ms"
+        caminho = os.path.join(Config.PROFILING_DIR, nome)
+        profiler.dump_stats(f"{caminho}.prof")
+        with open(f"{caminho}.json", 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        _rotate()
+        return f"{caminho}.prof"
+    except OSError:
+        logger.exception("Erro ao gravar perfil", extra={'endpoint': endpoint})
+        return None
+
+def _rotate():
+    perfis = sorted(
+        (entrada for entrada in os.scandir(Config.PROFILING_DIR) if entrada.name.endswith('.prof')),
+        key=lambda entrada: entrada.stat().st_mtime
+    )
+    for entrada in perfis[:max(0, len(perfis) - Config.PROFILING_MAX_FILES)]:
+        for caminho in (entrada.path, entrada.path[:-len('.prof')] + '.json'):
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+
+class RequestProfile:
+    """Estado do profiling de uma requisição (guardado em flask.g)"""
+    __slots__ = ('profiler', 'explicit', 'inicio')
+
+    def __init__(self, profiler: cProfile.Profile, explicit: bool):
+        self.profiler = profiler
+        self.explicit = explicit
+        self.inicio = time.perf_counter()
+
+    def finish(self) -> float:
+        stop(self.profiler)
+        return time.perf_counter() - self.inicio
@@ -115,8 +115,10 @@ def run_flask_app():
     """Executa o aplicativo Flask"""
     try:
         from app import app
-        print("🚀 Iniciando servidor Flask...")
-        app.run(debug=True, host='0.0.0.0', port=5000)
+        from config import Config
+        print("🚀 Iniciando servidor Flask (desenvolvimento)...")
+        print("   Em produção use: gunicorn -c gunicorn.conf.py app:app")
+        app.run(debug=Config.DEBUG, host='0.0.0.0', port=5000)
     except KeyboardInterrupt:
         print("\n👋 Dashboard finalizado pelo usuário")
     except Exception as e:
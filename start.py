@@ -14,10 +14,12 @@ def main():
     
     try:
         from app import app
+        from config import Config
         print("App carregado com sucesso")
         print("Acessivel em: http://localhost:5000")
         print("Para parar: Ctrl+C")
-        app.run(debug=True, host='0.0.0.0', port=5000)
+        print("Servidor de desenvolvimento; em producao use: gunicorn -c gunicorn.conf.py app:app")
+        app.run(debug=Config.DEBUG, host='0.0.0.0', port=5000)
     except Exception as e:
         print(f"Erro ao iniciar: {e}")
         sys.exit(1)
@@ -118,15 +118,29 @@ async function loadExecutiveDashboard() {
     try {
         showLoading();
 
-        const response = await fetch('/api/executive-data');
+        // Visão executiva e recorrência numa única requisição, sobre a mesma versão dos dados
+        const recurrenceDates = getRecurrenceDates();
+        const response = await fetch('/api/batch', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({
+                widgets: [
+                    {id: 'executive', widget: 'executive-data'},
+                    {id: 'recurrence', widget: 'recurrence-analysis', params: recurrenceDates}
+                ]
+            })
+        });
         if (!response.ok) {
             throw new Error(`Erro na rede: ${response.statusText}`);
         }
-        const data = await response.json();
+        const batch = await response.json();
+        const [executive, recurrence] = batch.results || [];
+        const data = executive ? executive.data : {};
 
-        if (data.status !== 'success') {
-            throw new Error(data.error || 'A API retornou um erro.');
+        if (!executive || executive.status_code !== 200 || data.status !== 'success') {
+            throw new Error(data.error || batch.error || 'A API retornou um erro.');
         }
+        data.dataset_version = batch.dataset_version;
 
         // --- CORREÇÃO ADICIONADA AQUI ---
         // Armazena os dados em uma variável global para que outras funções possam usá-los.
@@ -158,8 +172,11 @@ async function loadExecutiveDashboard() {
             showAlert('Dados carregados, mas houve um erro ao exibir os gráficos.', 'warning');
         }
 
-        // Atualizar análise de recorrência
-        await updateRecurrenceAnalysis();
+        // Atualizar análise de recorrência (já calculada no lote; se falhou, busca de novo)
+        await updateRecurrenceAnalysis(recurrence && recurrence.status_code === 200 ? recurrence.data : null);
+        
+        // Receber as próximas versões dos dados sem recarregar a página
+        subscribeExecutiveUpdates(data.dataset_version);
         
         console.log("✅ Dados da Visão Executiva carregados com sucesso.");
 
@@ -171,6 +188,85 @@ async function loadExecutiveDashboard() {
     }
 }
 
+// === ATUALIZAÇÕES AO VIVO (SSE) ===
+
+let executiveStream = null;
+
+function subscribeExecutiveUpdates(datasetVersion) {
+    if (executiveStream || typeof EventSource === 'undefined') {
+        return;
+    }
+    
+    const url = datasetVersion ? `/api/stream?last_version=${datasetVersion}` : '/api/stream';
+    executiveStream = new EventSource(url);
+    
+    // Versão completa (primeira conexão ou versões perdidas)
+    executiveStream.addEventListener('snapshot', (event) => {
+        const message = JSON.parse(event.data);
+        applyExecutiveChanges(message.values, message.version);
+    });
+    
+    // Apenas o que mudou desde a versão anterior
+    executiveStream.addEventListener('update', (event) => {
+        const message = JSON.parse(event.data);
+        applyExecutiveChanges(message.changed, message.version);
+    });
+    
+    executiveStream.onerror = () => {
+        // O navegador reconecta sozinho; se o servidor recusou (limite de conexões), desiste
+        if (executiveStream.readyState === EventSource.CLOSED) {
+            console.warn('⚠️ Atualizações ao vivo indisponíveis');
+            executiveStream = null;
+        }
+    };
+}
+
+function applyExecutiveChanges(changed, version) {
+    const data = window.currentDashboardData;
+    if (!data || !changed) {
+        return;
+    }
+    console.log(`🔄 Dados atualizados (versão ${version}):`, changed);
+    
+    // KPIs e distribuições chegam por chave (null = removida); as demais seções inteiras
+    ['kpis', 'distributions'].forEach(section => {
+        if (!changed[section]) {
+            return;
+        }
+        data[section] = data[section] || {};
+        Object.entries(changed[section]).forEach(([key, value]) => {
+            if (value === null) {
+                delete data[section][key];
+            } else {
+                data[section][key] = value;
+            }
+        });
+    });
+    if (changed.critical_analysis) {
+        data.critical_analysis = changed.critical_analysis;
+    }
+    if (changed.latest_update) {
+        data.latest_update = changed.latest_update;
+    }
+    data.dataset_version = version;
+    
+    if (changed.kpis) {
+        updateKPIs(data.kpis);
+    }
+    if (changed.distributions) {
+        updateStatusCards(data.distributions);
+        if (typeof updateDistributionCharts === 'function') {
+            updateDistributionCharts(data.distributions);
+        }
+    }
+    if (changed.critical_analysis) {
+        updateCriticalAnalysis(data.critical_analysis);
+    }
+    updateMetricsAttention(data);
+    updateExecutiveSummary(data);
+    updateLastUpdateTime();
+}
+
 function updateKPIs(kpis) {
     console.log('🔄 Atualizando KPIs principais...');
     
@@ -429,21 +525,29 @@ function updateExecutiveSummary(data) {
 
 // === FUNÇÕES DE RECORRÊNCIA ===
 
-async function updateRecurrenceAnalysis() {
+function getRecurrenceDates() {
+    // Obter datas dos filtros ou usar padrão
+    return {
+        start: $('#recurrence-start').val() || '2025-03-08',
+        end: $('#recurrence-end').val() || '2025-09-04'
+    };
+}
+
+async function updateRecurrenceAnalysis(prefetched) {
     console.log('🔄 Atualizando análise de recorrência...');
     
     try {
-        // Obter datas dos filtros ou usar padrão
-        let startDate = $('#recurrence-start').val() || '2025-03-08';
-        let endDate = $('#recurrence-end').val() || '2025-09-04';
-        
-        const response = await fetch(`/api/recurrence-analysis?start=${startDate}&end=${endDate}`);
-        
-        if (!response.ok) {
-            throw new Error(`Erro na API de recorrência: ${response.statusText}`);
+        let data = prefetched;
+        if (!data) {
+            const {start, end} = getRecurrenceDates();
+            const response = await fetch(`/api/recurrence-analysis?start=${start}&end=${end}`);
+            
+            if (!response.ok) {
+                throw new Error(`Erro na API de recorrência: ${response.statusText}`);
+            }
+            
+            data = await response.json();
         }
-        
-        const data = await response.json();
         console.log('📊 Dados de recorrência recebidos:', data);
         
         // Verificar se dados chegaram
@@ -703,17 +807,21 @@ let filteredClients = [];
 let currentPage = 1;
 let itemsPerPage = 10;
 
+async function fetchClients(sort = 'priority') {
+    const params = sort === 'churn_risk' ? '?sort=churn_risk' : '';
+    const response = await fetch(`/api/clients-data${params}`);
+    if (!response.ok) throw new Error(`Erro na API de clientes: ${response.statusText}`);
+    
+    const data = await response.json();
+    if (data.status !== 'success') throw new Error(data.error || 'A API de clientes retornou um erro.');
+    return data.clients;
+}
+
 async function loadClientsPage() {
     console.log('🔄 Carregando página de Gestão de Clientes...');
     showLoading();
     try {
-        const response = await fetch('/api/clients-data');
-        if (!response.ok) throw new Error(`Erro na API de clientes: ${response.statusText}`);
-        
-        const data = await response.json();
-        if (data.status !== 'success') throw new Error(data.error || 'A API de clientes retornou um erro.');
-
-        allClients = data.clients;
+        allClients = await fetchClients($('#sort-clients').val());
         filteredClients = allClients;
         
         populateFilters();
@@ -742,6 +850,20 @@ function setupClientEventListeners() {
     $('#search-client, #filter-receita-min, #filter-receita-max').on('keyup', debounce(applyFilters, 400));
     $('#filter-nivel, #filter-risco, #filter-status, #items-per-page').on('change', applyFilters);
     $('#export-clients-btn').on('click', exportClientsToCSV);
+    $('#sort-clients').on('change', reloadSortedClients);
+}
+
+// Recarrega a lista na ordem escolhida (prioridade ou risco de churn) mantendo os filtros
+async function reloadSortedClients() {
+    showLoading();
+    try {
+        allClients = await fetchClients($('#sort-clients').val());
+        applyFilters();
+    } catch (error) {
+        console.error("❌ Falha ao ordenar clientes:", error);
+    } finally {
+        hideLoading();
+    }
 }
 
 function populateFilters() {
@@ -829,6 +951,10 @@ function createClientCard(client) {
         const num = parseFloat(String(value).replace(',', '.'));
         return !isNaN(num) ? `${num.toFixed(1)} dias` : 'N/A';
     };
+    const formatChurn = (value) => {
+        const num = parseFloat(value);
+        return !isNaN(num) ? `${(num * 100).toFixed(0)}%` : 'N/A';
+    };
     const formatLocation = (cidade, estado) => {
         const c = format(cidade);
         const e = format(estado);
@@ -866,6 +992,8 @@ function createClientCard(client) {
                 <div class="client-info-item"><i class="fas fa-history"></i> <strong>Intervalo Médio:</strong> ${formatDays(client.ipt_cliente)}</div>
                 <div class="client-info-item"><i class="fas fa-dollar-sign"></i> <strong>Receita:</strong> ${formatCurrency(client.receita)}</div>
                 <div class="client-info-item"><i class="fas fa-calendar-check"></i> <strong>Últ. Compra:</strong> ${format(client.recency_days, '', ' dias')}</div>
+                <div class="client-info-item"><i class="fas fa-chart-line"></i> <strong>Risco de Churn:</strong> ${formatChurn(client.churn_risk)}</div>
+                <div class="client-info-item"><i class="fas fa-comment-dots"></i> <strong>NPS:</strong> ${format(client.nps_categoria)}</div>
             </div>
         </div>
     </div>`;
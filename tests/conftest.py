@@ -0,0 +1,35 @@
+"""
+Configuração dos testes - Dashboard Papello
+
+Config lê o ambiente na importação: antes de qualquer import do app, os dados apontam para
+CSVs sintéticos (benchmarks/synthetic_data.py) e o log de ações para um SQLite temporário.
+"""
+import os
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, 'benchmarks'))
+
+_TMP = tempfile.mkdtemp(prefix='papello-tests-')
+DATA_DIR = os.path.join(_TMP, 'data')
+os.environ['DATA_DIR'] = DATA_DIR
+os.environ['ACTIONS_DB_PATH'] = os.path.join(_TMP, 'cs_actions.db')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from synthetic_data import generate_dataset  # noqa: E402
+
+generate_dataset(2000, DATA_DIR, seed=7)
+
+import pytest  # noqa: E402
+
+@pytest.fixture
+def fresh_data():
+    """Cache e dataset descartados: o teste começa lendo os CSVs do zero"""
+    import data_utils
+    data_utils.clear_cache()
+    data_utils.reset_dataset()
+    yield data_utils
+    data_utils.clear_cache()
+    data_utils.reset_dataset()
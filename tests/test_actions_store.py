@@ -0,0 +1,110 @@
+import pytest
+
+import actions_store
+from config import Config
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    """Banco novo por teste (a conexão por thread é refeita quando o caminho muda)"""
+    monkeypatch.setattr(Config, 'ACTIONS_DB_PATH', str(tmp_path / 'actions.db'))
+    actions_store._stats_cache.clear()
+    yield actions_store
+    actions_store.discard_connection()
+
+def _action(client_id, score, status='pendente', **extra):
+    return dict({'client_id': client_id, 'priority_score': score, 'status': status, 'action_type': 'ligacao'}, **extra)
+
+def _all_pages(filters, limit):
+    itens, cursor = [], None
+    while True:
+        page = actions_store.query_actions_page(filters, cursor, limit)
+        itens.extend((a['priority_score'], a['id']) for a in page['actions'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return itens, page
+
+# --- Paginação por cursor sobre o score efetivo (user-033) ---
+
+@pytest.mark.parametrize('status', ['aberta', 'all', 'executada'])
+def test_keyset_pages_cover_every_row_once_in_order(status):
+    statuses = ['pendente', 'sugerida', 'executada']
+    for i in range(120):
+        actions_store.append_action(_action(str(i % 15), [50, 150, 250][i % 3], statuses[i % 4 % 3]))
+
+    itens, page = _all_pages({'status': status}, 7)
+
+    assert itens == sorted(itens, key=lambda item: (-item[0], -item[1]))
+    assert len(set(itens)) == len(itens) == page['total']
+
+def test_effective_score_follows_client_snapshot_and_falls_back_when_client_leaves():
+    action_id = actions_store.append_action(_action('7', 50))
+    actions_store.sync_client_scores([('7', 300.0, 'Gold', 'Cliente 7', 'c7@x')])
+
+    page = actions_store.query_actions_page({'status': 'all'})
+    assert page['actions'][0]['id'] == action_id
+    assert page['actions'][0]['priority_score'] == 300.0
+    assert page['high_priority'] == 1
+
+    actions_store.sync_client_scores([])
+    page = actions_store.query_actions_page({'status': 'all'})
+    assert page['actions'][0]['priority_score'] == 50.0
+    assert page['high_priority'] == 0
+
+def test_new_action_takes_current_client_score():
+    actions_store.sync_client_scores([('9', 220.0, 'Premium', 'Cliente 9', 'c9@x')])
+    action_id = actions_store.append_action(_action('9', 10))
+    page = actions_store.query_actions_page({'status': 'aberta', 'priority': 'alta'})
+    assert [a['id'] for a in page['actions']] == [action_id]
+
+def test_unchanged_client_scores_are_not_rewritten():
+    rows = [('1', 120.0, 'Silver', 'A', 'a@x'), ('2', 90.0, 'Bronze', 'B', 'b@x')]
+    assert actions_store.sync_client_scores(rows) is not None
+    versao = actions_store.get_store_version()
+    assert actions_store.sync_client_scores(rows) is None
+    assert actions_store.get_store_version() == versao
+
+    alteracoes = actions_store.sync_client_scores([rows[0], ('2', 95.0, 'Bronze', 'B', 'b@x')])
+    assert alteracoes == {'clientes_alterados': 1, 'scores_alterados': 1, 'removidos': 0}
+
+def test_stats_follow_writes():
+    actions_store.append_action(_action('1', 250))
+    assert actions_store.query_actions_page({'status': 'aberta'})['total'] == 1
+    actions_store.append_action(_action('2', 250))
+    assert actions_store.query_actions_page({'status': 'aberta'})['total'] == 2
+
+def test_page_query_reads_the_status_score_index():
+    actions_store.append_action(_action('1', 100))
+    conn = actions_store.get_connection()
+    plano = ' '.join(row[3] for row in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT a.id FROM actions a LEFT JOIN client_scores c ON c.client_id = a.client_id "
+        "WHERE a.status = ? AND (a.priority_score, a.id) < (?, ?) ORDER BY a.priority_score DESC, a.id DESC LIMIT 21",
+        ('pendente', 100.0, 10)
+    ))
+    assert 'idx_actions_status_score' in plano
+    assert 'TEMP B-TREE' not in plano
+
+# --- Sugestões com ids estáveis (user-034) ---
+
+def _suggestion(client_id, rule, score, timestamp):
+    return {'client_id': client_id, 'rule': rule, 'priority_score': score, 'status': actions_store.SUGGESTED_STATUS,
+            'timestamp': timestamp, 'due_date': timestamp, 'description': f'{rule} {client_id}'}
+
+def _suggestion_ids():
+    return {(a['client_id'], a['rule']): a['id'] for a in actions_store.load_all_actions()
+            if a.get('status') == actions_store.SUGGESTED_STATUS}
+
+def test_suggestions_keep_ids_across_refreshes():
+    primeira = [_suggestion('1', 'r1', 300, 't1'), _suggestion('2', 'r1', 250, 't1'), _suggestion('3', 'r2', 200, 't1')]
+    actions_store.sync_suggestions(primeira)
+    ids = _suggestion_ids()
+
+    # Só campos voláteis mudaram: nada é escrito
+    assert actions_store.sync_suggestions([dict(s, timestamp='t2', due_date='t2') for s in primeira]) is None
+
+    segunda = [_suggestion('1', 'r1', 310, 't3'), _suggestion('3', 'r2', 200, 't3'), _suggestion('4', 'r1', 100, 't3')]
+    assert actions_store.sync_suggestions(segunda) == {'inseridas': 1, 'atualizadas': 1, 'removidas': 1}
+
+    novos = _suggestion_ids()
+    assert novos[('1', 'r1')] == ids[('1', 'r1')]
+    assert novos[('3', 'r2')] == ids[('3', 'r2')]
+    assert ('2', 'r1') not in novos
@@ -0,0 +1,77 @@
+import threading
+import time
+
+from cache_store import BoundedCache
+
+def _cache(max_bytes=10_000, ttls=None):
+    return BoundedCache(max_bytes, ttls or {}, lambda key: key.split('_')[0])
+
+def test_lru_evicts_least_recently_used_over_budget():
+    cache = _cache(max_bytes=500)  # cabem três entradas de ~150 bytes
+    for nome in ('a_1', 'a_2', 'a_3'):
+        cache.set(nome, 'x' * 100)
+    cache.get('a_1')
+    cache.set('a_4', 'x' * 100)
+
+    assert 'a_2' not in cache
+    assert {'a_1', 'a_3', 'a_4'} <= set(cache._entries)
+    assert cache.used_bytes <= 500
+
+def test_entry_larger_than_budget_is_kept_alone():
+    cache = _cache(max_bytes=200)
+    cache.set('a_1', 'x' * 50)
+    cache.set('a_grande', 'x' * 1000)
+    assert list(cache._entries) == ['a_grande']
+
+def test_namespace_ttl_expires_on_lookup_and_on_set():
+    cache = _cache(ttls={'t': 0.05})
+    cache.set('t_1', 1)
+    cache.set('p_1', 2)
+    assert cache.lookup('t_1') == (True, 1)
+
+    time.sleep(0.06)
+    cache.set('p_2', 3)
+    assert 't_1' not in cache
+    assert 'p_1' in cache
+    assert cache.stats()['namespaces']['t']['expirations'] == 1
+
+def test_replaced_entry_is_not_expired_by_old_heap_item():
+    cache = _cache(ttls={'t': 0.05})
+    cache.set('t_1', 'antigo')
+    time.sleep(0.03)
+    cache.set('t_1', 'novo')
+    time.sleep(0.03)
+    cache.set('p_1', 0)
+    assert cache.lookup('t_1') == (True, 'novo')
+
+def test_expiry_heap_stays_bounded():
+    cache = _cache(ttls={'t': 60})
+    for i in range(1000):
+        cache.set(f't_{i % 3}', i)
+    assert len(cache._expiry) <= 2 * len(cache) + 64
+
+def test_staging_is_invisible_to_other_threads_until_publish():
+    cache = _cache()
+    cache.set('s_dados', 'v1')
+    vistos = []
+
+    def ler():
+        vistos.append(cache.get('s_dados'))
+
+    with cache.staging(['s_dados']) as stage:
+        assert cache.get('s_dados') is None  # mascarada nesta thread
+        cache.set('s_dados', 'v2')
+        leitor = threading.Thread(target=ler)
+        leitor.start()
+        leitor.join()
+        assert vistos == ['v1']
+        cache.publish(stage)
+
+    assert cache.get('s_dados') == 'v2'
+
+def test_staging_without_publish_keeps_previous_values():
+    cache = _cache()
+    cache.set('s_dados', 'v1')
+    with cache.staging(['s_dados']):
+        cache.set('s_dados', 'v2')
+    assert cache.get('s_dados') == 'v1'
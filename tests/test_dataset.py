@@ -0,0 +1,102 @@
+import os
+import time
+
+import pytest
+
+from conftest import DATA_DIR
+from synthetic_data import PEDIDOS_CSV
+
+def _wait_job(data_utils, job, timeout=30):
+    fim = time.monotonic() + timeout
+    while time.monotonic() < fim:
+        atual = data_utils.get_refresh_job(job['job_id'])
+        if atual['status'] in ('done', 'error'):
+            return atual
+        time.sleep(0.05)
+    pytest.fail(f"job {job['job_id']} não terminou")
+
+@pytest.fixture
+def esconder_pedidos():
+    """Chamada no meio do teste: a planilha de pedidos deixa de existir até o fim dele"""
+    caminho = os.path.join(DATA_DIR, PEDIDOS_CSV)
+    escondido = caminho + '.off'
+    yield lambda: os.rename(caminho, escondido)
+    if os.path.exists(escondido):
+        os.rename(escondido, caminho)
+
+# --- Troca atômica do dataset (user-047) ---
+
+def test_successful_refresh_publishes_new_version(fresh_data):
+    versao = fresh_data.get_dataset()['version']
+    job = _wait_job(fresh_data, fresh_data.start_refresh_job(['pedidos']))
+    assert job['status'] == 'done'
+    dataset = fresh_data.get_dataset()
+    assert dataset['version'] == job['dataset_version'] > versao
+    assert dataset['orders'] is not None
+
+def test_failed_refresh_keeps_published_dataset(fresh_data, esconder_pedidos):
+    anterior = fresh_data.get_dataset()
+    assert anterior['orders'] is not None
+    esconder_pedidos()
+    job = _wait_job(fresh_data, fresh_data.start_refresh_job(['pedidos']))
+
+    assert job['status'] == 'error'
+    atual = fresh_data.get_dataset()
+    assert atual['version'] == anterior['version']
+    assert atual['orders'] is anterior['orders']
+
+def test_build_dataset_keeps_current_when_a_snapshot_goes_missing(fresh_data, esconder_pedidos):
+    anterior = fresh_data.get_dataset()
+    esconder_pedidos()
+    fresh_data.clear_cache()
+    assert fresh_data.build_dataset() is anterior
+
+def test_request_keeps_pinned_dataset_across_publish(fresh_data):
+    fresh_data.begin_dataset_scope()
+    try:
+        fixado = fresh_data.current_dataset()
+        _wait_job(fresh_data, fresh_data.start_refresh_job(['clientes']))
+        assert fresh_data.get_dataset()['version'] > fixado['version']
+        assert fresh_data.current_dataset() is fixado
+        assert fresh_data.get_clients_snapshot() is fixado['clients']
+    finally:
+        fresh_data.end_dataset_scope()
+
+# --- Campos derivados calculados antes da publicação (user-048) ---
+
+def test_published_dataset_carries_derived_fields_without_touching_cached_snapshots(fresh_data):
+    dataset = fresh_data.get_dataset()
+    clients = dataset['clients']
+    assert 'nps_categoria' in clients['df'].columns
+    assert 'detratores' in clients['segments']
+    assert len(clients['churn_risk']) == len(clients['df'])
+    assert dataset['orders']['client_segments']['key'] == (dataset['orders']['version'], clients['version'])
+
+    base = fresh_data._cache.get('clients_snapshot')
+    assert 'nps_categoria' not in base['df'].columns
+    assert 'detratores' not in base['segments']
+    assert 'churn_risk' not in base
+    assert 'client_segments' not in fresh_data._cache.get('orders_snapshot')
+
+def test_reads_inside_a_request_do_not_mutate_the_dataset(fresh_data):
+    dataset = fresh_data.get_dataset()
+    colunas = list(dataset['clients']['df'].columns)
+    chaves = set(dataset['clients'])
+    with fresh_data.pinned_dataset(dataset):
+        fresh_data.client_churn_risk(dataset['clients'])
+        fresh_data.get_order_segments()
+        fresh_data.compute_critical_analysis(nps='detratores')
+        fresh_data.get_executive_summary_data()
+    assert list(dataset['clients']['df'].columns) == colunas
+    assert set(dataset['clients']) == chaves
+
+def test_critical_analysis_works_outside_a_request(fresh_data):
+    resultado = fresh_data.compute_critical_analysis()
+    assert resultado['total_base'] > 0
+    assert fresh_data.compute_critical_analysis('Premium', 'detratores')['em_risco'] == 0
+    with pytest.raises(ValueError):
+        fresh_data.compute_critical_analysis(nps='desconhecido')
+
+def test_warm_up_does_not_publish_a_dataset(fresh_data):
+    fresh_data.warm_up_snapshots()
+    assert fresh_data._dataset is None
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+import data_utils
+from config import Config
+
+@pytest.fixture
+def df_clientes():
+    df = data_utils.load_google_sheet_public(Config.CLASSIFICACAO_SHEET_ID, data_utils.CLIENTES_TAB)
+    return df.reset_index(drop=True)
+
+def _assert_priority_order(resultado):
+    scores = resultado['scores'][resultado['order']]
+    assert np.all(np.diff(scores) <= 0)
+    assert sorted(resultado['order'].tolist()) == list(range(len(resultado['scores'])))
+
+def test_full_scoring_matches_compute_priority_scores(df_clientes):
+    resultado = data_utils.rescore_clients_incremental(df_clientes, None)
+    np.testing.assert_allclose(resultado['scores'], data_utils.compute_priority_scores(df_clientes))
+    assert resultado['stats']['rescored'] == len(df_clientes)
+    _assert_priority_order(resultado)
+
+def test_incremental_rescoring_only_touches_changed_rows(df_clientes):
+    anterior = data_utils.rescore_clients_incremental(df_clientes, None)
+
+    alterado = df_clientes.copy()
+    alvo = int(np.flatnonzero(alterado['status_churn'] != 'Dormant_Premium')[0])
+    alterado.loc[alvo, 'status_churn'] = 'Dormant_Premium'
+    alterado.loc[alvo, 'nivel_cliente'] = 'Premium'
+    # Linha nova e linha removida em relação ao snapshot anterior
+    alterado = alterado.drop(index=len(alterado) - 1)
+    alterado.loc[len(alterado) + 1] = dict(df_clientes.iloc[0], cliente_unico_id='novo-1')
+    alterado = alterado.reset_index(drop=True)
+
+    resultado = data_utils.rescore_clients_incremental(alterado, anterior)
+
+    assert resultado['stats']['rescored'] == 2
+    np.testing.assert_allclose(resultado['scores'], data_utils.compute_priority_scores(alterado))
+    _assert_priority_order(resultado)
+
+def test_rescoring_unchanged_snapshot_reuses_everything(df_clientes):
+    anterior = data_utils.rescore_clients_incremental(df_clientes, None)
+    resultado = data_utils.rescore_clients_incremental(df_clientes, anterior)
+    assert resultado['stats']['rescored'] == 0
+    np.testing.assert_array_equal(resultado['order'], anterior['order'])